@@ -0,0 +1,123 @@
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from power_models import integrate_energy
+
+MIN_INTERVAL = 0.2  # Seconds between samples while power or CPU activity changes fast
+MAX_INTERVAL = 2.0  # Seconds between samples in steady state
+POWER_SLOPE = 2.0  # dP/dt in W/s from which the sampling rate is raised
+POWER_DEADBAND = 5.0  # Power changes below this (W) are sensor noise; one PMD current step is 1.2 W on a 12 V rail
+CPU_SLOPE = 10.0  # Change of the CPU share in points per second from which the sampling rate is raised
+CPU_DEADBAND = 5.0  # CPU share changes below this (points) are scheduling noise
+HOLD_TIME = 5.0  # Seconds the fastest rate is kept after the last change, so a whole bursty phase is covered
+SLOWDOWN = 1.25  # Factor by which the interval grows after every steady sample past the hold time
+
+
+class AdaptiveScheduler:
+    """Picks the interval to the next sample from the activity of the last two samples.
+
+    The interval drops to ``min_interval`` as soon as the measured power or the CPU share of the
+    monitored processes changes fast, stays there while changes keep coming within ``hold_time``,
+    and grows back slowly to ``max_interval`` in steady state. Samples are then unevenly spaced,
+    so energy must be integrated over their actual timestamps (see integrate_energy and RollupWriter).
+    """
+
+    def __init__(self, min_interval: float = MIN_INTERVAL, max_interval: float = MAX_INTERVAL,
+                 power_slope: float = POWER_SLOPE, cpu_slope: float = CPU_SLOPE,
+                 power_deadband: float = POWER_DEADBAND, cpu_deadband: float = CPU_DEADBAND,
+                 hold_time: float = HOLD_TIME):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.power_slope = power_slope
+        self.cpu_slope = cpu_slope
+        self.power_deadband = power_deadband
+        self.cpu_deadband = cpu_deadband
+        self.hold_time = hold_time
+        self.interval = max_interval
+        self.samples = 0
+        self.active_samples = 0
+        self._last = None
+        self._last_active = -float('inf')
+
+    def is_active(self, dt: float, power_change: float, cpu_change: float) -> bool:
+        """Tells whether a change between two samples ``dt`` seconds apart calls for faster sampling."""
+        return ((power_change > self.power_deadband and power_change / dt >= self.power_slope)
+                or (cpu_change > self.cpu_deadband and cpu_change / dt >= self.cpu_slope))
+
+    def update(self, timestamp: float, power: float, cpu_usage: float = 0.0) -> float:
+        """Accounts a new sample; returns the seconds to wait before the next one."""
+        self.samples += 1
+        if self._last is not None:
+            last_time, last_power, last_cpu = self._last
+            dt = timestamp - last_time
+            if dt > 0:
+                if self.is_active(dt, abs(power - last_power), abs(cpu_usage - last_cpu)):
+                    self.active_samples += 1
+                    self._last_active = timestamp
+                    self.interval = self.min_interval
+                elif timestamp - self._last_active > self.hold_time:
+                    self.interval = min(self.interval * SLOWDOWN, self.max_interval)
+        self._last = (timestamp, power, cpu_usage)
+        return self.interval
+
+    def stats(self) -> dict:
+        """Returns the number of samples and how many of them were taken during activity."""
+        return {'samples': self.samples, 'active_samples': self.active_samples, 'interval': self.interval}
+
+
+def simulate_sampling(df: pd.DataFrame, scheduler: AdaptiveScheduler) -> np.ndarray:
+    """Returns the rows of a densely sampled recording that ``scheduler`` would have sampled."""
+    times = df['elapsed_time'].to_numpy(dtype=float)
+    power = df['Power'].to_numpy(dtype=float)
+    cpu_usage = df['cpu_usage'].to_numpy(dtype=float) if 'cpu_usage' in df else np.zeros(len(df))
+    picked = []
+    index = 0
+    while index < len(times):
+        picked.append(index)
+        next_time = times[index] + scheduler.update(times[index], power[index], cpu_usage[index])
+        index = max(int(np.searchsorted(times, next_time)), index + 1)
+    return np.array(picked)
+
+
+def reconstruction_error(df: pd.DataFrame, picked: np.ndarray) -> dict:
+    """Compares a subsampled recording with the dense one it was taken from."""
+    times = df['elapsed_time'].to_numpy(dtype=float)
+    power = df['Power'].to_numpy(dtype=float)
+    reconstructed = np.interp(times, times[picked], power[picked])
+    reference = integrate_energy(power, times)
+    return {
+        'samples': len(picked),
+        'energy_error_pct': 100 * abs(integrate_energy(power[picked], times[picked]) - reference) / reference,
+        'rms_error_w': float(np.sqrt(np.mean((reconstructed - power) ** 2))),
+    }
+
+
+def compare_sampling(df: pd.DataFrame, scheduler: AdaptiveScheduler) -> pd.DataFrame:
+    """Compares adaptive sampling with fixed-rate sampling of the same number of samples."""
+    adaptive = simulate_sampling(df, scheduler)
+    fixed = np.unique(np.linspace(0, len(df) - 1, len(adaptive)).round().astype(int))
+    return pd.DataFrame({'adaptive': reconstruction_error(df, adaptive),
+                         'fixed': reconstruction_error(df, fixed)}).T
+
+
+def emulated_recording(duration: float, rate: float = 100.0) -> pd.DataFrame:
+    """Returns a dense EPS1 power recording of the PMD emulator."""
+    from pmd import decode_frames, EPS1_CHANNEL
+    from pmd_emulator import emulated_frames
+    eps1 = decode_frames(emulated_frames(int(duration * rate), rate))[:, EPS1_CHANNEL]
+    return pd.DataFrame({'elapsed_time': np.arange(len(eps1)) / rate, 'Power': eps1[:, 0] * eps1[:, 1]})
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Compare adaptive and fixed-rate sampling on a dense recording.')
+    parser.add_argument('csv', nargs='?', help='Densely sampled CSV (elapsed_time, Power[, cpu_usage]); default: emulated PMD')
+    parser.add_argument('--duration', type=float, default=300.0, help='Seconds of emulated recording')
+    parser.add_argument('--min-interval', type=float, default=MIN_INTERVAL, help='Fastest sampling interval (s)')
+    parser.add_argument('--max-interval', type=float, default=MAX_INTERVAL, help='Slowest sampling interval (s)')
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv) if args.csv else emulated_recording(args.duration)
+    print(compare_sampling(df, AdaptiveScheduler(args.min_interval, args.max_interval)).to_string())
@@ -0,0 +1,275 @@
+import json
+import math
+import logging
+import argparse
+from collections import namedtuple
+
+ZSCORE_WINDOW = 600  # Samples of the rolling window the z-score compares against
+ZSCORE_RECOMPUTE = 10_000  # Samples between two exact recomputations of the rolling sums, cancelling float drift
+STALE_TIMEOUT = 5.0  # Seconds without a valid reading after which the sensor is reported as stale
+
+# One transition of a rule: 'firing' when its condition starts to hold, 'resolved' when it stops
+AlertEvent = namedtuple('AlertEvent', ['timestamp', 'rule', 'field', 'state', 'value', 'message'])
+
+
+class Rule:
+    """Base of the alert rules: watches one field and reports transitions of its condition.
+
+    ``update`` is called for every sample of the field and must run in constant time.
+    """
+
+    kind = None
+    __slots__ = ('name', 'field', 'active')
+
+    def __init__(self, name: str, field: str):
+        self.name = name
+        self.field = field
+        self.active = False
+
+    def condition(self, timestamp: float, value: float):
+        """Returns a message when the condition holds for this sample, else None."""
+        raise NotImplementedError
+
+    def update(self, timestamp: float, value: float):
+        """Evaluates one sample; returns an AlertEvent when the rule starts or stops firing."""
+        message = self.condition(timestamp, value)
+        if (message is not None) == self.active:
+            return None
+        self.active = message is not None
+        return AlertEvent(timestamp, self.name, self.field, 'firing' if self.active else 'resolved', value,
+                          message or f'{self.field} back to normal ({value:.3f})')
+
+
+class ThresholdRule(Rule):
+    """Fires while a field is below ``low`` or above ``high``; ``hysteresis`` keeps it firing until well inside."""
+
+    kind = 'threshold'
+    __slots__ = ('low', 'high', 'hysteresis')
+
+    def __init__(self, name: str, field: str, low: float = None, high: float = None, hysteresis: float = 0.0):
+        super().__init__(name, field)
+        self.low = low
+        self.high = high
+        self.hysteresis = hysteresis
+
+    def condition(self, timestamp: float, value: float):
+        margin = self.hysteresis if self.active else 0.0
+        if self.low is not None and value < self.low + margin:
+            return f'{self.field} {value:.3f} below {self.low}'
+        if self.high is not None and value > self.high - margin:
+            return f'{self.field} {value:.3f} above {self.high}'
+        return None
+
+
+class RateOfChangeRule(Rule):
+    """Fires while a field changes faster than ``max_rate`` units per second between two samples."""
+
+    kind = 'rate'
+    __slots__ = ('max_rate', '_last_time', '_last_value')
+
+    def __init__(self, name: str, field: str, max_rate: float):
+        super().__init__(name, field)
+        self.max_rate = max_rate
+        self._last_time = None
+        self._last_value = None
+
+    def condition(self, timestamp: float, value: float):
+        last_time, last_value = self._last_time, self._last_value
+        self._last_time, self._last_value = timestamp, value
+        if last_time is None or timestamp <= last_time:
+            return None
+        rate = (value - last_value) / (timestamp - last_time)
+        if abs(rate) > self.max_rate:
+            return f'{self.field} changing at {rate:+.2f}/s (limit {self.max_rate}/s)'
+        return None
+
+
+class ZScoreRule(Rule):
+    """Fires while a field deviates from its rolling mean by more than ``threshold`` standard deviations.
+
+    The window is a ring buffer with running sums, so each sample costs O(1); the sums are
+    recomputed exactly every ZSCORE_RECOMPUTE samples so that rounding errors cannot accumulate.
+    """
+
+    kind = 'zscore'
+    __slots__ = ('window', 'threshold', 'min_std', '_values', '_index', '_count', '_sum', '_sum_sq', '_since_recompute', '_message')
+
+    def __init__(self, name: str, field: str, threshold: float = 4.0, window: int = ZSCORE_WINDOW, min_std: float = 1e-9):
+        super().__init__(name, field)
+        self.window = window
+        self.threshold = threshold
+        self.min_std = min_std  # Floor of the deviation, so that a perfectly flat signal does not fire on noise
+        self._values = [0.0] * window
+        self._index = 0
+        self._count = 0
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        self._since_recompute = 0
+        self._message = None
+
+    def condition(self, timestamp: float, value: float):
+        message = None
+        if not math.isfinite(value):
+            return self._message  # Skipped: a NaN in the window would poison the running sums until the next recomputation
+        if self._count == self.window:
+            mean = self._sum / self._count
+            std = max(math.sqrt(max(self._sum_sq / self._count - mean * mean, 0.0)), self.min_std)
+            z = (value - mean) / std
+            if abs(z) > self.threshold:
+                message = f'{self.field} {value:.3f} is {z:+.1f} sigma from its rolling mean {mean:.3f}'
+
+        old = self._values[self._index]
+        self._values[self._index] = value
+        self._index = (self._index + 1) % self.window
+        if self._count < self.window:
+            self._count += 1
+            self._sum += value
+            self._sum_sq += value * value
+        else:
+            self._sum += value - old
+            self._sum_sq += value * value - old * old
+        self._since_recompute += 1
+        if self._since_recompute >= ZSCORE_RECOMPUTE:
+            values = self._values[:self._count]
+            self._sum = math.fsum(values)
+            self._sum_sq = math.fsum(v * v for v in values)
+            self._since_recompute = 0
+        self._message = message
+        return message
+
+
+class StaleRule(Rule):
+    """Fires when a field had no valid (finite) reading for ``timeout`` seconds.
+
+    A dropped sensor produces no samples at all, so the rule is also checked from a timer
+    through AlertEngine.check_stale().
+    """
+
+    kind = 'stale'
+    __slots__ = ('timeout', 'last_valid')
+
+    def __init__(self, name: str, field: str, timeout: float = STALE_TIMEOUT):
+        super().__init__(name, field)
+        self.timeout = timeout
+        self.last_valid = None
+
+    def condition(self, timestamp: float, value: float):
+        if value is not None and math.isfinite(value):
+            self.last_valid = timestamp
+        if self.last_valid is not None and timestamp - self.last_valid > self.timeout:
+            return f'No valid {self.field} reading for {timestamp - self.last_valid:.1f} s'
+        return None
+
+    def check(self, now: float):
+        """Evaluates the rule without a new sample; returns an AlertEvent on a transition."""
+        return self.update(now, float('nan'))
+
+
+RULE_TYPES = {rule.kind: rule for rule in (ThresholdRule, RateOfChangeRule, ZScoreRule, StaleRule)}
+
+
+class AlertEngine:
+    """Evaluates the alert rules on every sample and reports their transitions.
+
+    Rules are indexed by field, so a sample only visits the rules of the fields it carries. Only
+    transitions are logged; the number of firings and the active state of every rule are
+    exported to the metrics registry, if any.
+    """
+
+    def __init__(self, rules: list, registry=None):
+        self.rules = list(rules)
+        self.registry = registry
+        self.events = 0
+        self._by_field = {}
+        for rule in self.rules:
+            self._by_field.setdefault(rule.field, []).append(rule)
+        self._stale_rules = [rule for rule in self.rules if isinstance(rule, StaleRule)]
+        if registry is not None:
+            registry.describe('alert_active', 'gauge', 'Whether an alert rule is currently firing')
+            registry.describe('alerts_fired_total', 'counter', 'Times an alert rule started firing')
+            registry.describe('alert_evaluations_total', 'counter', 'Samples evaluated by the alert engine')
+            for rule in self.rules:
+                registry.set('alert_active', 0, rule=rule.name)
+                registry.set('alerts_fired_total', 0, rule=rule.name)
+
+    def observe(self, timestamp: float, sample: dict) -> list:
+        """Evaluates the rules of every field of ``sample``; returns the events raised."""
+        events = []
+        for field, value in sample.items():
+            for rule in self._by_field.get(field, ()):
+                event = rule.update(timestamp, value)
+                if event is not None:
+                    events.append(event)
+        if self.registry is not None:
+            self.registry.inc('alert_evaluations_total')
+        for event in events:
+            self.emit(event)
+        return events
+
+    def check_stale(self, now: float) -> list:
+        """Checks the stale-data rules between samples; returns the events raised."""
+        events = [event for event in (rule.check(now) for rule in self._stale_rules) if event is not None]
+        for event in events:
+            self.emit(event)
+        return events
+
+    def emit(self, event: AlertEvent) -> None:
+        """Reports an event to the log and the metrics registry."""
+        self.events += 1
+        if event.state == 'firing':
+            logging.warning(f"ALERT {event.rule}: {event.message}")
+        else:
+            logging.info(f"Resolved {event.rule}: {event.message}")
+        if self.registry is not None:
+            self.registry.set('alert_active', int(event.state == 'firing'), rule=event.rule)
+            if event.state == 'firing':
+                self.registry.inc('alerts_fired_total', rule=event.rule)
+
+    def active(self) -> list:
+        """Returns the names of the rules currently firing."""
+        return [rule.name for rule in self.rules if rule.active]
+
+
+def default_rules() -> list:
+    """Returns the rules watching a 12 V EPS rail measured by the PMD."""
+    return [
+        ThresholdRule('voltage_sag', 'Voltage', low=11.4, high=12.6, hysteresis=0.05),  # ATX tolerance of +/-5%
+        ZScoreRule('power_spike', 'package_power', threshold=6.0),
+        RateOfChangeRule('power_step', 'package_power', max_rate=500.0),
+        ThresholdRule('invalid_frame', 'frame_valid', low=1),  # All read attempts of a sample failed
+        StaleRule('sensor_dropout', 'Voltage'),
+    ]
+
+
+def load_rules(path: str) -> list:
+    """Loads rules from a JSON list of objects such as ``{"type": "threshold", "name": ..., "field": ..., "high": ...}``."""
+    with open(path) as f:
+        definitions = json.load(f)
+    rules = []
+    for definition in definitions:
+        definition = dict(definition)
+        kind = definition.pop('type')
+        if kind not in RULE_TYPES:
+            raise ValueError(f"Unknown rule type '{kind}', expected one of {', '.join(RULE_TYPES)}")
+        rules.append(RULE_TYPES[kind](**definition))
+    return rules
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    # Replay a recording through the rules to see which alerts it would have raised
+    parser = argparse.ArgumentParser(description='Replay a measurements CSV or archive through the alert rules.')
+    parser.add_argument('recording', help='Measurements CSV or .pmdts archive')
+    parser.add_argument('--rules', help='JSON rules file (default: the built-in rules)')
+    args = parser.parse_args()
+
+    from tscodec import read_measurements
+    df = read_measurements(args.recording)
+    if 'package_power' not in df.columns and {'Voltage', 'Current'} <= set(df.columns):
+        df['package_power'] = df['Voltage'] * df['Current']
+    engine = AlertEngine(load_rules(args.rules) if args.rules else default_rules())
+    fields = [field for field in engine._by_field if field in df.columns]
+    for row in zip(df['elapsed_time'].tolist(), *(df[field].tolist() for field in fields)):
+        engine.observe(row[0], dict(zip(fields, row[1:])))
+    print(f"{engine.events} events, still firing: {', '.join(engine.active()) or 'none'}")
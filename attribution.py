@@ -0,0 +1,301 @@
+import os
+import csv
+import time
+import logging
+import numpy as np
+import psutil
+from memory_budget import dict_bytes
+
+# CPU time fields of psutil.cpu_times() that are already contained in 'user'/'nice'
+DOUBLE_COUNTED_CPU_FIELDS = ('guest', 'guest_nice')
+RESCAN_INTERVAL = 1.0  # Seconds between two scans of the process table
+
+
+class PsutilCpuTimes:
+    """Reads cumulative CPU times (in seconds) of processes and of the whole system through psutil."""
+
+    def __init__(self):
+        self._processes = {}
+
+    def read_total(self) -> float:
+        """Returns the CPU time spent by all logical cores, idle included."""
+        times = psutil.cpu_times()
+        return sum(getattr(times, field) for field in times._fields if field not in DOUBLE_COUNTED_CPU_FIELDS)
+
+    def read_pid_stats(self, pids: np.ndarray) -> tuple:
+        """Returns the user + system CPU time and the RSS bytes of every PID, NaN for processes that are gone."""
+        values = np.full(len(pids), np.nan)
+        rss = np.full(len(pids), np.nan)
+        for i, pid in enumerate(pids.tolist()):
+            process = self._processes.get(pid)
+            try:
+                if process is None:
+                    process = self._processes[pid] = psutil.Process(pid)
+                with process.oneshot():
+                    times = process.cpu_times()
+                    rss[i] = process.memory_info().rss
+                values[i] = times.user + times.system
+            except (psutil.NoSuchProcess, psutil.AccessDenied) as e:
+                self._processes.pop(pid, None)
+                logging.debug(f'Error reading CPU times of PID {pid}: {e}')
+        return values, rss
+
+    def read_processes(self, pids: np.ndarray) -> np.ndarray:
+        """Returns the user + system CPU time of every PID, NaN for processes that are gone."""
+        return self.read_pid_stats(pids)[0]
+
+    def forget(self, pids) -> None:
+        """Drops the cached handles of processes that are no longer tracked."""
+        for pid in pids:
+            self._processes.pop(pid, None)
+
+
+def find_target_processes(process_names=(), root_pids=()) -> dict:
+    """Maps the PID of every target process and of all its descendants to its attribution group.
+
+    A process tree is rooted at a process whose name is in ``process_names`` or whose PID is in
+    ``root_pids``; children (e.g. MATLAB parpool workers) inherit the group of their top-most root.
+    """
+    process_names = set(process_names)
+    root_pids = set(root_pids)
+    parents = {}
+    roots = {}
+
+    for process in psutil.process_iter(['pid', 'ppid', 'name']):
+        pid = process.info['pid']
+        parents[pid] = process.info['ppid']
+        if pid in root_pids or process.info['name'] in process_names:
+            roots[pid] = process.info['name'] or str(pid)
+
+    groups = {}
+    for pid in parents:
+        # Walk up the parent chain and keep the top-most root found on the way
+        group = None
+        ancestor, seen = pid, set()
+        while ancestor in parents and ancestor not in seen:
+            seen.add(ancestor)
+            if ancestor in roots:
+                group = roots[ancestor]
+            ancestor = parents[ancestor]
+        if group is not None:
+            groups[pid] = group
+
+    return groups
+
+
+def find_process_tree(root_pids) -> dict:
+    """Maps the PID of every root process and of all its descendants to the name of its root.
+
+    Walks the tree down from the roots instead of scanning the whole process table, which is what
+    the launcher needs when it knows the exact PID of the job it spawned.
+    """
+    groups = {}
+    for root in root_pids:
+        try:
+            root_process = psutil.Process(root)
+            group = root_process.name() or str(root)
+            if os.path.exists(f'/proc/{root}/task/{root}/children'):
+                descendants = read_proc_children(root)
+            else:
+                descendants = [child.pid for child in root_process.children(recursive=True)]
+        except (psutil.NoSuchProcess, psutil.AccessDenied) as e:
+            logging.debug(f'Error walking the process tree of PID {root}: {e}')
+            continue
+        groups[root] = group
+        for pid in descendants:
+            groups.setdefault(pid, group)
+    return groups
+
+
+def read_proc_children(root: int) -> list:
+    """Lists the descendants of a process from the /proc/[pid]/task/[tid]/children files (Linux)."""
+    descendants, pending = [], [root]
+    while pending:
+        pid = pending.pop()
+        try:
+            tids = os.listdir(f'/proc/{pid}/task')
+        except OSError:
+            continue  # The process exited meanwhile
+        for tid in tids:
+            try:
+                with open(f'/proc/{pid}/task/{tid}/children') as f:
+                    children = [int(child) for child in f.read().split()]
+            except OSError:
+                continue
+            descendants.extend(children)
+            pending.extend(children)
+    return descendants
+
+
+class ProcessAttribution:
+    """Splits the measured package power between target processes proportionally to their CPU time.
+
+    Each tick the CPU-time deltas of all tracked PIDs are compared with the CPU-time delta of the
+    whole system, so a process that kept one of eight cores busy receives 1/8 of the package power.
+    The per-PID bookkeeping is held in NumPy arrays indexed by the sorted PID array; the energy of
+    every PID seen is kept in arrays too and written once per run by write_pid_energy, since
+    per-PID columns would grow the measurements with every short-lived process.
+    """
+
+    def __init__(self, process_names=(), root_pids=(), cpu_times=None, rescan_interval: float = RESCAN_INTERVAL):
+        self.process_names = list(process_names)
+        self.root_pids = list(root_pids)
+        self.cpu_times = cpu_times if cpu_times is not None else PsutilCpuTimes()
+        self.rescan_interval = rescan_interval
+
+        self._targets = {}
+        self._last_scan = None
+        self._pids = np.empty(0, dtype=np.int64)
+        self._last_proc_times = np.empty(0)
+        self._last_total = None
+        self._last_timestamp = None
+
+        self.pid_groups = {}  # PID -> group name for every PID seen so far
+        self._seen_pids = np.empty(0, dtype=np.int64)  # Sorted PIDs of pid_groups
+        self._seen_energy = np.empty(0)  # Attributed energy in joules of every seen PID
+        self.group_energy = {}  # Group -> attributed energy in joules
+        self.last_snapshot = None  # Raw readings of the last tick, as passed to update()
+
+    @property
+    def pid_energy(self) -> dict:
+        """Maps every PID seen so far to its attributed energy in joules."""
+        return dict(zip(self._seen_pids.tolist(), self._seen_energy.tolist()))
+
+    def bookkeeping_bytes(self) -> int:
+        """Returns the memory held by the per-PID bookkeeping of the whole run."""
+        return dict_bytes(self.pid_groups) + self._seen_pids.nbytes + self._seen_energy.nbytes
+
+    def _accumulate(self, pids: np.ndarray, groups: np.ndarray, pid_energy: np.ndarray) -> None:
+        # Adds the energy of this tick to the run totals, inserting the PIDs not seen before
+        positions = np.searchsorted(self._seen_pids, pids)
+        seen = positions < len(self._seen_pids)
+        seen[seen] = self._seen_pids[positions[seen]] == pids[seen]
+        if not seen.all():
+            self.pid_groups.update(zip(pids[~seen].tolist(), groups[~seen].tolist()))
+            merged = np.union1d(self._seen_pids, pids)
+            energy = np.zeros(len(merged))
+            energy[np.searchsorted(merged, self._seen_pids)] = self._seen_energy
+            self._seen_pids, self._seen_energy = merged, energy
+            positions = np.searchsorted(self._seen_pids, pids)
+        self._seen_energy[positions] += pid_energy
+
+    def refresh_targets(self, now: float = None) -> dict:
+        """Rescans the process table if the rescan interval has elapsed and returns the targets."""
+        now = time.monotonic() if now is None else now
+        if self._last_scan is None or now - self._last_scan >= self.rescan_interval:
+            if self.process_names:
+                self._targets = find_target_processes(self.process_names, self.root_pids)
+            else:
+                self._targets = find_process_tree(self.root_pids)
+            self._last_scan = now
+            logging.debug(f'Tracking {len(self._targets)} processes for attribution')
+        return self._targets
+
+    def sample(self, package_power: float, timestamp: float = None, attributed_power=None) -> dict:
+        """Reads the current CPU times and RSS of the targets and attributes ``package_power`` to them.
+
+        ``attributed_power(share, rss)`` optionally turns the CPU share (0-1) and the resident memory
+        in bytes of the targets into the power attributed to them, e.g. through a power model; it is
+        then split between the PIDs by CPU time. The result also holds the targets' ``rss``.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        targets = self.refresh_targets()
+        pids = np.fromiter(sorted(targets), dtype=np.int64, count=len(targets))
+        proc_times, rss = self.cpu_times.read_pid_stats(pids)
+        total = self.cpu_times.read_total()
+        rss = float(np.nansum(rss))
+        split = (lambda share: attributed_power(share, rss)) if attributed_power is not None else None
+        result = self.update(pids, [targets[pid] for pid in pids.tolist()], proc_times, total, package_power, timestamp,
+                             attributed_power=split)
+        result['rss'] = rss
+        return result
+
+    def update(self, pids, groups, proc_times, total_time: float, package_power: float, timestamp: float,
+               attributed_power=None) -> dict:
+        """Attributes ``package_power`` from already collected CPU times.
+
+        ``pids`` must be sorted; ``proc_times`` and ``total_time`` are cumulative CPU times in any
+        consistent unit (seconds or jiffies). Without ``attributed_power`` every PID receives its
+        CPU share of the package power; otherwise ``attributed_power(share)`` gives the power of
+        all targets, which is split between them by CPU time so the groups sum to it. Returns the
+        per-PID and per-group power and energy of this tick.
+        """
+        pids = np.asarray(pids, dtype=np.int64)
+        proc_times = np.asarray(proc_times, dtype=float)
+        self.last_snapshot = {'pids': pids, 'groups': list(groups), 'proc_times': proc_times, 'total_time': total_time}
+
+        # Align the previous readings with the current PID array; new PIDs start with a zero delta
+        deltas = np.zeros(len(pids))
+        if len(self._pids):
+            positions = np.searchsorted(self._pids, pids).clip(max=len(self._pids) - 1)
+            known = self._pids[positions] == pids
+            deltas[known] = proc_times[known] - self._last_proc_times[positions[known]]
+        deltas = np.nan_to_num(deltas, nan=0.0).clip(min=0.0)  # Vanished or recycled PIDs
+
+        gone = np.setdiff1d(self._pids, pids)
+        if len(gone) and hasattr(self.cpu_times, 'forget'):
+            self.cpu_times.forget(gone.tolist())
+
+        total_delta = total_time - self._last_total if self._last_total is not None else 0.0
+        dt = timestamp - self._last_timestamp if self._last_timestamp is not None else 0.0
+
+        self._pids = pids
+        self._last_proc_times = proc_times
+        self._last_total = total_time
+        self._last_timestamp = timestamp
+
+        shares = deltas / total_delta if total_delta > 0 else np.zeros(len(pids))
+        shares = shares.clip(max=1.0)
+        share = float(shares.sum())
+        if attributed_power is None:
+            pid_power = package_power * shares
+        else:
+            power = float(attributed_power(share))
+            pid_power = power * shares / share if share > 0 else np.zeros(len(pids))
+        pid_energy = pid_power * max(dt, 0.0)
+
+        # Aggregate PIDs into their groups in one pass
+        groups = np.asarray(groups, dtype=str)
+        group_names, group_codes = np.unique(groups, return_inverse=True)
+        group_power = np.bincount(group_codes, weights=pid_power, minlength=len(group_names))
+        group_energy = np.bincount(group_codes, weights=pid_energy, minlength=len(group_names))
+
+        self._accumulate(pids, groups, pid_energy)
+        for group, energy in zip(group_names.tolist(), group_energy.tolist()):
+            self.group_energy[group] = self.group_energy.get(group, 0.0) + energy
+
+        return {
+            'share': share,
+            'power': float(pid_power.sum()),
+            'pids': pids,
+            'pid_power': pid_power,
+            'pid_energy': pid_energy,
+            'group_power': dict(zip(group_names.tolist(), group_power.tolist())),
+            'group_energy': dict(zip(group_names.tolist(), group_energy.tolist())),
+        }
+
+
+def attribution_columns(result: dict) -> dict:
+    """Flattens an attribution result into per-group power/energy columns.
+
+    Groups are bounded by the target process names; per-PID energy goes to write_pid_energy.
+    """
+    columns = {}
+    for group, power in result['group_power'].items():
+        columns[f'Power_group_{group}'] = power
+        columns[f'Energy_group_{group}'] = result['group_energy'][group]
+    return columns
+
+
+def pid_energy_path(base_path: str) -> str:
+    """Returns the per-PID energy file of a recording (``base_path`` without extension)."""
+    return f'{base_path}_pid_energy.csv'
+
+
+def write_pid_energy(path: str, attribution: ProcessAttribution) -> None:
+    """Writes the energy attributed to every PID of a run in long format (pid, group, energy_j)."""
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['pid', 'group', 'energy_j'])
+        for pid, energy in zip(attribution._seen_pids.tolist(), attribution._seen_energy.tolist()):
+            writer.writerow([pid, attribution.pid_groups[pid], energy])
@@ -0,0 +1,333 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # Plot updates are timed off-screen, without a window
+import matplotlib.pyplot as plt
+import matplotlib.gridspec as gridspec
+import pmd
+from pmd import EMULATOR_PORT, FRAME_SIZE, EPS1_CHANNEL, decode_frames, decode_channel
+from pmd_emulator import emulated_frames
+from attribution import ProcessAttribution
+from procstat import ProcStatReader, PROC_STAT_AVAILABLE
+from recorder import Recorder
+from rollups import RollupWriter
+from segment_log import SegmentLog
+from tscodec import write_archive, read_archive
+from alerts import AlertEngine, ThresholdRule, RateOfChangeRule, ZScoreRule, StaleRule
+
+REPEAT = 5  # Each measurement keeps the best of this many runs
+REGRESSION_TOLERANCE = 0.2  # Relative slowdown against the baseline flagged as a regression
+DECODE_FRAMES = 100_000
+PROCESS_TABLE_SIZES = (10, 100, 1000, 10000)
+HISTORY_LENGTHS = (100, 1000, 10000)
+WRITE_ROWS = 100_000
+END_TO_END_SAMPLES = 200
+ALERT_SAMPLES = 100_000
+ALERT_RULE_COUNTS = (4, 40)
+RESULTS_PATH = './data/benchmarks/latest.json'
+BASELINE_PATH = './data/benchmarks/baseline.json'
+
+
+def measure(func, repeat: int = REPEAT, number: int = 1) -> float:
+    """Returns the best wall time of ``number`` calls of ``func`` over ``repeat`` runs, per call."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def result(value: float, unit: str, higher_is_better: bool) -> dict:
+    """Builds one benchmark entry of the results file."""
+    return {'value': float(value), 'unit': unit, 'higher_is_better': higher_is_better}
+
+
+def synthetic_measurements(rows: int, rate: float = 10.0) -> pd.DataFrame:
+    """Returns a measurements table shaped like the main_v2 CSV, decoded from emulated frames."""
+    eps1 = decode_frames(emulated_frames(rows, rate))[:, EPS1_CHANNEL]
+    rng = np.random.default_rng(0)
+    cpu_usage = rng.uniform(0, 100, rows)
+    return pd.DataFrame({
+        'elapsed_time': np.arange(rows) / rate,
+        'Power': eps1[:, 0] * eps1[:, 1] * cpu_usage / 100,
+        'Voltage': eps1[:, 0],
+        'Current': eps1[:, 1],
+        'cpu_usage': cpu_usage,
+        'memory_usage': rng.uniform(0, 10, rows),
+        'baseline_power': np.nan,
+    })
+
+
+def bench_decode(frames: int = DECODE_FRAMES) -> dict:
+    """Measures the frame decode throughput of the batch and the per-frame decoders."""
+    buffer = emulated_frames(frames)
+    per_frame = [buffer[i:i + FRAME_SIZE] for i in range(0, min(len(buffer), 10_000 * FRAME_SIZE), FRAME_SIZE)]
+    return {
+        'decode_frames': result(frames / measure(lambda: decode_frames(buffer)), 'frames/s', True),
+        'decode_channel': result(len(per_frame) / measure(lambda: [decode_channel(f) for f in per_frame]),
+                                 'frames/s', True),
+    }
+
+
+def bench_attribution(sizes=PROCESS_TABLE_SIZES) -> dict:
+    """Measures the cost of one attribution tick against the number of tracked processes."""
+    results = {}
+    rng = np.random.default_rng(0)
+    for size in sizes:
+        attribution = ProcessAttribution(['matlab'])
+        pids = np.arange(1000, 1000 + size, dtype=np.int64)
+        groups = ['matlab'] * size
+        proc_times = np.zeros(size)
+        state = {'total': 0.0, 'timestamp': 0.0}
+
+        def tick():
+            proc_times[:] += rng.uniform(0, 0.01, size)
+            state['total'] += 0.1 * os.cpu_count()
+            state['timestamp'] += 0.1
+            attribution.update(pids, groups, proc_times.copy(), state['total'], 30.0, state['timestamp'])
+
+        tick()  # Prime the previous readings so every timed tick computes deltas
+        results[f'attribution_update_{size}_pids'] = result(measure(tick, number=20) * 1e3, 'ms', False)
+
+    # Reading the CPU times of every process of this machine, as done when tracking large trees
+    if PROC_STAT_AVAILABLE:
+        reader = ProcStatReader()
+        pids = np.array(sorted(int(name) for name in os.listdir('/proc') if name.isdigit()), dtype=np.int64)
+        reader.read_processes(pids)  # Open the file handles once, like a running monitor
+        results['procstat_read_all_pids'] = result(measure(lambda: reader.read_processes(pids), number=10) * 1e3,
+                                                   'ms', False)
+        reader.close()
+    return results
+
+
+def bench_buffer_append(lengths=HISTORY_LENGTHS) -> dict:
+    """Measures the cost of appending one sample to the in-memory history, as animation_update does."""
+    results = {}
+    row = synthetic_measurements(1)
+    for length in lengths:
+        history = synthetic_measurements(length)
+        results[f'buffer_append_{length}_rows'] = result(
+            measure(lambda: pd.concat([history, row], ignore_index=True), number=20) * 1e3, 'ms', False)
+    return results
+
+
+def bench_writes(rows: int = WRITE_ROWS) -> dict:
+    """Measures the CSV rewrite, segment log, raw recorder and rollup write throughputs."""
+    df = synthetic_measurements(rows)
+    frames = emulated_frames(rows)
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, 'bench.csv')
+        csv_time = measure(lambda: df.to_csv(csv_path, mode='w', header=True, index=False), repeat=3)
+
+        records = df.to_dict('records')
+
+        def log():
+            segment_log = SegmentLog(os.path.join(directory, f'bench_{time.perf_counter_ns()}_wal'))
+            for row in records:
+                segment_log.append_row(row)
+            segment_log.close()
+
+        def record():
+            with Recorder(os.path.join(directory, 'bench.pmdrec')) as recorder:
+                for i in range(rows):
+                    recorder.write_frame(frames[i * FRAME_SIZE:(i + 1) * FRAME_SIZE], float(i))
+
+        def rollup():
+            writer = RollupWriter(os.path.join(directory, 'bench'))
+            for row in zip(*(df[c].tolist() for c in ('elapsed_time', 'Power', 'Voltage', 'Current'))):
+                writer.add(*row)
+            writer.close()
+
+        return {
+            'csv_rewrite': result(rows / csv_time, 'rows/s', True),
+            'segment_log_append': result(rows / measure(log, repeat=3), 'rows/s', True),
+            'recorder_write': result(rows / measure(record, repeat=3), 'frames/s', True),
+            'rollup_write': result(rows / measure(rollup, repeat=3), 'rows/s', True),
+        }
+
+
+def bench_codec(rows: int = WRITE_ROWS) -> dict:
+    """Measures the archive encode and decode throughputs and its size against the CSV."""
+    df = synthetic_measurements(rows)
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, 'bench.csv')
+        archive_path = os.path.join(directory, 'bench.pmdts')
+        df.to_csv(csv_path, index=False)
+        encode_time = measure(lambda: write_archive(df, archive_path), repeat=3)
+        decode_time = measure(lambda: read_archive(archive_path), repeat=3)
+        return {
+            'archive_encode': result(rows / encode_time, 'rows/s', True),
+            'archive_decode': result(rows / decode_time, 'rows/s', True),
+            'archive_ratio': result(os.path.getsize(csv_path) / os.path.getsize(archive_path), 'x', True),
+        }
+
+
+def bench_alerts(samples: int = ALERT_SAMPLES, rule_counts=ALERT_RULE_COUNTS) -> dict:
+    """Measures the alert engine throughput against the number of rules watching each field."""
+    df = synthetic_measurements(samples, rate=1000.0)
+    df['package_power'] = df['Voltage'] * df['Current']
+    fields = ['Voltage', 'Current', 'package_power', 'Power']
+    rows = [dict(zip(fields, values)) for values in zip(*(df[field].tolist() for field in fields))]
+    times = df['elapsed_time'].tolist()
+    results = {}
+    for count in rule_counts:
+        def run():
+            rules = []
+            for i in range(count // 4):
+                field = fields[i % len(fields)]
+                rules += [ThresholdRule(f'threshold_{i}', field, low=0, high=1e6), RateOfChangeRule(f'rate_{i}', field, 1e6),
+                          ZScoreRule(f'zscore_{i}', field, threshold=1e6), StaleRule(f'stale_{i}', field)]
+            engine = AlertEngine(rules)
+            for timestamp, row in zip(times, rows):
+                engine.observe(timestamp, row)
+        results[f'alerts_{count}_rules'] = result(samples / measure(run, repeat=3), 'samples/s', True)
+    return results
+
+
+def setup_monitor(directory: str):
+    """Imports main_v2 wired to the PMD emulator, an off-screen figure and outputs in ``directory``."""
+    pmd.PMD_SETTINGS['port'] = EMULATOR_PORT
+    import main_v2
+    main_v2.SAVE_TO_CSV = False
+    main_v2.csv_base_path = os.path.join(directory, 'bench')
+    main_v2.fig = plt.figure(figsize=(10, 16))
+    gs = gridspec.GridSpec(3, 1, height_ratios=[1, 1, 1])
+    main_v2.voltage_ax = plt.subplot(gs[0])
+    main_v2.current_ax = plt.subplot(gs[1])
+    main_v2.power_ax = plt.subplot(gs[2])
+    return main_v2
+
+
+def bench_plot(lengths=HISTORY_LENGTHS) -> dict:
+    """Measures one animation_update of main_v2, drawing included, against the history length."""
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        monitor = setup_monitor(directory)
+        for length in lengths:
+            history = synthetic_measurements(length)
+
+            def update():
+                monitor.df = history
+                monitor.animation_update(0)
+                monitor.fig.canvas.draw()
+
+            results[f'animation_update_{length}_rows'] = result(measure(update, repeat=3) * 1e3, 'ms', False)
+        plt.close(monitor.fig)
+    return results
+
+
+def bench_end_to_end(samples: int = END_TO_END_SAMPLES) -> dict:
+    """Measures the samples per second of the main_v2 acquisition path against the emulator.
+
+    Each sample goes through the frame read, CPU sampling, attribution, power model, raw recorder
+    and rollups, and is appended to the history, without plotting.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        monitor = setup_monitor(directory)
+        monitor.recorder = Recorder(os.path.join(directory, 'bench.pmdrec'))
+        monitor.rollup_writer = RollupWriter(monitor.csv_base_path)
+        history = []
+
+        def acquire():
+            for _ in range(samples):
+                history.append(monitor.get_new_sensor_values())
+            pd.concat(history, ignore_index=True)
+            history.clear()
+
+        elapsed = measure(acquire, repeat=3)
+        monitor.recorder.close()
+        monitor.rollup_writer.close()
+        monitor.recorder = monitor.rollup_writer = None
+        plt.close(monitor.fig)
+    return {'end_to_end': result(samples / elapsed, 'samples/s', True)}
+
+
+BENCHMARKS = {
+    'decode': bench_decode,
+    'attribution': bench_attribution,
+    'buffer': bench_buffer_append,
+    'writes': bench_writes,
+    'codec': bench_codec,
+    'alerts': bench_alerts,
+    'plot': bench_plot,
+    'end_to_end': bench_end_to_end,
+}
+
+
+def run_benchmarks(names=None) -> dict:
+    """Runs the selected benchmarks and returns the results document."""
+    results = {}
+    for name in names or BENCHMARKS:
+        logging.info(f"Running {name} benchmarks...")
+        results.update(BENCHMARKS[name]())
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'results': results,
+    }
+
+
+def compare_results(current: dict, baseline: dict, tolerance: float = REGRESSION_TOLERANCE) -> pd.DataFrame:
+    """Compares two results documents; a benchmark slower than the baseline by ``tolerance`` is a regression."""
+    rows = {}
+    for name, entry in current['results'].items():
+        reference = baseline['results'].get(name)
+        if reference is None:
+            continue
+        # Express every change as a speedup so that the tolerance applies the same way to both kinds of units
+        speedup = entry['value'] / reference['value'] if entry['higher_is_better'] else reference['value'] / entry['value']
+        status = 'regression' if speedup < 1 - tolerance else 'improvement' if speedup > 1 + tolerance else 'unchanged'
+        rows[name] = {'Unit': entry['unit'], 'Baseline': reference['value'], 'Current': entry['value'],
+                      'Speedup': speedup, 'Status': status}
+    return pd.DataFrame.from_dict(rows, orient='index')
+
+
+def save_results(results: dict, path: str) -> None:
+    """Writes a results document as JSON."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Benchmark the monitor pipeline against the PMD emulator.')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help='Benchmarks to run (default: all)')
+    parser.add_argument('--output', default=RESULTS_PATH, help='Results JSON to write')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline results JSON to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE, help='Relative slowdown tolerated')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.only)
+    save_results(results, args.output)
+    logging.info(f"Benchmark results saved to {args.output}")
+    for name, entry in results['results'].items():
+        print(f"{name:40s} {entry['value']:14.3f} {entry['unit']}")
+
+    if args.save_baseline:
+        save_results(results, args.baseline)
+        logging.info(f"Baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            comparison = compare_results(results, json.load(f), args.tolerance)
+        print(comparison.to_string())
+        regressions = comparison.index[comparison['Status'] == 'regression'].tolist()
+        if regressions:
+            logging.warning(f"Performance regressions against {args.baseline}: {', '.join(regressions)}")
+            sys.exit(1)
@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import logging
+import argparse
+import platform
+from datetime import datetime
+import numpy as np
+import psutil
+from pmd import PMD_SETTINGS, FrameReader, check_connection, open_pmd, decode_channel
+
+BASELINE_CACHE_PATH = './data/baseline_cache.json'  # Per-host and per-device baseline profiles
+CALIBRATION_DURATION = 60  # Seconds of idle sampling
+CALIBRATION_INTERVAL = 0.5  # Seconds between two idle samples
+QUIET_LOAD_THRESHOLD = 20.0  # System CPU load (%) above which the system is not considered quiet
+
+
+def baseline_key(host: str, device: str) -> str:
+    """Returns the cache key of a host/device pair."""
+    return f'{host}|{device}'
+
+
+def read_cpu_frequency() -> float:
+    """Returns the current mean core frequency in MHz, or NaN where it is not available."""
+    try:
+        freq = psutil.cpu_freq()
+    except (NotImplementedError, FileNotFoundError):
+        freq = None
+    return float(freq.current) if freq is not None else float('nan')
+
+
+def collect_idle_samples(duration: float = CALIBRATION_DURATION, interval: float = CALIBRATION_INTERVAL) -> dict:
+    """Samples the package power, core frequency and system load while the system is quiet."""
+    power, frequency, load = [], [], []
+    psutil.cpu_percent(interval=None)  # Prime the system-wide CPU counter
+
+    frame_reader = FrameReader()
+    with open_pmd() as ser:
+        end = time.monotonic() + duration
+        while time.monotonic() < end:
+            time.sleep(interval)
+            read_bytes = frame_reader.read(ser)
+            if read_bytes is None:
+                continue  # A failed read must not pull the idle baseline towards zero
+            voltage_value, current_value = decode_channel(read_bytes)
+            power.append(voltage_value * current_value)
+            frequency.append(read_cpu_frequency())
+            load.append(psutil.cpu_percent(interval=None))
+
+    samples = {'power': np.array(power), 'cpu_freq': np.array(frequency), 'load': np.array(load)}
+    if len(load) and np.mean(samples['load']) > QUIET_LOAD_THRESHOLD:
+        logging.warning(f"Mean system load during calibration was {np.mean(samples['load']):.1f}%, "
+                        f"the baseline may include active work.")
+    return samples
+
+
+def fit_baseline(samples: dict) -> dict:
+    """Fits the idle package power as a linear function of core frequency and system load.
+
+    Features that are unavailable (NaN) or constant during calibration are left out of the fit,
+    in which case the baseline reduces to the mean idle power. The range of every feature is kept
+    with the profile so that baseline_power never extrapolates beyond it.
+    """
+    power = np.asarray(samples['power'], dtype=float)
+    if not len(power):
+        raise ValueError("No valid PMD sample was read during calibration, no baseline can be fitted.")
+    features = []
+    for name in ('cpu_freq', 'load'):
+        values = np.asarray(samples.get(name, []), dtype=float)
+        if len(values) == len(power) and np.all(np.isfinite(values)) and np.ptp(values) > 0:
+            features.append(name)
+
+    design = np.column_stack([np.ones(len(power))] + [np.asarray(samples[name], dtype=float) for name in features])
+    coefficients, *_ = np.linalg.lstsq(design, power, rcond=None)
+    residuals = power - design @ coefficients
+
+    return {
+        'intercept': float(coefficients[0]),
+        'coefficients': dict(zip(features, coefficients[1:].tolist())),
+        'ranges': {name: [float(np.min(samples[name])), float(np.max(samples[name]))] for name in features},
+        'mean_power': float(power.mean()),
+        'std_power': float(power.std()),
+        'residual_std': float(residuals.std()),
+        'n_samples': int(len(power)),
+        'created': datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def baseline_power(profile: dict, cpu_freq=None, load=None):
+    """Evaluates a baseline profile for scalar or array core frequencies and loads.
+
+    Inputs are clamped to the range seen during calibration: the live system load includes the
+    measured job, and extrapolating the idle slope to it would subtract part of the job's power.
+    Where an input of the fit is not available (None or NaN), the mean idle power is used.
+    """
+    values = {'cpu_freq': cpu_freq, 'load': load}
+    # Profiles saved before the ranges were kept were still fitted on quiet loads only
+    ranges = profile.get('ranges', {'load': [0.0, QUIET_LOAD_THRESHOLD]})
+    power = profile['intercept']
+    missing = False
+    for name, coefficient in profile['coefficients'].items():
+        value = values[name]
+        if value is None:
+            return profile['mean_power'] if np.isscalar(power) else np.full_like(power, profile['mean_power'])
+        value = np.asarray(value, dtype=float)
+        missing = missing | np.isnan(value)
+        if name in ranges:
+            value = np.clip(value, *ranges[name])
+        power = power + coefficient * value
+    return np.where(missing, profile['mean_power'], np.maximum(power, 0.0))
+
+
+def load_baseline_cache(path: str = BASELINE_CACHE_PATH) -> dict:
+    """Loads every cached baseline profile."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(profile: dict, host: str, device: str, path: str = BASELINE_CACHE_PATH) -> None:
+    """Stores the baseline profile of a host/device pair in the cache file."""
+    if not profile['n_samples'] or not np.isfinite(profile['mean_power']):
+        raise ValueError(f"Refusing to cache a baseline fitted on {profile['n_samples']} samples")
+    cache = load_baseline_cache(path)
+    cache[baseline_key(host, device)] = profile
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, path)  # Never leave a half-written cache behind
+    logging.info(f"Baseline for {baseline_key(host, device)} saved to {path}")
+
+
+def load_baseline(host: str, device: str, path: str = BASELINE_CACHE_PATH):
+    """Returns the cached baseline profile of a host/device pair, or None if it was never calibrated."""
+    return load_baseline_cache(path).get(baseline_key(host, device))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Calibrate the idle power baseline of this host.')
+    parser.add_argument('--duration', type=float, default=CALIBRATION_DURATION, help='Seconds of idle sampling')
+    parser.add_argument('--interval', type=float, default=CALIBRATION_INTERVAL, help='Seconds between samples')
+    parser.add_argument('--force', action='store_true', help='Recalibrate even if a baseline is cached')
+    args = parser.parse_args()
+
+    check_connection()
+    if PMD_SETTINGS['port'] is None:
+        raise SystemExit(1)
+
+    host = platform.node()
+    device = PMD_SETTINGS['port']
+    if load_baseline(host, device) is not None and not args.force:
+        logging.info(f"A baseline for {baseline_key(host, device)} is already cached. Use --force to recalibrate.")
+        raise SystemExit(0)
+
+    logging.info(f"Calibrating idle baseline for {args.duration} s, keep the system quiet...")
+    try:
+        profile = fit_baseline(collect_idle_samples(args.duration, args.interval))
+    except ValueError as e:
+        logging.error(f"{e} Check the PMD connection and calibrate again.")
+        raise SystemExit(1)
+    save_baseline(profile, host, device)
+    logging.info(f"Idle baseline: {profile['mean_power']:.3f} W (std {profile['std_power']:.3f} W)")
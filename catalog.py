@@ -0,0 +1,268 @@
+import os
+import re
+import glob
+import sqlite3
+import logging
+import argparse
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+CATALOG_PATH = './data/catalog.sqlite'
+DATE_NAME_FORMAT = '%y%m%d-%H%M'  # Prefix of every recording name, e.g. 240920-1111_measurements.csv
+DATE_NAME_PATTERN = re.compile(r'(\d{6}-\d{4})')
+DERIVED_CSV_PATTERN = re.compile(r'_rollup_\d+s\.csv$|_pid_energy\.csv$')  # Files written next to a recording
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    csv_path TEXT UNIQUE NOT NULL,
+    tex_path TEXT,
+    raw_path TEXT,
+    host TEXT,
+    source TEXT,
+    start_time TEXT,
+    end_time TEXT,
+    duration_s REAL,
+    sample_count INTEGER,
+    total_energy_j REAL,
+    mean_power_w REAL,
+    updated TEXT
+);
+CREATE TABLE IF NOT EXISTS run_processes (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    process_name TEXT NOT NULL,
+    PRIMARY KEY (run_id, process_name)
+);
+CREATE INDEX IF NOT EXISTS runs_start_time ON runs(start_time);
+CREATE INDEX IF NOT EXISTS runs_host ON runs(host);
+CREATE INDEX IF NOT EXISTS runs_total_energy ON runs(total_energy_j);
+CREATE INDEX IF NOT EXISTS run_processes_name ON run_processes(process_name);
+"""
+
+RUN_COLUMNS = ['csv_path', 'tex_path', 'raw_path', 'host', 'source', 'start_time', 'end_time', 'duration_s',
+               'sample_count', 'total_energy_j', 'mean_power_w']
+ADDED_COLUMNS = {'source': 'TEXT'}  # Columns missing from catalogs created by older versions
+
+
+def connect(path: str = CATALOG_PATH) -> sqlite3.Connection:
+    """Opens the catalog, creating it if needed."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA foreign_keys = ON')
+    connection.executescript(SCHEMA)
+    existing = {row[1] for row in connection.execute('PRAGMA table_info(runs)')}
+    for column, kind in ADDED_COLUMNS.items():
+        if column not in existing:
+            connection.execute(f'ALTER TABLE runs ADD COLUMN {column} {kind}')
+    return connection
+
+
+def start_time_from_name(csv_path: str):
+    """Parses the start time encoded in a recording name, or returns None."""
+    match = DATE_NAME_PATTERN.search(os.path.basename(csv_path))
+    if match is None:
+        return None
+    return datetime.strptime(match.group(1), DATE_NAME_FORMAT)
+
+
+def power_series(df: 'pd.DataFrame', start_time: datetime = None) -> tuple:
+    """Extracts (elapsed seconds, power, start time) from a recording.
+
+    Accepts the elapsed_time format of main_v2.py as well as the timestamp format of main.py
+    (long format with a 'unit' column) and of the older recordings.
+    """
+    # NumPy and pandas are imported where needed so that querying the catalog starts fast
+    import numpy as np
+    import pandas as pd
+    if 'unit' in df.columns:
+        df = df[df['unit'] == 'P']
+    df = df.dropna(subset=['Power'])
+
+    if 'elapsed_time' in df.columns:
+        elapsed = df['elapsed_time'].to_numpy(dtype=float)
+    else:
+        timestamps = pd.to_datetime(df['timestamp'])
+        start_time = timestamps.iloc[0].to_pydatetime() if len(timestamps) else start_time
+        elapsed = (timestamps - timestamps.iloc[0]).dt.total_seconds().to_numpy() if len(timestamps) else np.empty(0)
+
+    return elapsed, df['Power'].to_numpy(dtype=float), start_time
+
+
+def summarize_measurements(df: 'pd.DataFrame', start_time: datetime = None) -> dict:
+    """Computes the catalog metadata of a recording."""
+    import numpy as np
+    import pandas as pd
+    elapsed, power, start_time = power_series(df, start_time)
+    duration = float(elapsed[-1] - elapsed[0]) if len(elapsed) else 0.0
+    energy = float(np.sum((power[1:] + power[:-1]) / 2 * np.diff(elapsed))) if len(power) > 1 else 0.0
+
+    summary = {
+        'duration_s': duration,
+        'sample_count': int(len(power)),
+        'total_energy_j': energy,
+        'mean_power_w': float(power.mean()) if len(power) else None,
+        'start_time': None,
+        'end_time': None,
+    }
+    if start_time is not None:
+        summary['start_time'] = (start_time + pd.Timedelta(seconds=float(elapsed[0]) if len(elapsed) else 0)).isoformat()
+        summary['end_time'] = (start_time + pd.Timedelta(seconds=float(elapsed[-1]) if len(elapsed) else 0)).isoformat()
+    return summary
+
+
+def update_run(record: dict, process_names=(), path: str = CATALOG_PATH) -> int:
+    """Inserts or updates the catalog entry of a run, keyed by its CSV path. Returns the run id."""
+    record = {column: record.get(column) for column in RUN_COLUMNS}
+    for column in ('csv_path', 'tex_path', 'raw_path'):
+        if record[column] is not None:
+            record[column] = os.path.abspath(record[column])
+    record['updated'] = datetime.now().isoformat(timespec='seconds')
+
+    with connect(path) as connection:
+        # Keep metadata (host, .tex path...) previously stored by other tools when not provided
+        existing = connection.execute('SELECT * FROM runs WHERE csv_path = ?', (record['csv_path'],)).fetchone()
+        if existing is not None:
+            names = [d[0] for d in connection.execute('SELECT * FROM runs LIMIT 0').description]
+            for column, value in zip(names, existing):
+                if column in record and record[column] is None:
+                    record[column] = value
+
+        columns = ', '.join(record)
+        placeholders = ', '.join('?' for _ in record)
+        updates = ', '.join(f'{column} = excluded.{column}' for column in record if column != 'csv_path')
+        connection.execute(f'INSERT INTO runs ({columns}) VALUES ({placeholders}) '
+                           f'ON CONFLICT(csv_path) DO UPDATE SET {updates}', list(record.values()))
+        run_id = connection.execute('SELECT id FROM runs WHERE csv_path = ?', (record['csv_path'],)).fetchone()[0]
+
+        if process_names:
+            connection.execute('DELETE FROM run_processes WHERE run_id = ?', (run_id,))
+            connection.executemany('INSERT INTO run_processes (run_id, process_name) VALUES (?, ?)',
+                                   [(run_id, name) for name in dict.fromkeys(process_names)])
+    connection.close()
+    return run_id
+
+
+def index_csv(csv_path: str, host: str = None, process_names=(), tex_path: str = None, raw_path: str = None,
+              path: str = CATALOG_PATH, source: str = None) -> int:
+    """Reads a measurements CSV, computes its metadata and stores it in the catalog.
+
+    ``source`` is where the power came from (see pmd.power_source); it is kept when not given.
+    """
+    import pandas as pd
+    df = pd.read_csv(csv_path)
+    record = summarize_measurements(df, start_time_from_name(csv_path))
+    record.update({'csv_path': csv_path, 'host': host, 'raw_path': raw_path, 'source': source,
+                   'tex_path': tex_path or (f'{csv_path}.tex' if os.path.exists(f'{csv_path}.tex') else None)})
+    run_id = update_run(record, process_names, path)
+    logging.info(f"Run {csv_path} indexed in the catalog")
+    return run_id
+
+
+def scan_directory(directory: str = './data', path: str = CATALOG_PATH) -> int:
+    """Indexes every measurements CSV of a directory, skipping rollups and other derived files. Returns the count."""
+    import pandas as pd
+    count = 0
+    for csv_path in sorted(glob.glob(os.path.join(directory, '*.csv'))):
+        if DERIVED_CSV_PATTERN.search(os.path.basename(csv_path)):
+            continue
+        try:
+            if 'Power' not in pd.read_csv(csv_path, nrows=0).columns:
+                logging.debug(f"Skipping {csv_path}, not a measurements file")
+                continue
+            index_csv(csv_path, path=path)
+            count += 1
+        except (KeyError, ValueError, pd.errors.ParserError) as e:
+            logging.error(f"Error indexing {csv_path}: {e}")
+    return count
+
+
+def find_runs(since: str = None, until: str = None, host: str = None, process: str = None,
+              min_energy: float = None, max_energy: float = None, path: str = CATALOG_PATH) -> 'pd.DataFrame':
+    """Selects runs by start time range, host, monitored process and total energy (J)."""
+    import pandas as pd
+    conditions, parameters = [], []
+    if since is not None:
+        conditions.append('start_time >= ?')
+        parameters.append(since)
+    if until is not None:
+        conditions.append('start_time < ?')
+        parameters.append(until)
+    if host is not None:
+        conditions.append('host = ?')
+        parameters.append(host)
+    if process is not None:
+        conditions.append('id IN (SELECT run_id FROM run_processes WHERE process_name = ?)')
+        parameters.append(process)
+    if min_energy is not None:
+        conditions.append('total_energy_j >= ?')
+        parameters.append(min_energy)
+    if max_energy is not None:
+        conditions.append('total_energy_j <= ?')
+        parameters.append(max_energy)
+
+    query = 'SELECT * FROM runs'
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY start_time'
+
+    with connect(path) as connection:
+        runs = pd.read_sql_query(query, connection, params=parameters)
+    connection.close()
+    return runs
+
+
+def run_source(csv_path: str, path: str = CATALOG_PATH) -> str:
+    """Returns the source stored for a recording ('pmd', 'emulator', 'rapl'), or None if unknown."""
+    if not os.path.exists(path):
+        return None
+    connection = sqlite3.connect(path)
+    try:
+        row = connection.execute('SELECT source FROM runs WHERE csv_path = ?', (os.path.abspath(csv_path),)).fetchone()
+    except sqlite3.OperationalError:
+        row = None  # Catalog created by another version, without the source column yet
+    connection.close()
+    return row[0] if row is not None else None
+
+
+def recent_runs(limit: int = 5, path: str = CATALOG_PATH) -> list:
+    """Returns the ``limit`` most recently started runs as dicts, without loading pandas."""
+    if not os.path.exists(path):
+        return []
+    connection = sqlite3.connect(path)
+    connection.row_factory = sqlite3.Row
+    try:
+        rows = connection.execute('SELECT * FROM runs ORDER BY start_time DESC LIMIT ?', (limit,)).fetchall()
+    except sqlite3.OperationalError:
+        rows = []  # Catalog created by another version, without the runs table yet
+    connection.close()
+    return [dict(row) for row in rows]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Maintain and query the catalog of recorded runs.')
+    parser.add_argument('--catalog', default=CATALOG_PATH, help='Catalog database')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scan_parser = subparsers.add_parser('scan', help='Index every recording of a directory')
+    scan_parser.add_argument('directory', nargs='?', default='./data')
+
+    list_parser = subparsers.add_parser('list', help='List runs matching the filters')
+    list_parser.add_argument('--since', help='Earliest start time (ISO format)')
+    list_parser.add_argument('--until', help='Latest start time (ISO format)')
+    list_parser.add_argument('--host')
+    list_parser.add_argument('--process')
+    list_parser.add_argument('--min-energy', type=float, help='Minimum total energy (J)')
+    list_parser.add_argument('--max-energy', type=float, help='Maximum total energy (J)')
+
+    args = parser.parse_args()
+    if args.command == 'scan':
+        logging.info(f"{scan_directory(args.directory, args.catalog)} runs indexed")
+    else:
+        runs = find_runs(args.since, args.until, args.host, args.process, args.min_energy, args.max_energy,
+                         args.catalog)
+        print(runs.drop(columns=['id', 'updated']).to_string(index=False))
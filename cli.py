@@ -0,0 +1,99 @@
+import os
+import sys
+import time
+import argparse
+
+# Subcommands forwarding their arguments to the command line of a module; the module (and the
+# heavy libraries it needs) is only imported when its subcommand runs
+SCRIPTS = {
+    'monitor': ('main_v2', 'Plot, attribute and record power live (main_v2.py)'),
+    'monitor-v1': ('main', 'Plot and record power live with the original monitor (main.py)'),
+    'run': ('launcher', 'Run a command and measure its energy from start to exit'),
+    'calibrate': ('calibration', 'Calibrate the idle baseline of this host and PMD'),
+    'replay': ('replay', 'Re-run a raw recording through a power model'),
+    'models': ('power_models', 'Compare the power models on a recorded CSV'),
+    'compare': ('compare_runs', 'Compare the energy of several runs with confidence intervals'),
+    'report': ('report', 'Build the LaTeX, Markdown, JSON, rollup and figure reports of a run'),
+    'catalog': ('catalog', 'Index and query the catalog of recorded runs'),
+    'viewer': ('history_viewer', 'Navigate long recordings interactively'),
+    'recover': ('segment_log', 'Recover an interrupted segment log and export it to CSV'),
+    'bench': ('benchmark', 'Benchmark the monitor pipeline against the PMD emulator'),
+    'collect': ('collector', 'Aggregate the samples streamed by remote monitors'),
+    'rapl': ('rapl', 'Read the RAPL counters and compare them with the PMD'),
+}
+STATUS_RUNS = 5  # Recent runs listed by the status subcommand
+
+
+def list_ports_command(args) -> int:
+    """Lists the serial ports and the one that would be used for the PMD."""
+    from pmd import list_ports, detect_serial_port
+    list_ports()
+    print(f'PMD port: {detect_serial_port() or "not found"}')
+    return 0
+
+
+def status_command(args) -> int:
+    """Prints the detected PMD, any interrupted run and the most recent runs of the catalog."""
+    from pmd import detect_serial_port
+    from segment_log import find_unfinished_log, last_write_time
+    from catalog import recent_runs
+
+    print(f'PMD port: {detect_serial_port() or "not found"}')
+
+    unfinished = find_unfinished_log(args.data_dir)
+    if unfinished is not None:
+        age = (time.time() - last_write_time(unfinished)) / 60
+        print(f'Interrupted run: {unfinished} (last written {age:.0f} min ago)')
+
+    runs = recent_runs(STATUS_RUNS, args.catalog or os.path.join(args.data_dir, 'catalog.sqlite'))
+    print('Recent runs:' if runs else 'No runs in the catalog.')
+    for run in runs:
+        energy = f"{run['total_energy_j'] / 3600:.2f} Wh" if run['total_energy_j'] is not None else '-'
+        duration = f"{run['duration_s'] / 60:.1f} min" if run['duration_s'] is not None else '-'
+        print(f"  {run['start_time'] or '?':19.19s}  {duration:>10s}  {energy:>10s}  {run['csv_path']}")
+    return 0
+
+
+def run_script(module: str, argv: list) -> int:
+    """Runs the command line of ``module`` with ``argv`` as if it was started as a script."""
+    import runpy
+    sys.argv = [f'{module}.py'] + argv
+    try:
+        runpy.run_module(module, run_name='__main__', alter_sys=True)
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Builds the command line parser; forwarded subcommands parse their own options."""
+    parser = argparse.ArgumentParser(prog='cli.py', description='PowerTrack: process energy measurement with the Elmor Labs PMD.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    list_parser = subparsers.add_parser('list-ports', help='List the serial ports')
+    list_parser.set_defaults(handler=list_ports_command)
+
+    status_parser = subparsers.add_parser('status', help='Show the PMD, interrupted runs and recent runs')
+    status_parser.add_argument('--data-dir', default='./data', help='Directory holding the recordings')
+    status_parser.add_argument('--catalog', help='Catalog database (default: <data-dir>/catalog.sqlite)')
+    status_parser.set_defaults(handler=status_command)
+
+    for name, (module, description) in SCRIPTS.items():
+        script_parser = subparsers.add_parser(name, help=description, add_help=False)
+        script_parser.set_defaults(module=module)
+    return parser
+
+
+def main(argv: list = None) -> int:
+    """Dispatches a command line to its subcommand."""
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    # Everything after a forwarded subcommand belongs to the module, including --help
+    if argv and argv[0] in SCRIPTS:
+        return run_script(SCRIPTS[argv[0]][0], argv[1:])
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,533 @@
+import os
+import re
+import json
+import time
+import zlib
+import queue
+import socket
+import uuid
+import struct
+import logging
+import argparse
+import platform
+import threading
+import socketserver
+from pmd import FRAME_SIZE, pad_frames
+
+DEFAULT_ADDRESS = 'localhost:7700'
+BATCH_SIZE = 100  # Samples sent together; at 100 Hz one batch per second
+BATCH_INTERVAL = 1.0  # Seconds after which a partial batch is sent anyway
+QUEUE_BATCHES = 64  # Batches buffered by a sender while the aggregator is unreachable; older ones are dropped
+RECONNECT_DELAY = 2.0  # Seconds between two connection attempts
+CLOSE_TIMEOUT = 10.0  # Seconds a closing sender keeps trying to deliver its last batches
+ACK_TIMEOUT = 10.0  # Seconds to wait for the aggregator to acknowledge a batch
+LISTEN_BACKLOG = 128  # Pending connections accepted at once, so that dozens of senders can (re)connect together
+COMPRESSION_LEVEL = 6
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024  # Larger lengths can only come from a broken stream
+STATE_FILE = 'collector.json'  # Last committed batch of a run and whether it finished, kept in its segment log
+
+# Stream layout: messages of MESSAGE_HEADER (kind, sequence number, length) followed by a
+# zlib-compressed payload. HELLO carries the JSON run metadata and is sent first on every
+# connection; BATCH carries a uint32 length and a JSON list of measurement rows, then a uint32
+# count, float64 timestamps and raw 16-byte PMD frames; END finishes the run. The aggregator answers
+# every BATCH and END with an ACK of its sequence number: unacknowledged batches are sent again on
+# the next connection and the aggregator skips the ones it already applied. A batch it cannot apply
+# is never acknowledged; the connection is dropped instead.
+MESSAGE_HEADER = struct.Struct('<BQI')
+ACK = struct.Struct('<Q')
+KIND_HELLO = 1
+KIND_BATCH = 2
+KIND_END = 3
+COUNT = struct.Struct('<I')
+
+
+def parse_address(address: str) -> tuple:
+    """Returns the socket family and address of 'host:port' or 'unix:/path/to/socket'."""
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    host, _, port = address.rpartition(':')
+    return socket.AF_INET, (host or 'localhost', int(port))
+
+
+def connect(address: str) -> socket.socket:
+    """Opens a stream connection to an aggregator."""
+    family, target = parse_address(address)
+    if family == socket.AF_INET:
+        return socket.create_connection(target, timeout=RECONNECT_DELAY * 5)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.connect(target)
+    return sock
+
+
+def recv_exact(sock: socket.socket, size: int) -> bytes:
+    """Receives exactly ``size`` bytes from a socket."""
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('Connection closed by the aggregator')
+        data += chunk
+    return data
+
+
+def encode_message(kind: int, sequence: int, payload: bytes) -> bytes:
+    """Compresses a payload and prefixes it with its message header."""
+    compressed = zlib.compress(payload, COMPRESSION_LEVEL)
+    return MESSAGE_HEADER.pack(kind, sequence, len(compressed)) + compressed
+
+
+def read_message(stream):
+    """Reads one message from a binary stream; returns (kind, sequence, payload) or None at the end of the stream."""
+    header = stream.read(MESSAGE_HEADER.size)
+    if len(header) < MESSAGE_HEADER.size:
+        return None
+    kind, sequence, length = MESSAGE_HEADER.unpack(header)
+    if length > MAX_MESSAGE_SIZE:
+        raise ValueError(f'Message of {length} bytes exceeds the maximum size')
+    compressed = stream.read(length)
+    if len(compressed) < length:
+        return None
+    return kind, sequence, zlib.decompress(compressed)
+
+
+def encode_batch(rows: list, frames: list) -> bytes:
+    """Packs measurement rows and (timestamp, frame) pairs into a BATCH payload."""
+    rows = json.dumps(rows, default=str).encode()
+    timestamps = struct.pack(f'<{len(frames)}d', *(timestamp for timestamp, _ in frames))
+    return b''.join([COUNT.pack(len(rows)), rows, COUNT.pack(len(frames)), timestamps,
+                     pad_frames(frame for _, frame in frames)])
+
+
+def decode_batch(payload: bytes) -> tuple:
+    """Unpacks a BATCH payload into (rows, [(timestamp, frame), ...])."""
+    rows_length, = COUNT.unpack_from(payload)
+    rows = json.loads(payload[COUNT.size:COUNT.size + rows_length])
+    offset = COUNT.size + rows_length
+    count, = COUNT.unpack_from(payload, offset)
+    timestamps = struct.unpack_from(f'<{count}d', payload, offset + COUNT.size)
+    start = offset + COUNT.size + 8 * count
+    frames = [(timestamp, payload[start + i * FRAME_SIZE:start + (i + 1) * FRAME_SIZE])
+              for i, timestamp in enumerate(timestamps)]
+    return rows, frames
+
+
+class SampleSender:
+    """Ships the samples of a run to an aggregator in compressed batches, from a background thread.
+
+    The monitor never blocks on the network: full batches go into a bounded queue and, while the
+    aggregator is unreachable, the oldest batches are dropped once QUEUE_BATCHES are waiting. The
+    sender reconnects on its own, introduces the run again on every new connection and sends a
+    batch again until the aggregator acknowledges it.
+    """
+
+    def __init__(self, address: str, meta: dict, batch_size: int = BATCH_SIZE, batch_interval: float = BATCH_INTERVAL,
+                 queue_batches: int = QUEUE_BATCHES):
+        self.address = address
+        self.meta = dict(meta)
+        self.meta.setdefault('host', platform.node())
+        self.meta.setdefault('run', time.strftime('%y%m%d-%H%M'))
+        self.meta.setdefault('run_id', uuid.uuid4().hex)  # Tells apart runs of a host started in the same minute
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+
+        self.sent_batches = 0
+        self.dropped_batches = 0
+        self.sent_bytes = 0
+        self.raw_bytes = 0
+
+        self._hello = encode_message(KIND_HELLO, 0, json.dumps(self.meta).encode())
+        self._sequence = 0
+        self._rows = []
+        self._frames = []
+        self._last_flush = time.monotonic()
+        self._queue = queue.Queue(maxsize=queue_batches)
+        self._socket = None
+        self._closing = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sample-sender', daemon=True)
+        self._thread.start()
+
+    def send_row(self, row: dict) -> None:
+        """Adds one measurement row to the current batch."""
+        self._rows.append(row)
+        self._maybe_flush()
+
+    def send_frame(self, frame: bytes, timestamp: float) -> None:
+        """Adds one raw PMD frame to the current batch."""
+        self._frames.append((timestamp, frame))
+        self._maybe_flush()
+
+    def _maybe_flush(self) -> None:
+        if max(len(self._rows), len(self._frames)) >= self.batch_size or \
+                time.monotonic() - self._last_flush >= self.batch_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """Queues the current batch, dropping the oldest queued batch if the queue is full."""
+        self._last_flush = time.monotonic()
+        if not self._rows and not self._frames:
+            return
+        payload = encode_batch(self._rows, self._frames)
+        self._sequence += 1
+        self.raw_bytes += len(payload)
+        self._rows, self._frames = [], []
+        self._enqueue((self._sequence, encode_message(KIND_BATCH, self._sequence, payload)))
+
+    def _enqueue(self, item: tuple) -> None:
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped_batches += 1
+                except queue.Empty:
+                    pass
+
+    def _deliver(self, sequence: int, message: bytes, deadline: float = None, ack_timeout: float = ACK_TIMEOUT) -> bool:
+        # Send one message until it is acknowledged, reconnecting as needed; gives up only past the
+        # deadline of a closing sender
+        while True:
+            try:
+                if self._socket is None:
+                    self._socket = connect(self.address)
+                    self._socket.sendall(self._hello)
+                    logging.info(f"Connected to the aggregator at {self.address}")
+                self._socket.settimeout(ack_timeout)
+                self._socket.sendall(message)
+                acknowledged, = ACK.unpack(recv_exact(self._socket, ACK.size))
+                if acknowledged != sequence:
+                    raise ConnectionError(f'Batch {acknowledged} acknowledged instead of {sequence}')
+                self.sent_bytes += len(message)
+                return True
+            except OSError as e:
+                if self._socket is not None:
+                    logging.warning(f"Connection to the aggregator at {self.address} lost: {e}")
+                    self._socket.close()
+                    self._socket = None
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+                time.sleep(RECONNECT_DELAY)
+
+    def _run(self) -> None:
+        deadline = None
+        while True:
+            try:
+                sequence, message = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._closing.is_set():
+                    break
+                continue
+            if self._closing.is_set() and deadline is None:
+                deadline = time.monotonic() + CLOSE_TIMEOUT
+            if self._deliver(sequence, message, deadline):
+                self.sent_batches += 1
+            else:
+                self.dropped_batches += 1
+
+        # Closing the run exports its CSV on the aggregator, so its acknowledgement may take longer
+        self._sequence += 1
+        self._deliver(self._sequence, encode_message(KIND_END, self._sequence, b''),
+                      deadline or time.monotonic() + CLOSE_TIMEOUT, ack_timeout=CLOSE_TIMEOUT * 6)
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def stats(self) -> dict:
+        """Returns the delivery counters of the sender."""
+        return {'sent_batches': self.sent_batches, 'dropped_batches': self.dropped_batches,
+                'queued_batches': self._queue.qsize(), 'sent_bytes': self.sent_bytes,
+                'compression_ratio': self.raw_bytes / self.sent_bytes if self.sent_bytes else None}
+
+    def close(self) -> None:
+        """Sends the last batch and the end of the run, then stops the background thread."""
+        self.flush()
+        self._closing.set()
+        self._thread.join(CLOSE_TIMEOUT + RECONNECT_DELAY * 2)
+        logging.info(f"Sample sender closed: {self.stats()}")
+
+
+def safe_name(name: str) -> str:
+    """Makes a host or run name safe to use as a file name."""
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', str(name)) or 'unnamed'
+
+
+def run_key(meta: dict) -> tuple:
+    """Returns the key of a run; senders predating run ids are keyed by their run name."""
+    return meta.get('host'), meta.get('run_id') or meta.get('run')
+
+
+def run_base_path(output_dir: str, meta: dict) -> str:
+    """Returns the base path of the files of a run."""
+    # The run id keeps the files of two runs started in the same minute apart
+    name = f"{meta.get('run')}_{meta['run_id'][:8]}" if meta.get('run_id') else meta.get('run')
+    return os.path.join(output_dir, safe_name(meta.get('host')), safe_name(name))
+
+
+def read_state(base_path: str) -> dict:
+    """Returns the committed state of a run (see RunSession), or an empty dict for a new run."""
+    from segment_log import log_directory
+    try:
+        with open(os.path.join(log_directory(base_path), STATE_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def numbered_path(path: str) -> str:
+    """Returns ``path``, or ``path`` with the first free number before its extension if it exists."""
+    base, extension = os.path.splitext(path)
+    number = 1
+    while os.path.exists(path):
+        path = f'{base}_{number}{extension}'
+        number += 1
+    return path
+
+
+class RunSession:
+    """Writes the samples received for one run of one machine into the recording formats.
+
+    Rows go to a segment log and the rollup tiers, raw frames to the binary recorder. When the run
+    ends the log is exported to CSV and the run is registered in the catalog of the aggregator.
+    Every batch is synced, then committed to STATE_FILE before it is acknowledged. A session
+    reopened after an aggregator restart drops the records of uncommitted batches, which the sender
+    sends again, and skips the committed ones. Its raw frames go to a new numbered file so that the
+    frames received before the restart are kept.
+    """
+
+    def __init__(self, output_dir: str, meta: dict):
+        # Imported here so that the sender side, used inside the monitor, stays light
+        from recorder import Recorder
+        from rollups import resume_rollups
+        from segment_log import SegmentLog, log_directory, log_meta, iter_rows
+
+        self.meta = meta
+        self.base_path = run_base_path(output_dir, meta)
+        os.makedirs(os.path.dirname(self.base_path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.segment_log = SegmentLog(log_directory(self.base_path), log_meta('collector', **meta))
+        self.state_path = os.path.join(self.segment_log.directory, STATE_FILE)
+        state = read_state(self.base_path)
+        self.position = tuple(state.get('position', (0, 0)))
+        self.segment_log.rewind(self.position)  # Records past the last commit were never acknowledged
+        # Rebuilt from the committed rows, since a restart loses the open buckets of the tiers
+        self.rollup_writer = resume_rollups(iter_rows(self.segment_log.directory), self.base_path)
+        self.recorder = Recorder(numbered_path(f'{self.base_path}_raw.pmdrec'), meta)
+        self.rows = state.get('rows', 0)
+        self.frames = state.get('frames', 0)
+        self.last_sequence = state.get('last_sequence', 0)
+
+    def save_state(self, finished: bool = False) -> None:
+        """Commits the last applied batch, and whether the run finished, next to the log."""
+        state = {'last_sequence': self.last_sequence, 'rows': self.rows, 'frames': self.frames,
+                 'position': list(self.position), 'finished': finished}
+        with open(f'{self.state_path}.tmp', 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f'{self.state_path}.tmp', self.state_path)
+
+    def add_batch(self, sequence: int, rows: list, frames: list) -> None:
+        """Appends a received batch, skipping batches already applied before a reconnection."""
+        with self.lock:
+            if sequence <= self.last_sequence:
+                logging.debug(f"Skipping batch {sequence} of {self.base_path}, already received")
+                return
+            for row in rows:
+                self.segment_log.append_row(row)
+                if row.get('Power') is not None and 'elapsed_time' in row:
+                    self.rollup_writer.add(row['elapsed_time'], row['Power'], row.get('Voltage'), row.get('Current'))
+            for timestamp, frame in frames:
+                self.recorder.write_frame(frame, timestamp)
+            self.rows += len(rows)
+            self.frames += len(frames)
+            self.last_sequence = sequence
+            self.segment_log.sync()
+            self.recorder.flush()
+            self.position = self.segment_log.position()
+            self.save_state()
+
+    def close(self, catalog_path: str, catalog_lock: threading.Lock, finished: bool = True) -> None:
+        """Closes the run files, exports the CSV and registers the run in the catalog.
+
+        A run closed because the aggregator stops is not ``finished``: its sender may resume it.
+        """
+        from segment_log import export_csv
+        from catalog import index_csv
+
+        with self.lock:
+            self.recorder.close()
+            self.rollup_writer.close()
+            self.segment_log.close()
+            csv_path = f'{self.base_path}.csv'
+            if self.rows:
+                export_csv(self.segment_log.directory, csv_path)
+                with catalog_lock:  # SQLite takes one writer at a time; runs ending together wait their turn
+                    index_csv(csv_path, self.meta.get('host'), self.meta.get('process_names', []),
+                              raw_path=self.recorder.path, path=catalog_path, source=self.meta.get('source'))
+            self.save_state(finished)
+        logging.info(f"Run {self.base_path} finished: {self.rows} rows, {self.frames} frames")
+
+
+class SenderHandler(socketserver.StreamRequestHandler):
+    """Receives the messages of one sender connection."""
+
+    def handle(self) -> None:
+        introduced = False
+        session = None
+        try:
+            while True:
+                message = read_message(self.rfile)
+                if message is None:
+                    break  # Disconnected; the run stays open until the sender reconnects and ends it
+                kind, sequence, payload = message
+                if kind == KIND_HELLO:
+                    # None for a run already finished, whose END acknowledgement got lost
+                    session = self.server.open_session(json.loads(payload))
+                    introduced = True
+                    continue
+                if not introduced:
+                    raise ValueError('Samples received before the run was introduced')
+                if kind == KIND_BATCH:
+                    if session is None:
+                        # Acknowledging would make the sender forget samples that were never stored
+                        raise ValueError(f'Batch {sequence} received for a run that is already finished')
+                    session.add_batch(sequence, *decode_batch(payload))
+                elif kind == KIND_END:
+                    if session is not None:
+                        self.server.close_session(session)
+                else:
+                    raise ValueError(f'Unknown message kind {kind}')
+                self.wfile.write(ACK.pack(sequence))
+                if kind == KIND_END:
+                    break
+        except (ValueError, zlib.error, OSError) as e:
+            logging.error(f"Dropping connection from {self.client_address}: {e}")
+
+
+class AggregatorMixIn:
+    """Keeps the open runs of all senders, shared by the connection threads."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = LISTEN_BACKLOG
+
+    def setup_aggregator(self, output_dir: str, catalog_path: str = None) -> None:
+        self.output_dir = output_dir
+        self.catalog_path = catalog_path or os.path.join(output_dir, 'catalog.sqlite')
+        self.sessions = {}
+        self.finished = set()
+        self.sessions_lock = threading.Lock()
+        self.catalog_lock = threading.Lock()
+
+    def open_session(self, meta: dict):
+        """Returns the session of a run, resuming it when a sender reconnects; None if the run is finished."""
+        key = run_key(meta)
+        with self.sessions_lock:
+            if key in self.finished:
+                return None
+            if key not in self.sessions:
+                if read_state(run_base_path(self.output_dir, meta)).get('finished'):
+                    self.finished.add(key)  # Finished before the aggregator restarted
+                    return None
+                self.sessions[key] = RunSession(self.output_dir, meta)
+                logging.info(f"Receiving run {meta.get('run')} ({key[1]}) from {key[0]}")
+            return self.sessions[key]
+
+    def close_session(self, session: RunSession) -> None:
+        """Finishes a run that was ended by its sender."""
+        with self.sessions_lock:
+            key = run_key(session.meta)
+            if self.sessions.pop(key, None) is None:
+                return  # Closed concurrently by another connection of the same sender
+            self.finished.add(key)
+        session.close(self.catalog_path, self.catalog_lock)
+
+    def close_all(self) -> None:
+        """Finishes every run still open, e.g. when the aggregator stops."""
+        with self.sessions_lock:
+            sessions, self.sessions = list(self.sessions.values()), {}
+        for session in sessions:
+            session.close(self.catalog_path, self.catalog_lock, finished=False)
+
+
+class TcpAggregator(AggregatorMixIn, socketserver.ThreadingTCPServer):
+    pass
+
+
+if hasattr(socketserver, 'ThreadingUnixStreamServer'):
+    class UnixAggregator(AggregatorMixIn, socketserver.ThreadingUnixStreamServer):
+        pass
+
+
+def create_aggregator(address: str, output_dir: str, catalog_path: str = None):
+    """Creates an aggregator listening on ``address``; call serve_forever() to run it."""
+    family, target = parse_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(target):
+            os.remove(target)  # Stale socket of a previous aggregator
+        server = UnixAggregator(target, SenderHandler)
+    else:
+        server = TcpAggregator(target, SenderHandler)
+    server.setup_aggregator(output_dir, catalog_path)
+    return server
+
+
+def simulate_sender(address: str, index: int, rate: float, duration: float) -> dict:
+    """Streams ``duration`` seconds of an emulated PMD at ``rate`` Hz, like one lab machine."""
+    from pmd_emulator import PMDEmulator
+    from pmd import decode_channel
+
+    emulator = PMDEmulator(seed=index)
+    sender = SampleSender(address, {'host': f'emulated-{index:02d}', 'run': time.strftime('%y%m%d-%H%M'),
+                                    'device': 'emulator', 'process_names': ['emulated']})
+    start = time.time()
+    next_tick = time.monotonic()
+    for i in range(int(duration * rate)):
+        timestamp = time.time()
+        frame = emulator.frame(timestamp - start)
+        voltage, current = decode_channel(frame)
+        sender.send_frame(frame, timestamp)
+        sender.send_row({'elapsed_time': timestamp - start, 'Power': voltage * current, 'Voltage': voltage,
+                         'Current': current})
+        next_tick += 1 / rate
+        time.sleep(max(next_tick - time.monotonic(), 0.0))
+    sender.close()
+    return sender.stats()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Collect samples of many monitored machines on one host.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help='Run the aggregator')
+    serve_parser.add_argument('--listen', default=DEFAULT_ADDRESS, help="'host:port' or 'unix:/path'")
+    serve_parser.add_argument('--output', default='./data/collected', help='Directory of the received runs')
+    serve_parser.add_argument('--catalog', help='Catalog database (default: <output>/catalog.sqlite)')
+
+    simulate_parser = subparsers.add_parser('simulate', help='Stream emulated PMDs to an aggregator')
+    simulate_parser.add_argument('--address', default=DEFAULT_ADDRESS, help="'host:port' or 'unix:/path'")
+    simulate_parser.add_argument('--senders', type=int, default=4, help='Number of emulated machines')
+    simulate_parser.add_argument('--rate', type=float, default=100.0, help='Samples per second per machine')
+    simulate_parser.add_argument('--duration', type=float, default=10.0, help='Seconds to stream')
+
+    args = parser.parse_args()
+    if args.command == 'serve':
+        server = create_aggregator(args.listen, args.output, args.catalog)
+        logging.info(f"Aggregator listening on {args.listen}, writing to {args.output}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            server.close_all()
+    else:
+        threads = [threading.Thread(target=simulate_sender, args=(args.address, i, args.rate, args.duration))
+                   for i in range(args.senders)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,146 @@
+import os
+import logging
+import warnings
+import argparse
+import numpy as np
+import pandas as pd
+from catalog import power_series, start_time_from_name
+from tscodec import read_measurements
+
+ALIGN_STEP = 1.0  # Seconds between two points of the common elapsed-time grid
+BLOCK_SECONDS = 30.0  # Length of the bootstrap blocks, keeping the autocorrelation of the power trace
+BOOTSTRAP_SAMPLES = 2000
+CONFIDENCE = 0.95
+SEED = 0  # Fixed seed so that repeated comparisons give the same intervals
+MIN_EFFECT = 0.02  # Smallest energy change, as a share of the baseline, reported as a regression or improvement
+BOOTSTRAP_CHUNK_ELEMENTS = 10_000_000  # Maximum number of drawn blocks held in memory at once
+
+
+def load_run(csv_path: str) -> tuple:
+    """Loads the (elapsed seconds from 0, power) series of a recording (CSV or .pmdts archive)."""
+    elapsed, power, _ = power_series(read_measurements(csv_path), start_time_from_name(csv_path))
+    return elapsed - elapsed[0], power
+
+
+def align_runs(runs: list, step: float = ALIGN_STEP) -> np.ndarray:
+    """Resamples every run on a common elapsed-time grid; shorter runs are padded with NaN.
+
+    Returns an array of shape (N runs, grid length).
+    """
+    length = int(max(elapsed[-1] for elapsed, _ in runs) // step) + 1
+    grid = np.arange(length) * step
+    aligned = np.full((len(runs), length), np.nan)
+    for i, (elapsed, power) in enumerate(runs):
+        inside = grid <= elapsed[-1]
+        aligned[i, inside] = np.interp(grid[inside], elapsed, power)
+    return aligned
+
+
+def block_means(aligned: np.ndarray, block: int) -> tuple:
+    """Averages the aligned runs over consecutive blocks; returns (N, M) means and the block count per run."""
+    n_runs, length = aligned.shape
+    n_blocks = length // block
+    blocks = aligned[:, :n_blocks * block].reshape(n_runs, n_blocks, block)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # Blocks past the end of shorter runs are all NaN
+        means = np.nanmean(blocks, axis=2) if n_blocks else np.empty((n_runs, 0))
+    counts = np.sum(np.isfinite(means), axis=1)
+    return means, counts
+
+
+def bootstrap_mean_power(aligned: np.ndarray, block: int, samples: int = BOOTSTRAP_SAMPLES,
+                         seed: int = SEED) -> np.ndarray:
+    """Block-bootstraps the mean power of every run at once; returns an array of shape (samples, N)."""
+    means, counts = block_means(aligned, block)
+    n_runs, n_blocks = means.shape
+    if n_blocks == 0 or np.any(counts == 0):
+        raise ValueError('Runs are too short for the bootstrap block length')
+
+    # Draw block indices for every run at once, each run only drawing from its own valid blocks;
+    # bootstrap samples are processed in chunks to bound the size of the (samples, N, M) arrays
+    rng = np.random.default_rng(seed)
+    mask = np.arange(n_blocks)[None, None, :] < counts[None, :, None]
+    chunk = max(BOOTSTRAP_CHUNK_ELEMENTS // (n_runs * n_blocks), 1)
+    result = np.empty((samples, n_runs))
+    for start in range(0, samples, chunk):
+        size = min(chunk, samples - start)
+        picks = (rng.random((size, n_runs, n_blocks)) * counts[None, :, None]).astype(np.int64)
+        drawn = np.take_along_axis(np.broadcast_to(means, (size, n_runs, n_blocks)), picks, axis=2)
+        result[start:start + size] = np.where(mask, drawn, 0.0).sum(axis=2) / counts[None, :]
+    return result
+
+
+def compare_runs(paths: list, labels: list = None, step: float = ALIGN_STEP, block_seconds: float = BLOCK_SECONDS,
+                 samples: int = BOOTSTRAP_SAMPLES, confidence: float = CONFIDENCE,
+                 min_effect: float = MIN_EFFECT) -> pd.DataFrame:
+    """Compares the energy and mean power of N runs against the first one (the baseline).
+
+    Energies are the block-averaged mean power times the run duration, the statistic the bootstrap
+    resamples, so each estimate lies within its own interval. A run is flagged as a regression (or
+    an improvement) when the confidence interval of its energy difference with the baseline lies
+    entirely above (or below) ``min_effect`` of the baseline energy. The interval only covers the
+    measurement noise within each run, not the variation between repeated runs of the workload,
+    which is why changes smaller than ``min_effect`` are never flagged.
+    """
+    labels = labels or [os.path.basename(path) for path in paths]
+    runs = [load_run(path) for path in paths]
+    aligned = align_runs(runs, step)
+    block = max(int(block_seconds // step), 1)
+
+    durations = np.array([elapsed[-1] for elapsed, _ in runs])
+    means, counts = block_means(aligned, block)
+    mean_power = np.nansum(means, axis=1) / np.maximum(counts, 1)
+    energies = mean_power * durations
+
+    boot_power = bootstrap_mean_power(aligned, block, samples)
+    boot_energy = boot_power * durations[None, :]
+    boot_diff = boot_energy - boot_energy[:, :1]
+
+    low_q, high_q = (1 - confidence) / 2, 1 - (1 - confidence) / 2
+    power_ci = np.quantile(boot_power, [low_q, high_q], axis=0)
+    energy_ci = np.quantile(boot_energy, [low_q, high_q], axis=0)
+    diff_ci = np.quantile(boot_diff, [low_q, high_q], axis=0)
+
+    threshold = min_effect * energies[0]
+    status = np.where(diff_ci[0] > threshold, 'regression', np.where(diff_ci[1] < -threshold, 'improvement', 'unchanged'))
+    status[0] = 'baseline'
+
+    return pd.DataFrame({
+        'Duration (min)': durations / 60,
+        'Mean Power (W)': mean_power,
+        'Power CI low (W)': power_ci[0],
+        'Power CI high (W)': power_ci[1],
+        'Total Energy (kWh)': energies / 3.6e6,
+        'Energy CI low (kWh)': energy_ci[0] / 3.6e6,
+        'Energy CI high (kWh)': energy_ci[1] / 3.6e6,
+        'Energy change (%)': 100 * (energies - energies[0]) / energies[0],
+        'Status': status,
+    }, index=labels)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Compare the energy of several runs of the same workload.')
+    parser.add_argument('paths', nargs='+', help='Measurement CSVs, the first one being the baseline')
+    parser.add_argument('--labels', nargs='+', help='Run labels used in the table')
+    parser.add_argument('--block', type=float, default=BLOCK_SECONDS, help='Bootstrap block length (s)')
+    parser.add_argument('--samples', type=int, default=BOOTSTRAP_SAMPLES, help='Bootstrap samples')
+    parser.add_argument('--confidence', type=float, default=CONFIDENCE, help='Confidence level')
+    parser.add_argument('--min-effect', type=float, default=MIN_EFFECT,
+                        help='Smallest energy change flagged, as a share of the baseline (the intervals cover measurement noise only)')
+    parser.add_argument('--output', default='./data/comparison.tex', help='LaTeX table to write')
+    args = parser.parse_args()
+
+    comparison = compare_runs(args.paths, args.labels, block_seconds=args.block, samples=args.samples,
+                              confidence=args.confidence, min_effect=args.min_effect)
+    print(comparison.to_string())
+
+    for label in comparison.index[comparison['Status'] == 'regression']:
+        logging.warning(f"Significant energy regression in {label}: "
+                        f"{comparison.loc[label, 'Energy change (%)']:+.1f}% vs {comparison.index[0]}")
+
+    # Save the combined table as a LaTeX file, like the per-run statistics
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    comparison.to_latex(args.output)
+    logging.info(f"Comparison saved to {args.output}")
@@ -1,10 +1,18 @@
 import pandas as pd
 import matplotlib.pyplot as plt
-import seaborn as sns
+import os
+from rollups import rollup_path, read_rollup
+from catalog import index_csv
+from timeindex import load_range
 
 # Load the dataset (adjust the file path as necessary)
 csv_path = 'data/240924-0923_sop_ft533.csv'
-df = pd.read_csv(csv_path)
+TIME_RANGE = None  # (start, end) in seconds to only load a window of a long recording, e.g. (312 * 60, 313 * 60)
+
+if TIME_RANGE is None:
+    df = pd.read_csv(csv_path)
+else:
+    df = load_range(csv_path, *TIME_RANGE)  # Seeks straight to the window through the time index
 
 # Ensure 'elapsed_time' is in the dataset
 if 'elapsed_time' not in df.columns:
@@ -45,6 +53,9 @@ ax3.grid(True)
 # Adjust layout to prevent overlap
 plt.tight_layout()
 
+# seaborn is only needed for the distribution plots below, so it is imported here
+import seaborn as sns
+
 # Plot 2: Boxplot of Power
 plt.figure(figsize=(10, 6))
 sns.boxplot(data=df[['Power']], palette="Blues")
@@ -66,15 +77,24 @@ plt.title('Histogram of Power')
 plt.xlabel('Power (W)')
 plt.ylabel('Frequency')
 
-# Resample data to get the average power per minute (elapsed time in seconds)
-df_resampled = df.resample('60s').mean()
-
-# Drop NaN values from the resampled data (to ensure valid values for plotting)
-df_resampled = df_resampled.dropna(subset=['Power'])
+# Use the 60 s rollup written by the monitor when available, otherwise resample the raw samples
+rollup_base = os.path.splitext(csv_path)[0]
+if os.path.exists(rollup_path(rollup_base, 60)):
+    df_rollup = read_rollup(rollup_base, 60)
+    minutes = df_rollup['bucket_start'] / 60
+    average_power = df_rollup['Power_mean']
+else:
+    # Resample data to get the average power per minute (elapsed time in seconds)
+    df_resampled = df.resample('60s').mean()
+
+    # Drop NaN values from the resampled data (to ensure valid values for plotting)
+    df_resampled = df_resampled.dropna(subset=['Power'])
+    minutes = df_resampled.index.total_seconds() / 60
+    average_power = df_resampled['Power']
 
 # Plot 5: Average power per minute
 plt.figure(figsize=(10, 6))
-plt.plot(df_resampled.index.total_seconds() / 60, df_resampled['Power'], color='red', label='Average Power (W)')
+plt.plot(minutes, average_power, color='red', label='Average Power (W)')
 plt.title('Average Power per Minute')
 plt.xlabel('Elapsed Time (minutes)')
 plt.ylabel('Average Power (W)')
@@ -120,3 +140,6 @@ stats_summary = pd.concat([stats_summary, energy_row_clean, elapsed_time_row_cle
 # Save the statistical summary as a LaTeX file
 latex_path = f'{csv_path}.tex'
 stats_summary.to_latex(latex_path)
+
+# Register the analysis output in the run catalog
+index_csv(csv_path, tex_path=latex_path)
@@ -0,0 +1,126 @@
+import os
+import logging
+import argparse
+import pandas as pd
+import matplotlib.pyplot as plt
+from rollups import ROLLUP_TIERS, RollupWriter, rollup_path, select_tier
+from timeindex import load_range
+
+RAW_POINTS_PER_PIXEL = 2  # Draw raw samples when at most this many fall on each pixel column
+ROLLUP_CHUNK_SIZE = 100_000  # Rows read at once when building missing rollup tiers
+FIELDS = [('Power', 'Power [W]', 'red'), ('Voltage', 'Voltage [V]', 'blue'), ('Current', 'Current [A]', 'green')]
+
+
+def ensure_rollups(csv_path: str) -> str:
+    """Builds the rollup tiers of a recording in one chunked pass if they are missing; returns their base path."""
+    base_path = os.path.splitext(csv_path)[0]
+    if all(os.path.exists(rollup_path(base_path, seconds)) for seconds in ROLLUP_TIERS):
+        return base_path
+
+    logging.info(f"Building rollup tiers of {csv_path}...")
+    writer = RollupWriter(base_path)
+    for chunk in pd.read_csv(csv_path, usecols=['elapsed_time', 'Power', 'Voltage', 'Current'],
+                             chunksize=ROLLUP_CHUNK_SIZE):
+        writer.add_many(*(chunk[c].to_numpy(dtype=float) for c in ('elapsed_time', 'Power', 'Voltage', 'Current')))
+    writer.close()
+    return base_path
+
+
+class HistoryViewer:
+    """Zoomable viewer that only loads the visible time range at screen resolution.
+
+    Every pan or zoom requests the visible window from the smallest rollup tier giving about one
+    bucket per pixel, or from the raw samples through the time index once zoomed in far enough.
+    Only the data of the current view is held in memory.
+    """
+
+    def __init__(self, csv_path: str):
+        self.csv_path = csv_path
+        self.base_path = ensure_rollups(csv_path)
+
+        # Overall extent of the recording from the (small) coarsest tier
+        coarsest = max(ROLLUP_TIERS)
+        extent = pd.read_csv(rollup_path(self.base_path, coarsest), usecols=['bucket_start', 'samples'])
+        self.start = float(extent['bucket_start'].min())
+        self.end = float(extent['bucket_start'].max()) + coarsest
+        self.sample_rate = extent['samples'].sum() / max(self.end - self.start, 1e-9)
+
+        plt.style.use('ggplot')
+        self.fig, self.axes = plt.subplots(len(FIELDS), 1, sharex=True, figsize=(12, 8))
+        self.fig.suptitle(os.path.basename(csv_path), fontsize=14)
+        self.lines = {}
+        self.envelopes = {}
+        for ax, (field, label, color) in zip(self.axes, FIELDS):
+            self.lines[field], = ax.plot([], [], color=color, linewidth=1)
+            ax.set_ylabel(label, fontsize=10, color=color)
+            ax.grid(True, which='both', linestyle='--', linewidth=0.5)
+            ax.set_autoscale_on(False)  # Limits are driven by the view, never by the loaded data
+        self.axes[-1].set_xlabel('Elapsed Time')
+        self.axes[-1].xaxis.set_major_formatter(plt.FuncFormatter(lambda x, _: f'{int(x // 3600)}h {int(x % 3600 // 60)}m {int(x % 60)}s'))
+        self.status = self.fig.text(0.01, 0.01, '', fontsize=9)
+        self._updating = False
+
+        self.axes[0].callbacks.connect('xlim_changed', self.on_xlim_changed)
+        self.axes[0].set_xlim(self.start, self.end)
+
+    def visible_data(self, t0: float, t1: float) -> tuple:
+        """Returns the data of the visible window and the tier it came from (0 for raw samples)."""
+        pixels = max(int(self.axes[0].get_window_extent().width), 1)
+        t0, t1 = max(t0, self.start), min(t1, self.end)
+        if (t1 - t0) * self.sample_rate <= pixels * RAW_POINTS_PER_PIXEL:
+            return load_range(self.csv_path, t0, t1, absolute=True), 0
+
+        seconds = select_tier(t1 - t0, pixels)
+        # Widen the window by one bucket so the envelope reaches the edges of the axes
+        window = load_range(rollup_path(self.base_path, seconds), t0 - seconds, t1, absolute=True)
+        return window, seconds
+
+    def on_xlim_changed(self, ax) -> None:
+        """Reloads the visible time range after a pan or zoom."""
+        if self._updating:
+            return
+        self._updating = True
+        try:
+            self.redraw(*ax.get_xlim())
+        finally:
+            self._updating = False
+
+    def redraw(self, t0: float, t1: float) -> None:
+        """Replaces the plotted data with the window between ``t0`` and ``t1``."""
+        data, seconds = self.visible_data(t0, t1)
+
+        for envelope in self.envelopes.values():
+            envelope.remove()
+        self.envelopes.clear()
+
+        for axis, (field, _, color) in zip(self.axes, FIELDS):
+            if seconds == 0:
+                self.lines[field].set_data(data['elapsed_time'], data[field])
+            else:
+                x = data['bucket_start'] + seconds / 2
+                self.lines[field].set_data(x, data[f'{field}_mean'])
+                self.envelopes[field] = axis.fill_between(x, data[f'{field}_min'], data[f'{field}_max'],
+                                                          color=color, alpha=0.2, linewidth=0)
+            if len(data):
+                low = data[field].min() if seconds == 0 else data[f'{field}_min'].min()
+                high = data[field].max() if seconds == 0 else data[f'{field}_max'].max()
+                margin = (high - low) * 0.05 + 1e-6  # Small buffer to avoid singular transformations
+                axis.set_ylim(low - margin, high + margin)
+
+        source = 'raw samples' if seconds == 0 else f'{seconds} s rollup'
+        self.status.set_text(f'{len(data)} points from {source}')
+        self.fig.canvas.draw_idle()
+
+    def show(self) -> None:
+        """Opens the interactive window."""
+        plt.show()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Navigate long power recordings interactively.')
+    parser.add_argument('path', help='Measurements CSV with an elapsed_time column')
+    args = parser.parse_args()
+
+    HistoryViewer(args.path).show()
@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import signal
+import platform
+import subprocess
+from datetime import datetime
+import psutil
+from pmd import PMD_SETTINGS, FrameReader, check_connection, open_pmd, power_source, decode_channel
+from attribution import ProcessAttribution, attribution_columns
+from procstat import ProcStatReader, PROC_STAT_AVAILABLE
+from power_models import evaluate_power_model, DEFAULT_POWER_MODEL, POWER_MODELS
+from calibration import load_baseline, baseline_power, read_cpu_frequency
+from recorder import Recorder
+from rollups import RollupWriter
+from segment_log import SegmentLog, log_directory, log_meta, export_csv
+from catalog import index_csv
+from adaptive_sampling import AdaptiveScheduler, MAX_INTERVAL
+
+SAMPLE_INTERVAL = 0.1  # Seconds between two samples while the workload runs
+TREE_RESCAN_INTERVAL = 0.5  # Seconds between two walks of the workload's process tree
+STOP_TIMEOUT = 10.0  # Seconds an interrupted workload gets to exit before it is killed
+
+
+def stop_workload(process: subprocess.Popen, timeout: float = STOP_TIMEOUT) -> None:
+    """Forwards an interrupt to the workload and waits for it to exit, killing it if it does not."""
+    if process.poll() is None:
+        logging.warning(f"Interrupted, stopping PID {process.pid}")
+        if os.name == 'nt':
+            process.terminate()  # Windows only delivers Ctrl-C to whole console process groups
+        else:
+            process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout)
+    except (subprocess.TimeoutExpired, KeyboardInterrupt):
+        logging.warning(f"PID {process.pid} did not exit, killing it")
+        process.kill()
+        process.wait()
+
+
+def run_workload(command: list, interval: float = SAMPLE_INTERVAL, power_model: str = DEFAULT_POWER_MODEL,
+                 name: str = None, output_dir: str = './data', max_interval: float = None) -> dict:
+    """Spawns ``command``, records its power while it runs and returns its energy summary.
+
+    Power is attributed to the process tree rooted at the exact PID of the spawned command, so no
+    process-name matching is involved, and the recording starts and stops with the job. With
+    ``max_interval``, sampling is adaptive between ``interval`` and ``max_interval`` seconds.
+    Samples are streamed to a segment log and the energy is integrated as they arrive, so memory
+    does not grow with the length of the job. An interrupt (Ctrl-C) stops the job and still writes
+    the measurements, summary and catalog entry of what ran.
+    """
+    date_name = datetime.now().strftime('%y%m%d-%H%M')
+    base_path = os.path.join(output_dir, f'{date_name}_{name or os.path.basename(command[0])}')
+    host = platform.node()
+    baseline_profile = load_baseline(host, PMD_SETTINGS['port'])
+
+    samples_taken = 0
+    package_energy = attributed_energy = 0.0
+    last = None  # (elapsed_time, package power, attributed power) of the previous sample
+    scheduler = AdaptiveScheduler(interval, max_interval) if max_interval else None
+    frame_reader = FrameReader()
+    with open_pmd() as ser:
+        process = subprocess.Popen(command)
+        start_time = time.time()
+        logging.info(f"Started {' '.join(command)} with PID {process.pid}")
+
+        attribution = ProcessAttribution(root_pids=[process.pid], rescan_interval=TREE_RESCAN_INTERVAL,
+                                         cpu_times=ProcStatReader() if PROC_STAT_AVAILABLE else None)
+        meta = {'start_time': start_time, 'host': host, 'device': PMD_SETTINGS['port'], 'source': power_source(),
+                'command': command, 'root_pid': process.pid, 'power_model': power_model}
+        recorder = Recorder(f'{base_path}_raw.pmdrec', meta)
+        rollup_writer = RollupWriter(base_path)
+        segment_log = SegmentLog(log_directory(base_path), log_meta('launcher', **meta))
+        psutil.cpu_percent(interval=None)  # Prime the system-wide CPU counter used by the baseline
+
+        interrupted = False
+        try:
+            next_tick = time.monotonic()
+            while True:
+                # Take one last sample after the command exited so its final interval is accounted
+                finished = process.poll() is not None
+
+                read_bytes = frame_reader.read(ser)
+                timestamp = time.time()
+                if read_bytes is None:
+                    # No sample rather than a bogus one; the energy is integrated over the gap
+                    recorder.write_gap(timestamp, frame_reader.last_error, attempts=frame_reader.retries + 1)
+                    if finished:
+                        break
+                    next_tick += scheduler.interval if scheduler is not None else interval
+                    time.sleep(max(next_tick - time.monotonic(), 0.0))
+                    continue
+                voltage_value, current_value = decode_channel(read_bytes)
+                samples = {'Voltage': voltage_value, 'Current': current_value}
+                cpu_freq, load = read_cpu_frequency(), psutil.cpu_percent(interval=None)
+                samples.update(system_usage=load, cpu_freq=cpu_freq)  # Read by the dvfs_leakage model
+                if baseline_profile is not None:
+                    samples['baseline_power'] = float(baseline_power(baseline_profile, cpu_freq, load))
+
+                # The modelled power of the job is split over its tree, so the group columns sum to it
+                def attributed_power(share: float, rss: float) -> float:
+                    samples['cpu_usage'] = 100 * share
+                    return float(evaluate_power_model(power_model, samples))
+
+                result = attribution.sample(voltage_value * current_value, timestamp, attributed_power)
+                power_value = result['power']
+                elapsed_time = timestamp - start_time
+
+                recorder.write_frame(read_bytes, timestamp)
+                recorder.write_snapshot(timestamp, samples['cpu_usage'], float('nan'), cpu_freq=cpu_freq, load=load,
+                                        **attribution.last_snapshot)
+                rollup_writer.add(elapsed_time, power_value, voltage_value, current_value)
+                segment_log.append_row(dict(elapsed_time=elapsed_time, Power=power_value, Voltage=voltage_value,
+                                            Current=current_value, cpu_usage=samples['cpu_usage'],
+                                            baseline_power=samples.get('baseline_power'), **attribution_columns(result)))
+
+                # Trapezoidal integration, as integrate_energy over the whole run would do
+                package_power = voltage_value * current_value
+                if last is not None:
+                    dt = elapsed_time - last[0]
+                    package_energy += (package_power + last[1]) / 2 * dt
+                    attributed_energy += (power_value + last[2]) / 2 * dt
+                last = (elapsed_time, package_power, power_value)
+                samples_taken += 1
+
+                if finished:
+                    break
+                next_tick += scheduler.update(timestamp, voltage_value * current_value, samples['cpu_usage']) \
+                    if scheduler is not None else interval
+                time.sleep(max(next_tick - time.monotonic(), 0.0))
+        except KeyboardInterrupt:
+            interrupted = True  # Ctrl-C: what was measured is written like for a normal exit
+        finally:
+            stop_workload(process)  # Never leave the job running behind a failed or interrupted monitor
+            recorder.close()
+            rollup_writer.close()
+            segment_log.close()
+
+    csv_path = f'{base_path}.csv'
+    if samples_taken:
+        export_csv(segment_log.directory, csv_path)
+    else:
+        # Every read failed or the job exited before the first sample; the summary still tells so
+        logging.warning(f"No valid sample was taken while {' '.join(command)} ran, no measurements written.")
+        csv_path = None
+
+    summary = {
+        'command': command,
+        'exit_code': process.returncode,
+        'interrupted': interrupted,
+        'start_time': datetime.fromtimestamp(start_time).isoformat(timespec='seconds'),
+        'duration_s': last[0] if last is not None else 0.0,
+        'samples': samples_taken,
+        'adaptive_sampling': scheduler.stats() if scheduler is not None else None,
+        'frame_reads': frame_reader.stats(),
+        'power_model': power_model,
+        'source': meta['source'],
+        'package_energy_j': package_energy,
+        'attributed_energy_j': attributed_energy,
+        'group_energy_j': attribution.group_energy,
+        'pid_energy_j': {str(pid): energy for pid, energy in attribution.pid_energy.items()},
+        'csv_path': csv_path,
+        'raw_path': recorder.path,
+    }
+    with open(f'{base_path}_summary.json', 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    if csv_path is not None:
+        index_csv(csv_path, host, list(attribution.group_energy), raw_path=recorder.path,
+                  path=os.path.join(output_dir, 'catalog.sqlite'), source=meta['source'])
+    logging.info(f"{' '.join(command)} exited with code {process.returncode} after {summary['duration_s']:.1f} s: "
+                 f"{summary['attributed_energy_j']:.1f} J attributed of {summary['package_energy_j']:.1f} J measured")
+    return summary
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Run a command and measure its energy from start to exit.')
+    parser.add_argument('--interval', type=float, default=SAMPLE_INTERVAL, help='Seconds between samples')
+    parser.add_argument('--adaptive', nargs='?', type=float, const=MAX_INTERVAL, metavar='MAX_INTERVAL',
+                        help='Sample adaptively between --interval and MAX_INTERVAL seconds')
+    parser.add_argument('--model', default=DEFAULT_POWER_MODEL, choices=list(POWER_MODELS), help='Power model')
+    parser.add_argument('--name', help='Run name used in the output file names')
+    parser.add_argument('command', nargs=argparse.REMAINDER, help='Command to run, e.g. -- matlab -batch job')
+    args = parser.parse_args()
+
+    command = args.command[1:] if args.command[:1] == ['--'] else args.command
+    if not command:
+        parser.error('No command given')
+
+    check_connection()
+    if PMD_SETTINGS['port'] is None:
+        sys.exit(1)
+
+    sys.exit(run_workload(command, args.interval, args.model, args.name, max_interval=args.adaptive)['exit_code'])
@@ -2,7 +2,6 @@ import time
 import serial
 import psutil
 import platform
-import serial.tools.list_ports
 from datetime import datetime
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -11,33 +10,37 @@ import matplotlib.dates as mdates
 import matplotlib.gridspec as gridspec
 import logging
 import os
+from pmd import IS_LINUX, PMD_SETTINGS, FrameReader, list_ports, check_connection, open_pmd, power_source, decode_channel
+from procstat import ProcStatCpuShare, PROC_STAT_AVAILABLE
+from power_models import evaluate_power_model
+from catalog import index_csv
+from memory_budget import MemoryBudget, dataframe_bytes, rows_to_free
+from segment_log import SegmentLog, log_directory, log_meta, export_csv
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Detect operating system
-IS_WINDOWS = platform.system() == 'Windows'
-IS_LINUX = platform.system() == 'Linux'
-
-# Settings for the Elmor Labs PMD sensor connection
-PMD_SETTINGS = {
-    'port': None,  # Dynamically assigned
-    'baudrate': 115200,
-    'bytesize': 8,
-    'stopbits': 1,
-    'timeout': 1,
-}
-
 # Configuration flags
 LIST_ALL_WINDOWS_PORTS = True  # Set to True to list all available COM ports
 SAVE_TO_CSV = True  # Set to True to save the power data to a CSV file
 MAX_LENGTH = 1000  # Maximum number of data points to retain in memory
+MEMORY_BUDGET_MB = 64  # The oldest data points are dropped earlier if they exceed this budget
+FOOTPRINT_LOG_INTERVAL = 60  # Seconds between two memory footprint reports in the log
 PROCESS_NAMES = ['rstudio.exe', 'rsession-utf8.exe']
+POWER_MODEL = 'linear_cpu'  # Name of the power model used to attribute power (see power_models.py)
 NUM_CORES = psutil.cpu_count()  # Get the number of CPU cores
+USE_PROC_STAT = IS_LINUX and PROC_STAT_AVAILABLE  # Use the /proc jiffies backend instead of psutil.cpu_percent
+
+frame_reader = FrameReader()  # Validates the frames read by this script and counts the dropped ones
+
+# Fast Linux backend returning the CPU share of the target processes directly from /proc
+cpu_share_sampler = ProcStatCpuShare(PROCESS_NAMES) if USE_PROC_STAT else None
 
 # Initialize a global DataFrame for storing sensor data
 df = pd.DataFrame(columns=['timestamp', 'id', 'unit', 'Power', 'Voltage', 'Current'])
 date_name = datetime.now().strftime('%y%m%d-%H%M')
+last_footprint_log = time.time()
+segment_log = None  # Crash-safe log of the measurements, opened at startup and exported to CSV at exit
 
 # Define global variables for plot axes
 voltage_ax = None
@@ -45,40 +48,6 @@ current_ax = None
 power_ax = None
 
 
-def list_ports():
-    """Lists all available COM or ttyUSB ports."""
-    ports = list(serial.tools.list_ports.comports())
-    print('Available ports:')
-    for p in ports:
-        print(f'{p.device} - {p.description}')
-    print()
-
-
-def detect_serial_port():
-    """Detects the serial port based on the operating system and device description."""
-    ports = list(serial.tools.list_ports.comports())
-
-    # Define the target device description (e.g., USB-SERIAL CH340)
-    target_device_description = ['USB-SERIAL', 'USB Serial']
-
-    if IS_WINDOWS:
-        # For Windows, look for a device matching the target descriptions
-        for port in ports:
-            if any(desc in port.description for desc in target_device_description):
-                return port.device  # Return COMx port for Windows
-
-    elif IS_LINUX:
-        # For Linux, look for devices like /dev/ttyUSBx or /dev/ttySx
-        for port in ports:
-            # Check description and device name (typically /dev/ttyUSBx or /dev/ttySx)
-            if any(desc in port.description for desc in target_device_description):
-                return port.device  # Return /dev/ttyUSBx or /dev/ttySx for Linux
-
-    print("No appropriate port found. Listing available ports:")
-    list_ports()  # List all ports for debugging
-    return None  # If no suitable port is found
-
-
 def get_cpu_usage(process_names: list) -> float:
     """Gets the combined CPU usage of a list of processes."""
     total_cpu_usage = 0.0
@@ -104,29 +73,6 @@ def normalize_cpu_usage(cpu_usage: float, num_cores: int) -> float:
     return normalized
 
 
-def check_connection() -> None:
-    """Checks the connection with the Elmor Labs PMD sensor."""
-    PMD_SETTINGS['port'] = detect_serial_port()
-
-    if PMD_SETTINGS['port'] is None:
-        logging.error("No serial port detected.")
-        return
-
-    try:
-        with serial.Serial(**PMD_SETTINGS) as ser:
-            ser.write(b'\x00')  # Send a command to the sensor
-            ser.flush()  # Ensure all data is sent
-            read_bytes = ser.read(18)  # Read the welcome message
-            assert read_bytes == b'ElmorLabs PMD-USB', "Incorrect welcome message received"
-
-            ser.write(b'\x02')  # Send another command to the sensor
-            ser.flush()
-            ser.read(100)  # Read additional data
-        logging.info("Connection with PMD sensor established successfully.")
-    except (serial.SerialException, AssertionError) as e:
-        logging.error(f"Failed to establish connection with PMD sensor: {e}")
-
-
 def get_new_sensor_values() -> pd.DataFrame:
     """Gets new sensor values from the Elmor Labs PMD and stores them in a DataFrame."""
     if PMD_SETTINGS['port'] is None:
@@ -134,26 +80,31 @@ def get_new_sensor_values() -> pd.DataFrame:
         return pd.DataFrame()
 
     try:
-        with serial.Serial(**PMD_SETTINGS) as ser:
-            command = b'\x03'  # Command to request sensor data
-            ser.write(command)  # Send the command
-            ser.flush()  # Ensure all data is sent
-            read_bytes = ser.read(16)  # Read sensor data
+        with open_pmd() as ser:
+            read_bytes = frame_reader.read(ser)  # Request and read a validated sensor data frame
 
         # Capture the current timestamp
         timestamp = pd.Timestamp(datetime.now())
 
+        # Leave a gap rather than decode a short or corrupt frame into bogus power readings;
+        # the energy is integrated over the missing samples
+        if read_bytes is None:
+            logging.warning(f"No valid frame after {frame_reader.retries + 1} attempts ({frame_reader.last_error}), "
+                            f"gap at {timestamp}.")
+            return pd.DataFrame()
+
         # Process the received sensor data
-        i = 2  # Index for reading values
         name = 'EPS1'  # Sensor name
-        voltage_value = int.from_bytes(read_bytes[i * 4:i * 4 + 2], byteorder='little') * 0.01
-        current_value = int.from_bytes(read_bytes[i * 4 + 2:i * 4 + 4], byteorder='little') * 0.1
+        voltage_value, current_value = decode_channel(read_bytes)
 
         # Get CPU usage for the list of processes
-        cpu_usage = get_cpu_usage(PROCESS_NAMES)
-        cpu_usage_normalized = normalize_cpu_usage(cpu_usage, NUM_CORES)
-        power_value = max((voltage_value * current_value * cpu_usage_normalized) / 100, 0.0)
-        power_value = round(power_value, 4)
+        if cpu_share_sampler is not None:
+            cpu_usage_normalized = cpu_share_sampler.sample()['cpu_usage']  # Already a share of the machine
+        else:
+            cpu_usage = get_cpu_usage(PROCESS_NAMES)
+            cpu_usage_normalized = normalize_cpu_usage(cpu_usage, NUM_CORES)
+        samples = {'Voltage': voltage_value, 'Current': current_value, 'cpu_usage': cpu_usage_normalized}
+        power_value = round(float(evaluate_power_model(POWER_MODEL, samples)), 4)
 
         logging.debug(f"Collected data - Power: {power_value} W, Voltage: {voltage_value} V, Current: {current_value} A")
 
@@ -174,9 +125,19 @@ def get_new_sensor_values() -> pd.DataFrame:
         logging.error(f"Serial communication error: {e}")
         return pd.DataFrame()
 
+def drop_history(bytes_to_free: int) -> None:
+    """Drops the oldest data points to free about ``bytes_to_free`` bytes."""
+    global df
+    df = df.iloc[rows_to_free(df, bytes_to_free):]
+
+
+memory_budget = MemoryBudget(MEMORY_BUDGET_MB)
+memory_budget.register('history', lambda: dataframe_bytes(df), drop_history)
+
+
 def animation_update(frame):
     """Updates the plot with new sensor data."""
-    global df
+    global df, last_footprint_log
 
     # Get new sensor data
     df_new_data = get_new_sensor_values()
@@ -185,16 +146,27 @@ def animation_update(frame):
     df_new_data_clean = df_new_data.dropna(how='all').dropna(axis=1, how='all')
 
     if not df_new_data_clean.empty and df_new_data_clean.shape[1] > 0:
+        # Trim DataFrame before concatenating so it never holds more than MAX_LENGTH rows
+        keep = MAX_LENGTH - len(df_new_data_clean)
+        if df.shape[0] > keep:
+            df = df.iloc[-keep:] if keep > 0 else df.iloc[:0]
+            logging.debug("DataFrame trimmed to maintain maximum length.")
+
         # Concatenate only if the DataFrame is not empty after cleaning
         df = pd.concat([df, df_new_data_clean], ignore_index=True)
         logging.debug("New valid data appended to DataFrame.")
+
+        # Persist the new samples; the whole history is kept on disk even though df is trimmed
+        if segment_log is not None:
+            save_data_to_log(df_new_data_clean)
     else:
         logging.debug("No valid new data to append.")
 
-    # Trim DataFrame to the last MAX_LENGTH rows if necessary
-    if df.shape[0] > MAX_LENGTH:
-        df = df.iloc[-MAX_LENGTH:]
-        logging.debug("DataFrame trimmed to maintain maximum length.")
+    # Keep the history within the memory budget and report the footprint from time to time
+    memory_budget.enforce()
+    if time.time() - last_footprint_log >= FOOTPRINT_LOG_INTERVAL:
+        logging.info(memory_budget.describe())
+        last_footprint_log = time.time()
 
     # Prepare data for plotting
     df_power_plot = df[df.unit == 'P'].pivot(columns=['id'], index='timestamp', values='Power')
@@ -260,27 +232,17 @@ def animation_update(frame):
     # Tighten layout to avoid overlapping
     fig.tight_layout()
 
-    # Save data to CSV if enabled
-    if SAVE_TO_CSV:
-        save_data_to_csv(df)
-
 
-def save_data_to_csv(df: pd.DataFrame) -> None:
-    """Saves the power data to a CSV file."""
-    global date_name
+def save_data_to_log(df_new: pd.DataFrame) -> None:
+    """Appends new power data to the segment log; rows already written are never rewritten."""
     try:
-        # Ensure the 'data' directory exists
-        os.makedirs('./data', exist_ok=True)
-
         # Filter only for valid Power entries
-        df_power = df[['timestamp', 'id', 'unit', 'Power']].dropna(subset=['Power'])
-
-        # Save to CSV
-        file_path = f'./data/{date_name}_measurements.csv'  # Use a generic path
-        df_power.to_csv(file_path, mode='w', header=True, index=False)
-        logging.info(f"Data saved to {file_path}")
+        df_power = df_new.reindex(columns=['timestamp', 'id', 'unit', 'Power']).dropna(subset=['Power'])
+        for row in df_power.to_dict('records'):
+            segment_log.append_row(row)
+        logging.debug(f"{len(df_power)} rows appended to {segment_log.directory}")
     except Exception as e:
-        logging.error(f"Error saving power data to CSV: {e}")
+        logging.error(f"Error saving power data to the segment log: {e}")
 
 
 if __name__ == "__main__":
@@ -289,6 +251,13 @@ if __name__ == "__main__":
 
     check_connection()
 
+    # Ensure the 'data' directory exists and open the log of this run
+    os.makedirs('./data', exist_ok=True)
+    if SAVE_TO_CSV:
+        # Tagged so that main_v2 never tries to resume it; this script starts a new log every run
+        segment_log = SegmentLog(log_directory(f'./data/{date_name}_measurements'), log_meta('main', date_name=date_name,
+                                                                                          source=power_source()))
+
     plt.style.use('ggplot')
 
     # Define and adjust figure with gridspec for different subplot sizes
@@ -303,3 +272,12 @@ if __name__ == "__main__":
     fig.tight_layout()
     fig.subplots_adjust(left=0.09)
     plt.show()
+    logging.info(f"Frame reads: {frame_reader.stats()}")
+
+    # Materialize the measurements CSV from the segment log, then register the finished run in the catalog
+    csv_path = f'./data/{date_name}_measurements.csv'
+    if segment_log is not None:
+        segment_log.close()
+        export_csv(segment_log.directory, csv_path)
+    if SAVE_TO_CSV and os.path.exists(csv_path):
+        index_csv(csv_path, platform.node(), PROCESS_NAMES, source=power_source())
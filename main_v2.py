@@ -2,7 +2,6 @@ import time
 import serial
 import psutil
 import platform
-import serial.tools.list_ports
 from datetime import datetime
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -11,77 +10,103 @@ import matplotlib.dates as mdates
 import matplotlib.gridspec as gridspec
 import logging
 import os
+from pmd import (IS_LINUX, PMD_SETTINGS, EPS1_CHANNEL, FrameReader, list_ports, check_connection, open_pmd, power_source,
+                 decode_channel, decode_frames)
 from collections import deque
+from attribution import ProcessAttribution, attribution_columns, pid_energy_path, write_pid_energy
+from procstat import ProcStatCpuShare, ProcStatReader, PROC_STAT_AVAILABLE
+from power_models import evaluate_power_model
+from calibration import load_baseline, baseline_power, read_cpu_frequency
+from recorder import Recorder
+from rollups import RollupWriter, resume_rollups
+from catalog import index_csv
+from memory_budget import MemoryBudget, dataframe_bytes, rows_to_free
+from segment_log import SegmentLog, log_directory, log_meta, find_unfinished_log, iter_rows, export_csv
+from collector import SampleSender
+from shm_pipeline import AcquisitionPipeline
+from adaptive_sampling import AdaptiveScheduler
+from tscodec import archive_csv
+from alerts import AlertEngine, default_rules, load_rules
+from metrics import MetricsRegistry, start_metrics_server
+from telemetry import TelemetrySampler, TELEMETRY_COLUMNS, telemetry_columns
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 start_time = time.time()  # Store the starting time of the script
 
-# Detect operating system
-IS_WINDOWS = platform.system() == 'Windows'
-IS_LINUX = platform.system() == 'Linux'
-
-# Settings for the Elmor Labs PMD sensor connection
-PMD_SETTINGS = {
-    'port': None,  # Dynamically assigned
-    'baudrate': 115200,
-    'bytesize': 8,
-    'stopbits': 1,
-    'timeout': 1,
-}
-
 # Configuration flags
 LIST_ALL_WINDOWS_PORTS = True  # Set to True to list all available COM ports
 SAVE_TO_CSV = True  # Set to True to save the power data to a CSV file
 PROCESS_NAMES = ['rstudio.exe', 'rsession-utf8.exe']
+POWER_MODEL = 'cpu_resident_memory'  # Name of the power model used to attribute power (see power_models.py)
 NUM_CORES = psutil.cpu_count()  # Get the number of CPU cores
+MEM_TOTAL = psutil.virtual_memory().total  # Physical memory in bytes, the reference of memory_usage
+USE_PROC_STAT = IS_LINUX and PROC_STAT_AVAILABLE  # Use the /proc jiffies backend instead of psutil.cpu_percent
+ATTRIBUTE_PER_PROCESS = True  # Set to True to split the measured power per PID and per process tree
+RECORD_RAW = True  # Set to True to record the raw PMD frames and CPU readings for later replay
+WRITE_ROLLUPS = True  # Set to True to maintain the 1 s/10 s/60 s/1 h rollup files while recording
+MEMORY_BUDGET_MB = 256  # In-memory history beyond this budget is spilled to the CSV and dropped
+FOOTPRINT_LOG_INTERVAL = 60  # Seconds between two memory footprint reports in the log
+RESUME_UNFINISHED_RUN = True  # Set to True to continue a run that did not exit cleanly instead of starting a new one
+RESUME_MAX_AGE = 3600  # Only resume runs whose log was written to within this many seconds
+RESUME_HISTORY_ROWS = 10000  # Rows of the resumed run reloaded into the plot history
+ACQUISITION_PROCESS = False  # Set to True to read the PMD in its own process, away from the plotting and analysis
+ACQUISITION_RATE = 100.0  # Frames per second read by the acquisition process; every frame is recorded
+ADAPTIVE_SAMPLING = False  # Set to True to sample faster while power or CPU activity changes and slower in steady state
+SAMPLING_INTERVAL_BOUNDS = (0.2, 2.0)  # Fastest and slowest adaptive sampling interval in seconds
+ARCHIVE_MEASUREMENTS = True  # Set to True to also store the measurements as a compressed .pmdts archive (see tscodec.py)
+COLLECTOR_ADDRESS = None  # Aggregator to stream the samples to ('host:port' or 'unix:/path'), None to disable
+ALERTING = True  # Set to True to evaluate the alert rules on every sample and log their transitions
+ALERT_RULES_PATH = None  # JSON file of alert rules (see alerts.py), None for the built-in rules
+METRICS_ADDRESS = None  # Address ('host:port') serving the live readings and alerts at /metrics, None to disable
+TELEMETRY = True  # Set to True to sample per-core load and frequency, CPU temperature and RAPL energy with every PMD frame
+
+# Fast Linux backend returning the CPU share of the target processes directly from /proc; with
+# attribution enabled the attribution engine reads the same counters and gives the share itself
+cpu_share_sampler = ProcStatCpuShare(PROCESS_NAMES) if USE_PROC_STAT and not ATTRIBUTE_PER_PROCESS else None
+
+# Per-process attribution engine, tracking the target processes and their children
+attribution = None
+if ATTRIBUTE_PER_PROCESS:
+    attribution = ProcessAttribution(PROCESS_NAMES, cpu_times=ProcStatReader() if USE_PROC_STAT else None)
+
+# Per-core CPU, temperature and RAPL sampler, opened at startup when TELEMETRY is enabled
+telemetry_sampler = None
+
+# Idle baseline profile of this host and PMD, loaded at startup (see calibration.py)
+baseline_profile = None
+
+# Raw frame recorder, opened at startup when RECORD_RAW is enabled
+recorder = None
+rollup_writer = None
 
 # Initialize a global DataFrame for storing sensor data
-df = pd.DataFrame(columns=['timestamp', 'Power', 'Voltage', 'Current'])
+df = pd.DataFrame(columns=['elapsed_time', 'Power', 'Voltage', 'Current'])
 date_name = datetime.now().strftime('%y%m%d-%H%M')
+csv_base_path = f'./data/{date_name}_atsp_ft704'  # Measurements CSV and rollup files share this prefix
+segment_log = None  # Crash-safe log of the measurements, opened at startup and exported to CSV at exit
+sender = None  # Streams the samples to the aggregator when COLLECTOR_ADDRESS is set
+pipeline = None  # Acquisition process feeding the frames through shared memory when ACQUISITION_PROCESS is set
+scheduler = None  # Picks the next sampling interval when ADAPTIVE_SAMPLING is set
+sampling_timer = None
+frame_reader = FrameReader()  # Validates the frames read in this process and counts the dropped ones
+failed_reads_seen = 0  # Failed reads of the acquisition process already marked in the recording
+alert_engine = None  # Evaluates the alert rules when ALERTING is set
+metrics_registry = None  # Live readings and alert states served at /metrics when METRICS_ADDRESS is set
+metrics_server = None
+pending_samples = []  # Samples taken by the sampling timer since the last plot update
+last_footprint_log = start_time
 
 # Define global variables for plot axes
 voltage_ax = None
 current_ax = None
 power_ax = None
 
-def list_ports():
-    """Lists all available COM or ttyUSB ports."""
-    ports = list(serial.tools.list_ports.comports())
-    print('Available ports:')
-    for p in ports:
-        print(f'{p.device} - {p.description}')
-    print()
-
-def detect_serial_port():
-    """Detects the serial port based on the operating system and device description."""
-    ports = list(serial.tools.list_ports.comports())
-
-    # Define the target device description (e.g., USB-SERIAL CH340)
-    target_device_description = ['USB-SERIAL', 'USB Serial']
-
-    if IS_WINDOWS:
-        # For Windows, look for a device matching the target descriptions
-        for port in ports:
-            if any(desc in port.description for desc in target_device_description):
-                return port.device  # Return COMx port for Windows
-
-    elif IS_LINUX:
-        # For Linux, look for devices like /dev/ttyUSBx or /dev/ttySx
-        for port in ports:
-            if any(desc in port.description for desc in target_device_description):
-                return port.device  # Return /dev/ttyUSBx or /dev/ttySx for Linux
-
-    print("No appropriate port found. Listing available ports:")
-    list_ports()  # List all ports for debugging
-    return None  # If no suitable port is found
-
 def get_cpu_usage(process_names: list) -> dict:
     """Gets the combined CPU, memory, and temperature usage of a list of processes."""
     metrics = {
         'cpu_usage': 0.0,
         'memory_usage': 0.0,
-        'temperature': 0.0  # This will require external functions like 'psutil.sensors_temperatures()'
     }
 
     for process_name in process_names:
@@ -91,7 +116,6 @@ def get_cpu_usage(process_names: list) -> dict:
                     proc = psutil.Process(process.info['pid'])
                     metrics['cpu_usage'] += proc.cpu_percent(interval=0.1)
                     metrics['memory_usage'] += proc.memory_percent()
-                    # Optionally: Add temperature if available
                     logging.debug(f'CPU usage for {process_name}: {metrics["cpu_usage"]}%')
                 except (psutil.NoSuchProcess, psutil.AccessDenied) as e:
                     logging.error(f'Error accessing process {process_name}: {e}')
@@ -99,36 +123,42 @@ def get_cpu_usage(process_names: list) -> dict:
     return metrics
 
 def normalize_cpu_usage(cpu_usage: float, num_cores: int) -> float:
-    """Normalizes CPU usage to a range of 0-100% considering the number of cores."""
+    """Normalizes CPU usage to a range of 0-100% considering the number of cores.
+
+    Every core counts the same here; the per-core load and frequency saved by the telemetry
+    sampler show how far that holds on hybrid or frequency-throttled CPUs.
+    """
     normalized = min(max(cpu_usage / num_cores, 0.0), 100.0)
     logging.debug(f'Normalized CPU usage: {normalized}%')
     return normalized
 
-def check_connection() -> None:
-    """Checks the connection with the Elmor Labs PMD sensor."""
-    PMD_SETTINGS['port'] = detect_serial_port()
-
-    if PMD_SETTINGS['port'] is None:
-        logging.error("No serial port detected.")
-        return
+def take_acquired_frames():
+    """Records and streams the frames acquired since the last update; returns the latest (timestamp, frame)."""
+    global failed_reads_seen
+    latest = None
+    failed_reads = pipeline.failed_reads()
+    if failed_reads > failed_reads_seen:
+        logging.warning(f"Acquisition process gave up {failed_reads - failed_reads_seen} reads since the last update")
+        if recorder is not None:
+            recorder.write_gap(time.time(), 'failed', samples=failed_reads - failed_reads_seen)
+        failed_reads_seen = failed_reads
+    for timestamps, frames in pipeline.read_new():
+        if recorder is not None or sender is not None:
+            for timestamp, frame in zip(timestamps.tolist(), frames):
+                frame = frame.tobytes()
+                if recorder is not None:
+                    recorder.write_frame(frame, timestamp)
+                if sender is not None:
+                    sender.send_frame(frame, timestamp)
+        if alert_engine is not None:
+            # Every acquired frame goes through the rules, not only the one plotted
+            eps1 = decode_frames(frames)[:, EPS1_CHANNEL]
+            for timestamp, voltage_value, current_value in zip(timestamps.tolist(), eps1[:, 0].tolist(), eps1[:, 1].tolist()):
+                alert_engine.observe(timestamp - start_time, {'Voltage': voltage_value, 'Current': current_value,
+                                                              'package_power': voltage_value * current_value})
+        latest = (float(timestamps[-1]), frames[-1].tobytes())
+    return latest
 
-    try:
-        with serial.Serial(**PMD_SETTINGS) as ser:
-            ser.write(b'\x00')  # Send a command to the sensor
-            ser.flush()  # Ensure all data is sent
-            read_bytes = ser.read(18)  # Read the welcome message
-            assert read_bytes == b'ElmorLabs PMD-USB', "Incorrect welcome message received"
-
-            ser.write(b'\x02')  # Send another command to the sensor
-            ser.flush()
-            ser.read(100)  # Read additional data
-        logging.info("Connection with PMD sensor established successfully.")
-    except (serial.SerialException, AssertionError) as e:
-        logging.error(f"Failed to establish connection with PMD sensor: {e}")
-
-def calculate_energy(voltage_value, current_value, cpu_usage, memory_usage, temperature):
-    """Calculates energy consumption based on multiple system metrics."""
-    return (voltage_value * current_value * cpu_usage / 100) * (1 + memory_usage / 100) * (1 + temperature / 100)
 
 def get_new_sensor_values() -> pd.DataFrame:
     """Gets new sensor values from the Elmor Labs PMD and stores them in a DataFrame."""
@@ -137,25 +167,84 @@ def get_new_sensor_values() -> pd.DataFrame:
         return pd.DataFrame()
 
     try:
-        with serial.Serial(**PMD_SETTINGS) as ser:
-            command = b'\x03'  # Command to request sensor data
-            ser.write(command)  # Send the command
-            ser.flush()  # Ensure all data is sent
-            read_bytes = ser.read(16)  # Read sensor data
-
-        # Capture the current timestamp
-        elapsed_time = time.time() - start_time  # Calculate the time elapsed since the start
+        if pipeline is not None:
+            # The acquisition process timestamps its frames; the sample uses the latest one
+            acquired = take_acquired_frames()
+            if acquired is None:
+                logging.warning("No frame acquired since the last update.")
+                return pd.DataFrame()
+            timestamp, read_bytes = acquired
+        else:
+            with open_pmd() as ser:
+                read_bytes = frame_reader.read(ser)  # Request and read a validated sensor data frame
+
+            # Capture the current timestamp
+            timestamp = time.time()
+
+            # Skip the sample rather than decode a short or corrupt frame into bogus power readings
+            if read_bytes is None:
+                logging.warning(f"No valid frame after {frame_reader.retries + 1} attempts ({frame_reader.last_error}), sample skipped.")
+                if recorder is not None:
+                    recorder.write_gap(timestamp, frame_reader.last_error, attempts=frame_reader.retries + 1)
+                if alert_engine is not None:
+                    alert_engine.observe(timestamp - start_time, {'frame_valid': 0})
+                return pd.DataFrame()
+
+            if recorder is not None:
+                recorder.write_frame(read_bytes, timestamp)
+            if sender is not None:
+                sender.send_frame(read_bytes, timestamp)
+        elapsed_time = timestamp - start_time  # Calculate the time elapsed since the start
+
+        # CPU telemetry taken right after the frame so that both describe the same instant
+        telemetry = telemetry_sampler.sample(timestamp) if telemetry_sampler is not None else None
 
         # Process the received sensor data
-        i = 2  # Index for reading values
         name = 'EPS1'  # Sensor name
-        voltage_value = int.from_bytes(read_bytes[i * 4:i * 4 + 2], byteorder='little') * 0.01
-        current_value = int.from_bytes(read_bytes[i * 4 + 2:i * 4 + 4], byteorder='little') * 0.1
-
-        # Get CPU usage for the list of processes
-        metrics = get_cpu_usage(PROCESS_NAMES)
-        cpu_usage_normalized = normalize_cpu_usage(metrics['cpu_usage'], NUM_CORES)
-        energy_value = calculate_energy(voltage_value, current_value, cpu_usage_normalized, metrics['memory_usage'], metrics['temperature'])
+        voltage_value, current_value = decode_channel(read_bytes)
+        if alert_engine is not None and pipeline is None:
+            alert_engine.observe(elapsed_time, {'Voltage': voltage_value, 'Current': current_value, 'frame_valid': 1,
+                                                'package_power': voltage_value * current_value})
+
+        samples = {'Voltage': voltage_value, 'Current': current_value}
+        # Inputs of the idle baseline and of dvfs_leakage, also recorded so that a replay evaluates them the same way
+        if telemetry is not None:
+            samples.update(telemetry_columns(telemetry))
+            cpu_freq, load, temperature = telemetry['cpu_freq'], telemetry['system_usage'], telemetry['temperature']
+        else:
+            cpu_freq, load, temperature = read_cpu_frequency(), psutil.cpu_percent(interval=None), float('nan')
+            samples.update(system_usage=load, cpu_freq=cpu_freq, temperature=temperature)
+        if baseline_profile is not None:
+            samples['baseline_power'] = float(baseline_power(baseline_profile, cpu_freq, load))
+
+        if attribution is not None:
+            # One reading of the targets gives both the modelled Power and its split between the
+            # PIDs and process trees, so the group columns sum to Power
+            def attributed_power(share: float, rss: float) -> float:
+                samples.update(cpu_usage=100 * share, memory_usage=100 * rss / MEM_TOTAL)
+                return float(evaluate_power_model(POWER_MODEL, samples))
+
+            result = attribution.sample(voltage_value * current_value, timestamp, attributed_power)
+            energy_value = result['power']
+        else:
+            # Get CPU usage for the list of processes
+            if cpu_share_sampler is not None:
+                metrics = cpu_share_sampler.sample()
+                samples['cpu_usage'] = metrics['cpu_usage']  # Already a share of the machine
+            else:
+                metrics = get_cpu_usage(PROCESS_NAMES)
+                # Cores taken offline do not count towards the share
+                samples['cpu_usage'] = normalize_cpu_usage(metrics['cpu_usage'], telemetry_sampler.cores if telemetry_sampler is not None else NUM_CORES)
+            samples['memory_usage'] = metrics['memory_usage']
+            energy_value = float(evaluate_power_model(POWER_MODEL, samples))
+        cpu_usage_normalized, memory_usage = samples['cpu_usage'], samples['memory_usage']
+        if alert_engine is not None:
+            alert_engine.observe(elapsed_time, {'Power': energy_value, 'cpu_usage': cpu_usage_normalized})
+        if metrics_registry is not None:
+            publish_metrics(voltage_value, current_value, energy_value, cpu_usage_normalized, telemetry)
+
+        if rollup_writer is not None:
+            rollup_writer.add(elapsed_time, energy_value, voltage_value, current_value)
 
         logging.debug(f"Collected data - Power: {energy_value} W, Voltage: {voltage_value} V, Current: {current_value} A")
 
@@ -165,7 +254,24 @@ def get_new_sensor_values() -> pd.DataFrame:
             'Power': [energy_value],
             'Voltage': [voltage_value],
             'Current': [current_value],
+            'cpu_usage': [cpu_usage_normalized],  # Raw inputs, kept to re-run other power models offline
+            'memory_usage': [memory_usage],
+            'baseline_power': [samples.get('baseline_power')],
         }
+        if telemetry is not None:
+            for column, value in telemetry_columns(telemetry).items():
+                data[column] = [value]
+
+        # Power split between the target PIDs and their process trees
+        if attribution is not None:
+            for column, value in attribution_columns(result).items():
+                data[column] = [value]
+
+        # Record the raw CPU readings of this tick so it can be replayed with other models
+        if recorder is not None:
+            snapshot = attribution.last_snapshot if attribution is not None else {}
+            recorder.write_snapshot(timestamp, cpu_usage_normalized, memory_usage, cpu_freq=cpu_freq, load=load,
+                                    temperature=temperature, **snapshot)
 
         df_new = pd.DataFrame(data)
         return df_new
@@ -174,12 +280,73 @@ def get_new_sensor_values() -> pd.DataFrame:
         logging.error(f"Serial communication error: {e}")
         return pd.DataFrame()
 
+def csv_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """Selects the columns saved to the measurements CSV."""
+    attribution_cols = [c for c in df.columns if c.startswith(('Power_', 'Energy_'))]
+    telemetry_cols = TELEMETRY_COLUMNS + sorted(c for c in df.columns if c.startswith('rapl_')) if telemetry_sampler is not None else []
+    # Reindex rather than select: all-NaN columns such as baseline_power are dropped from new samples
+    return df.reindex(columns=['elapsed_time', 'Power', 'Voltage', 'Current', 'cpu_usage', 'memory_usage', 'baseline_power']
+                      + telemetry_cols + attribution_cols).dropna(subset=['Power'])
+
+def trim_history(bytes_to_free: int) -> None:
+    """Drops the oldest rows of the in-memory history, already in the segment log, to free about ``bytes_to_free`` bytes."""
+    global df
+    n = rows_to_free(df, bytes_to_free)
+    df = df.iloc[n:].reset_index(drop=True)
+    logging.debug(f"Trimmed {n} rows of history, {len(df)} rows left in memory")
+
+# Memory accounting of the history and of the attribution bookkeeping, which grows with every PID seen
+memory_budget = MemoryBudget(MEMORY_BUDGET_MB)
+memory_budget.register('history', lambda: dataframe_bytes(df), trim_history)
+if attribution is not None:
+    memory_budget.register('attribution', attribution.bookkeeping_bytes)
+
+def publish_metrics(voltage_value: float, current_value: float, energy_value: float, cpu_usage: float, telemetry: dict = None) -> None:
+    """Updates the live readings served at /metrics."""
+    metrics_registry.set('voltage_volts', voltage_value)
+    metrics_registry.set('current_amperes', current_value)
+    metrics_registry.set('package_power_watts', voltage_value * current_value)
+    metrics_registry.set('attributed_power_watts', energy_value)
+    metrics_registry.set('cpu_usage_percent', cpu_usage)
+    metrics_registry.inc('samples_taken_total')
+    stats = pipeline.stats() if pipeline is not None else frame_reader.stats()
+    for counter in ('short', 'corrupt', 'retried', 'failed'):
+        metrics_registry.set(f'{counter}_frames_total', stats[counter])
+    if telemetry is not None:
+        for core, (usage, frequency) in enumerate(zip(telemetry['core_usage'].tolist(), telemetry['core_freq'].tolist())):
+            metrics_registry.set('core_usage_percent', usage, core=core)
+            metrics_registry.set('core_frequency_mhz', frequency, core=core)
+        metrics_registry.set('cpu_temperature_celsius', telemetry['temperature'])
+        for zone, power in telemetry['rapl_power'].items():
+            metrics_registry.set('rapl_power_watts', power, zone=zone)
+    if pipeline is not None:
+        metrics_registry.set('acquired_frames_total', stats['frames'])
+        metrics_registry.set('lost_frames_total', stats['lost'])
+        metrics_registry.set('read_errors_total', stats['read_errors'])
+
+def sample_tick() -> None:
+    """Takes one sample between plot updates and reschedules the sampling timer at the adaptive interval."""
+    df_new = get_new_sensor_values()
+    if not df_new.empty:
+        pending_samples.append(df_new)
+        sample = df_new.iloc[-1]
+        scheduler.update(start_time + sample['elapsed_time'], sample['Voltage'] * sample['Current'], sample['cpu_usage'])
+    sampling_timer.interval = int(scheduler.interval * 1000)
+    if alert_engine is not None:
+        alert_engine.check_stale(time.time() - start_time)
+
 def animation_update(frame):
     """Updates the plot with new sensor data."""
-    global df
+    global df, last_footprint_log
 
-    # Get new sensor data
-    df_new_data = get_new_sensor_values()
+    # Get new sensor data; with adaptive sampling, the samples taken since the last update
+    if scheduler is not None:
+        df_new_data = pd.concat(pending_samples, ignore_index=True) if pending_samples else pd.DataFrame()
+        pending_samples.clear()
+    else:
+        df_new_data = get_new_sensor_values()
+    if alert_engine is not None:
+        alert_engine.check_stale(time.time() - start_time)  # A dropped sensor produces no sample to evaluate
 
     # Clean the DataFrame by removing rows and columns that are completely NA
     df_new_data_clean = df_new_data.dropna(how='all').dropna(axis=1, how='all')
@@ -188,6 +355,19 @@ def animation_update(frame):
         # Concatenate only if the DataFrame is not empty after cleaning
         df = pd.concat([df, df_new_data_clean], ignore_index=True)
 
+        # Persist the new samples before anything else can fail
+        if segment_log is not None or sender is not None:
+            save_data_to_log(df_new_data_clean)
+
+    # Keep the history within the memory budget and report the footprint from time to time
+    memory_budget.enforce()
+    if time.time() - last_footprint_log >= FOOTPRINT_LOG_INTERVAL:
+        logging.info(memory_budget.describe())
+        last_footprint_log = time.time()
+
+    if df.empty:
+        return  # Nothing to draw until the first valid sample
+
     # Use groupby to organize data by elapsed_time for plotting
     df_power_plot = df.groupby('elapsed_time')['Power'].mean()
     df_voltage_plot = df.groupby('elapsed_time')['Voltage'].mean()
@@ -252,33 +432,97 @@ def animation_update(frame):
     # Tighten layout to avoid overlapping
     fig.tight_layout()
 
-    # Save data to CSV if enabled
-    if SAVE_TO_CSV:
-        save_data_to_csv(df)
 
-
-
-def save_data_to_csv(df: pd.DataFrame) -> None:
-    """Saves the power data to a CSV file."""
-    global date_name
+def save_data_to_log(df_new: pd.DataFrame) -> None:
+    """Appends new power data to the segment log and the aggregator stream; rows already written are never rewritten."""
     try:
-        # Ensure the 'data' directory exists
-        os.makedirs('./data', exist_ok=True)
-
         # Filter only for valid Power entries
-        df_power = df[['elapsed_time', 'Power', 'Voltage', 'Current']].dropna(subset=['Power'])
-
-        # Save to CSV
-        file_path = f'./data/{date_name}_atsp_ft704.csv'  # Use a generic path
-        df_power.to_csv(file_path, mode='w', header=True, index=False)
+        for row in csv_rows(df_new).to_dict('records'):
+            if segment_log is not None:
+                segment_log.append_row(row)
+            if sender is not None:
+                sender.send_row(row)
     except Exception as e:
-        logging.error(f"Error saving power data to CSV: {e}")
+        logging.error(f"Error saving power data to the segment log: {e}")
 
 if __name__ == "__main__":
     if LIST_ALL_WINDOWS_PORTS:
         list_ports()
 
     check_connection()
+    source = power_source()  # Kept with the run so that RAPL estimates are never taken for EPS readings
+    if source == 'rapl':
+        logging.warning("Recording the RAPL package power estimate, not the EPS rail.")
+
+    # Continue the last run if it was interrupted by a crash, otherwise start logging a new one
+    unfinished_log = find_unfinished_log('./data', RESUME_MAX_AGE, writer='main_v2') if RESUME_UNFINISHED_RUN else None
+    if unfinished_log is not None:
+        segment_log = SegmentLog(unfinished_log)
+        start_time = segment_log.meta['start_time']
+        date_name = segment_log.meta['date_name']
+        csv_base_path = segment_log.meta['csv_base_path']
+        if segment_log.meta.get('source', source) != source:
+            logging.warning(f"The interrupted run was read from {segment_log.meta['source']}, it continues from {source}")
+        df = pd.DataFrame(deque(iter_rows(unfinished_log), maxlen=RESUME_HISTORY_ROWS))
+        logging.info(f"Resuming the interrupted run {csv_base_path} with {len(df)} samples of history")
+    elif SAVE_TO_CSV:
+        segment_log = SegmentLog(log_directory(csv_base_path), log_meta('main_v2', start_time=start_time, date_name=date_name,
+                                                                        csv_base_path=csv_base_path, host=platform.node(),
+                                                                        process_names=PROCESS_NAMES, source=source))
+
+    # Load the idle baseline calibrated for this host and device, if any
+    baseline_profile = load_baseline(platform.node(), PMD_SETTINGS['port'])
+    if baseline_profile is not None:
+        logging.info(f"Loaded idle baseline of {baseline_profile['mean_power']:.3f} W calibrated on {baseline_profile['created']}")
+    elif POWER_MODEL == 'idle_baseline':
+        logging.warning("No idle baseline cached for this host and device. Run calibration.py first.")
+
+    if RECORD_RAW:
+        meta = {'start_time': start_time, 'host': platform.node(), 'device': PMD_SETTINGS['port'], 'source': source,
+                'process_names': PROCESS_NAMES, 'power_model': POWER_MODEL}
+        # A resumed run gets a new raw log instead of overwriting the one of the interrupted session
+        raw_name = f'{date_name}_raw' if unfinished_log is None else f"{date_name}_raw_{datetime.now().strftime('%d%H%M%S')}"
+        recorder = Recorder(f'./data/{raw_name}.pmdrec', meta)
+
+    if WRITE_ROLLUPS:
+        # A resumed run rebuilds its tiers from the log, since their open buckets died with the crash
+        rollup_writer = resume_rollups(iter_rows(unfinished_log), csv_base_path) if unfinished_log is not None \
+            else RollupWriter(csv_base_path)
+
+    if COLLECTOR_ADDRESS is not None:
+        sender = SampleSender(COLLECTOR_ADDRESS, {'host': platform.node(), 'run': date_name, 'start_time': start_time,
+                                                  'device': PMD_SETTINGS['port'], 'source': source,
+                                                  'process_names': PROCESS_NAMES})
+
+    if METRICS_ADDRESS is not None:
+        metrics_registry = MetricsRegistry()
+        for name, kind, help_text in (('voltage_volts', 'gauge', 'EPS1 voltage'), ('current_amperes', 'gauge', 'EPS1 current'),
+                                      ('package_power_watts', 'gauge', 'Measured EPS1 power'),
+                                      ('attributed_power_watts', 'gauge', f'Power attributed by the {POWER_MODEL} model'),
+                                      ('cpu_usage_percent', 'gauge', 'CPU share of the monitored processes'),
+                                      ('samples_taken_total', 'counter', 'Samples taken by the monitor'),
+                                      ('acquired_frames_total', 'counter', 'Frames read by the acquisition process'),
+                                      ('lost_frames_total', 'counter', 'Frames overwritten in the ring before being read'),
+                                      ('read_errors_total', 'counter', 'Failed PMD reads of the acquisition process'),
+                                      ('short_frames_total', 'counter', 'Frames dropped because the read timed out'),
+                                      ('corrupt_frames_total', 'counter', 'Frames dropped because of out-of-range readings'),
+                                      ('retried_frames_total', 'counter', 'Frames read successfully after a retry'),
+                                      ('failed_frames_total', 'counter', 'Samples skipped after all read attempts failed'),
+                                      ('core_usage_percent', 'gauge', 'Utilization of each core'),
+                                      ('core_frequency_mhz', 'gauge', 'Current frequency of each core'),
+                                      ('cpu_temperature_celsius', 'gauge', 'CPU package temperature'),
+                                      ('rapl_power_watts', 'gauge', 'Power of each RAPL zone')):
+            metrics_registry.describe(name, kind, help_text)
+        metrics_server = start_metrics_server(metrics_registry, METRICS_ADDRESS)
+
+    if TELEMETRY:
+        telemetry_sampler = TelemetrySampler()
+
+    if ALERTING:
+        alert_engine = AlertEngine(load_rules(ALERT_RULES_PATH) if ALERT_RULES_PATH else default_rules(), metrics_registry)
+
+    if ACQUISITION_PROCESS:
+        pipeline = AcquisitionPipeline(PMD_SETTINGS, ACQUISITION_RATE).start()
 
     plt.style.use('ggplot')
 
@@ -290,7 +534,48 @@ if __name__ == "__main__":
     power_ax = plt.subplot(gs[2])
 
     fig.suptitle('Measurement CPU and MATLAB', fontsize=14)
+
+    # Sample on a timer of its own so that the sampling rate can change without redrawing more often
+    if ADAPTIVE_SAMPLING:
+        scheduler = AdaptiveScheduler(*SAMPLING_INTERVAL_BOUNDS)
+        sampling_timer = fig.canvas.new_timer(interval=int(scheduler.interval * 1000))
+        sampling_timer.add_callback(sample_tick)
+        sampling_timer.start()
     anim = FuncAnimation(fig, animation_update, interval=2000, cache_frame_data=False)
     fig.tight_layout()
     fig.subplots_adjust(left=0.09)
     plt.show()
+
+    if scheduler is not None:
+        sampling_timer.stop()
+        logging.info(f"Adaptive sampling: {scheduler.stats()}")
+        if pending_samples and (segment_log is not None or sender is not None):
+            save_data_to_log(pd.concat(pending_samples, ignore_index=True))  # Taken after the last plot update
+    if pipeline is not None:
+        take_acquired_frames()  # Keep the frames acquired after the last update in the recording
+        pipeline.close()
+    if pipeline is None:
+        logging.info(f"Frame reads: {frame_reader.stats()}")
+    if recorder is not None:
+        recorder.close()
+    if rollup_writer is not None:
+        rollup_writer.close()
+    if sender is not None:
+        sender.close()
+    if metrics_server is not None:
+        metrics_server.shutdown()
+    if telemetry_sampler is not None:
+        telemetry_sampler.close()
+
+    if attribution is not None and SAVE_TO_CSV:
+        write_pid_energy(pid_energy_path(csv_base_path), attribution)
+
+    # Materialize the measurements CSV from the segment log, then register the finished run in the catalog
+    if segment_log is not None:
+        segment_log.close()
+        export_csv(segment_log.directory, f'{csv_base_path}.csv')
+        if ARCHIVE_MEASUREMENTS:
+            archive_csv(f'{csv_base_path}.csv')
+    if SAVE_TO_CSV and os.path.exists(f'{csv_base_path}.csv'):
+        index_csv(f'{csv_base_path}.csv', platform.node(), PROCESS_NAMES,
+                  raw_path=recorder.path if recorder is not None else None, source=source)
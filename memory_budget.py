@@ -0,0 +1,112 @@
+import sys
+import logging
+import tracemalloc
+import pandas as pd
+import psutil
+
+MEMORY_BUDGET_MB = 256  # Memory the monitor's buffers, queues and caches may use together
+HIGH_WATERMARK = 0.9  # Fraction of the budget at which buffers start being relieved
+LOW_WATERMARK = 0.6  # Fraction of the budget buffers are brought back to once relieved
+
+
+def process_rss() -> int:
+    """Returns the resident set size of this process in bytes."""
+    return psutil.Process().memory_info().rss
+
+
+def dataframe_bytes(df: pd.DataFrame) -> int:
+    """Returns the memory held by a DataFrame, object columns included."""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def dict_bytes(d: dict) -> int:
+    """Estimates the memory held by a flat dictionary of scalars."""
+    return sys.getsizeof(d) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in d.items())
+
+
+class MemoryBudget:
+    """Accounts the footprint of the monitor's buffers and relieves them when it nears the budget.
+
+    Every buffer registers a sizer returning its size in bytes and, if it can shrink, a relief
+    callback freeing a number of bytes (by spilling to disk or downsampling). The usage checked
+    against the budget is what relief can act on: the accounted buffers, or the traced Python
+    allocations when tracing is on. RSS growth also counts figures, font caches and memory the
+    allocator keeps after a trim, which no relief can return, so it is only reported and warned about.
+    """
+
+    def __init__(self, budget_mb: float = MEMORY_BUDGET_MB, trace: bool = False):
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.trace = trace
+        self._components = {}
+        self._rss_at_start = process_rss()
+        self._stalled_usage = None  # Usage at which the last relief freed nothing
+        self._rss_warned = False
+        if trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def register(self, name: str, sizer, relieve=None) -> None:
+        """Registers a buffer; ``relieve(bytes_to_free)`` is called when the budget is exceeded."""
+        self._components[name] = (sizer, relieve)
+
+    def footprint(self) -> dict:
+        """Returns the size in bytes of every registered buffer, their total and the process totals."""
+        footprint = {name: int(sizer()) for name, (sizer, _) in self._components.items()}
+        footprint['buffers'] = sum(footprint.values())
+        footprint['rss'] = process_rss()
+        footprint['rss_growth'] = max(footprint['rss'] - self._rss_at_start, 0)
+        if self.trace:
+            footprint['traced'] = tracemalloc.get_traced_memory()[0]
+        footprint['budget'] = self.budget
+        return footprint
+
+    def usage(self, footprint: dict = None) -> int:
+        """Returns the memory counted against the budget."""
+        footprint = footprint or self.footprint()
+        return footprint['traced'] if self.trace else footprint['buffers']
+
+    def enforce(self) -> int:
+        """Relieves the buffers, largest first, once usage exceeds the high watermark; returns the bytes freed."""
+        footprint = self.footprint()
+        used = self.usage(footprint)
+        if footprint['rss_growth'] > self.budget and not self._rss_warned:
+            logging.warning(f"Process memory grew by {footprint['rss_growth'] / 2**20:.1f} MB since startup, "
+                            f"over the {self.budget / 2**20:.0f} MB budget of the buffers")
+            self._rss_warned = True
+        if used <= self.budget * HIGH_WATERMARK:
+            self._stalled_usage = None
+            return 0
+        if self._stalled_usage is not None and used <= self._stalled_usage:
+            return 0  # Nothing could be freed at this usage before; wait until the buffers grow
+
+        to_free = used - int(self.budget * LOW_WATERMARK)
+        freed = 0
+        relievable = sorted((name for name, (_, relieve) in self._components.items() if relieve is not None),
+                            key=lambda name: footprint[name], reverse=True)
+        for name in relievable:
+            if freed >= to_free:
+                break
+            before = footprint[name]
+            self._components[name][1](min(to_free - freed, before))
+            freed += max(before - int(self._components[name][0]()), 0)
+        logging.info(f"Memory usage {used / 2**20:.1f} MB over {HIGH_WATERMARK:.0%} of the "
+                     f"{self.budget / 2**20:.0f} MB budget: freed {freed / 2**20:.1f} MB")
+        if freed == 0:
+            logging.warning("No buffer could be relieved, relief paused until the buffers grow.")
+            self._stalled_usage = used
+        return freed
+
+    def describe(self) -> str:
+        """Returns a one-line summary of the current footprint for the log."""
+        footprint = self.footprint()
+        parts = ', '.join(f'{name} {footprint[name] / 2**20:.1f} MB' for name in self._components)
+        return (f"Memory: {self.usage(footprint) / 2**20:.1f} of {self.budget / 2**20:.0f} MB budget "
+                f"({parts}; RSS {footprint['rss'] / 2**20:.1f} MB, +{footprint['rss_growth'] / 2**20:.1f} MB since start)")
+
+
+def rows_to_free(df: pd.DataFrame, bytes_to_free: int) -> int:
+    """Returns how many of the oldest rows of ``df`` hold about ``bytes_to_free`` bytes."""
+    if df.empty:
+        return 0
+    row_bytes = dataframe_bytes(df) / len(df)
+    return min(int(-(-bytes_to_free // row_bytes)), len(df))
+
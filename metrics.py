@@ -0,0 +1,89 @@
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_METRICS_ADDRESS = 'localhost:9101'
+METRIC_PREFIX = 'powertrack_'
+
+
+def format_labels(labels: dict) -> str:
+    """Formats labels in the Prometheus text format, e.g. ``{rule="voltage_sag"}``."""
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+
+class MetricsRegistry:
+    """Holds the current value of every counter and gauge of the monitor.
+
+    Updates are plain dictionary writes, cheap enough for every sample; the text exposition is
+    only built when the endpoint is scraped.
+    """
+
+    def __init__(self):
+        self._values = {}  # (name, sorted label items) -> value
+        self._kinds = {}  # name -> ('counter' | 'gauge', help)
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, kind: str, help_text: str = '') -> None:
+        """Declares the type and help text of a metric."""
+        self._kinds[name] = (kind, help_text)
+
+    def set(self, name: str, value: float, **labels) -> None:
+        """Sets a gauge."""
+        self._values[(name, tuple(sorted(labels.items())))] = value
+
+    def inc(self, name: str, amount: float = 1.0, **labels) -> None:
+        """Increments a counter."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, name: str, **labels) -> float:
+        """Returns the current value of a metric, or None."""
+        return self._values.get((name, tuple(sorted(labels.items()))))
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text exposition format."""
+        lines = []
+        by_name = {}
+        for (name, labels), value in list(self._values.items()):
+            by_name.setdefault(name, []).append((dict(labels), value))
+        for name in sorted(by_name):
+            kind, help_text = self._kinds.get(name, ('gauge', ''))
+            if help_text:
+                lines.append(f'# HELP {METRIC_PREFIX}{name} {help_text}')
+            lines.append(f'# TYPE {METRIC_PREFIX}{name} {kind}')
+            for labels, value in by_name[name]:
+                lines.append(f'{METRIC_PREFIX}{name}{format_labels(labels)} {float(value)!r}')
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves the registry of its server at /metrics."""
+
+    def do_GET(self) -> None:
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        logging.debug(f"Metrics request from {self.client_address[0]}: {format % args}")
+
+
+def start_metrics_server(registry: MetricsRegistry, address: str = DEFAULT_METRICS_ADDRESS) -> ThreadingHTTPServer:
+    """Serves ``registry`` over HTTP at ``address`` ('host:port') from a daemon thread; call shutdown() to stop."""
+    host, _, port = address.rpartition(':')
+    server = ThreadingHTTPServer((host or 'localhost', int(port)), MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logging.info(f"Metrics endpoint listening on http://{address}/metrics")
+    return server
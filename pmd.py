@@ -0,0 +1,212 @@
+import serial
+import struct
+import platform
+import logging
+import serial.tools.list_ports
+
+# Detect operating system
+IS_WINDOWS = platform.system() == 'Windows'
+IS_LINUX = platform.system() == 'Linux'
+
+# Settings for the Elmor Labs PMD sensor connection
+PMD_SETTINGS = {
+    'port': None,  # Dynamically assigned
+    'baudrate': 115200,
+    'bytesize': 8,
+    'stopbits': 1,
+    'timeout': 1,
+}
+
+# Layout of a sensor data frame: 4 channels of (voltage, current) little-endian uint16 pairs
+FRAME_SIZE = 16
+NUM_CHANNELS = 4
+EPS1_CHANNEL = 2  # Index of the EPS1 channel in the frame
+VOLTAGE_SCALE = 0.01  # Volts per count
+CURRENT_SCALE = 0.1  # Amperes per count
+CHANNEL_SCALES = (VOLTAGE_SCALE, CURRENT_SCALE)  # Broadcast over the (voltage, current) axis
+FRAME_STRUCT = struct.Struct(f'<{2 * NUM_CHANNELS}H')
+CMD_WELCOME = b'\x00'
+CMD_READ_CONFIG = b'\x02'
+CMD_READ_SENSORS = b'\x03'
+EMULATOR_PORT = 'emulator'  # Set PMD_SETTINGS['port'] to this to use the PMD emulator instead of hardware
+RAPL_PORT = 'rapl'  # Set PMD_SETTINGS['port'] to this to read the CPU package power from the RAPL counters (see rapl.py)
+RAPL_FALLBACK = False  # Set to True to fall back to the RAPL counters when no PMD is detected
+
+# Validated reads (see FrameReader)
+READ_TIMEOUT = 0.05  # Seconds to wait for a frame; the PMD answers within a few ms, a frame takes 1.4 ms at 115200 baud
+READ_RETRIES = 2  # Extra attempts after a short or corrupt frame before the sample is given up
+MAX_CHANNEL_VOLTAGE = 20.0  # Readings above these on any channel cannot come from an ATX rail
+MAX_CHANNEL_CURRENT = 100.0
+EPS_VOLTAGE_RANGE = (10.0, 14.0)  # EPS1 must read like a 12 V rail under load, anything else is a corrupt frame
+
+
+def list_ports():
+    """Lists all available COM or ttyUSB ports."""
+    ports = list(serial.tools.list_ports.comports())
+    print('Available ports:')
+    for p in ports:
+        print(f'{p.device} - {p.description}')
+    print()
+
+
+def detect_serial_port():
+    """Detects the serial port based on the operating system and device description."""
+    ports = list(serial.tools.list_ports.comports())
+
+    # Define the target device description (e.g., USB-SERIAL CH340)
+    target_device_description = ['USB-SERIAL', 'USB Serial']
+
+    if IS_WINDOWS:
+        # For Windows, look for a device matching the target descriptions
+        for port in ports:
+            if any(desc in port.description for desc in target_device_description):
+                return port.device  # Return COMx port for Windows
+
+    elif IS_LINUX:
+        # For Linux, look for devices like /dev/ttyUSBx or /dev/ttySx
+        for port in ports:
+            # Check description and device name (typically /dev/ttyUSBx or /dev/ttySx)
+            if any(desc in port.description for desc in target_device_description):
+                return port.device  # Return /dev/ttyUSBx or /dev/ttySx for Linux
+
+    print("No appropriate port found. Listing available ports:")
+    list_ports()  # List all ports for debugging
+    return None  # If no suitable port is found
+
+
+def check_connection() -> None:
+    """Checks the connection with the Elmor Labs PMD sensor."""
+    if PMD_SETTINGS['port'] not in (EMULATOR_PORT, RAPL_PORT):
+        PMD_SETTINGS['port'] = detect_serial_port()
+
+    if PMD_SETTINGS['port'] is None and RAPL_FALLBACK and IS_LINUX:
+        from rapl import rapl_available
+        if rapl_available():
+            logging.warning("No PMD detected, falling back to the RAPL package power counters.")
+            PMD_SETTINGS['port'] = RAPL_PORT
+
+    if PMD_SETTINGS['port'] is None:
+        logging.error("No serial port detected.")
+        return
+
+    try:
+        with open_pmd() as ser:
+            ser.write(CMD_WELCOME)  # Send a command to the sensor
+            ser.flush()  # Ensure all data is sent
+            read_bytes = ser.read(18)  # Read the welcome message
+            assert read_bytes == b'ElmorLabs PMD-USB', "Incorrect welcome message received"
+
+            ser.write(CMD_READ_CONFIG)  # Send another command to the sensor
+            ser.flush()
+            ser.read(100)  # Read additional data
+        logging.info("Connection with PMD sensor established successfully.")
+    except (serial.SerialException, AssertionError) as e:
+        logging.error(f"Failed to establish connection with PMD sensor: {e}")
+
+
+def power_source(settings: dict = None) -> str:
+    """Returns where the power readings come from: 'pmd', 'emulator' or 'rapl' (a package estimate, not the EPS rail)."""
+    port = (settings or PMD_SETTINGS)['port']
+    return port if port in (EMULATOR_PORT, RAPL_PORT) else 'pmd'
+
+
+def open_pmd(settings: dict = None):
+    """Opens a connection to the PMD that can be kept open for a whole recording."""
+    settings = settings or PMD_SETTINGS
+    if settings['port'] == EMULATOR_PORT:
+        from pmd_emulator import shared_emulator  # Imported lazily, the emulator itself depends on this module
+        emulator = shared_emulator()
+        emulator.open()
+        return emulator
+    if settings['port'] == RAPL_PORT:
+        from rapl import RaplSource
+        return RaplSource()
+    return serial.Serial(**settings)
+
+
+def read_frame(ser) -> bytes:
+    """Requests one sensor data frame from an open PMD connection."""
+    ser.write(CMD_READ_SENSORS)  # Send the command
+    ser.flush()  # Ensure all data is sent
+    return ser.read(FRAME_SIZE)  # Read sensor data
+
+
+def validate_frame(frame: bytes) -> str:
+    """Returns why a frame cannot be trusted ('short', 'range' or 'implausible'), or None if it is valid."""
+    if len(frame) != FRAME_SIZE:
+        return 'short'
+    counts = FRAME_STRUCT.unpack(frame)
+    if max(counts[0::2]) > MAX_CHANNEL_VOLTAGE / VOLTAGE_SCALE or max(counts[1::2]) > MAX_CHANNEL_CURRENT / CURRENT_SCALE:
+        return 'range'
+    if not EPS_VOLTAGE_RANGE[0] <= counts[2 * EPS1_CHANNEL] * VOLTAGE_SCALE <= EPS_VOLTAGE_RANGE[1]:
+        return 'implausible'
+    return None
+
+
+class FrameReader:
+    """Reads validated frames with a short timeout, retrying short or corrupt ones.
+
+    A read that times out returns whatever arrived, which must never be decoded: its missing bytes
+    decode as zeros and its late bytes would shift every following frame. Invalid frames are
+    dropped together with any bytes still pending, and counted; after ``retries`` failed attempts
+    ``read`` returns None and the caller records a gap instead of a sample.
+    """
+
+    def __init__(self, timeout: float = READ_TIMEOUT, retries: int = READ_RETRIES):
+        self.timeout = timeout
+        self.retries = retries
+        self.last_error = None
+        self.counters = {'frames': 0, 'short': 0, 'range': 0, 'implausible': 0, 'retried': 0, 'failed': 0, 'resynced': 0}
+
+    def read(self, ser):
+        """Returns the next valid frame of an open PMD connection, or None after all attempts failed."""
+        if ser.timeout != self.timeout:
+            ser.timeout = self.timeout  # Reconfigures a real port, so only when it changes
+        for attempt in range(self.retries + 1):
+            if ser.in_waiting:
+                # Late bytes of an earlier answer would be read as the start of this frame
+                ser.reset_input_buffer()
+                self.counters['resynced'] += 1
+            frame = read_frame(ser)
+            self.last_error = validate_frame(frame)
+            if self.last_error is None:
+                self.counters['frames'] += 1
+                self.counters['retried'] += attempt > 0
+                return frame
+            self.counters[self.last_error] += 1
+            logging.debug(f"Dropped {self.last_error} frame {bytes(frame).hex()} (attempt {attempt + 1})")
+        self.counters['failed'] += 1
+        return None
+
+    def stats(self) -> dict:
+        """Returns the counters of valid, dropped, retried and failed reads."""
+        return dict(self.counters, corrupt=self.counters['range'] + self.counters['implausible'])
+
+
+def decode_channel(read_bytes: bytes, i: int = EPS1_CHANNEL) -> tuple:
+    """Decodes the voltage and current of channel ``i`` from a sensor data frame."""
+    voltage_value = int.from_bytes(read_bytes[i * 4:i * 4 + 2], byteorder='little') * VOLTAGE_SCALE
+    current_value = int.from_bytes(read_bytes[i * 4 + 2:i * 4 + 4], byteorder='little') * CURRENT_SCALE
+    return voltage_value, current_value
+
+
+def decode_frames(buffer):
+    """Decodes N contiguous sensor data frames in one pass.
+
+    ``buffer`` is any bytes-like object (bytes, bytearray, memoryview, mmap) holding a whole number
+    of frames. Returns a float64 array of shape (N, NUM_CHANNELS, 2) with volts in ``[..., 0]``
+    and amperes in ``[..., 1]``.
+    """
+    import numpy as np  # Imported lazily so that listing ports and checking the connection start fast
+    n = len(buffer) // FRAME_SIZE
+    raw = np.frombuffer(buffer, dtype='<u2', count=n * FRAME_SIZE // 2).reshape(n, NUM_CHANNELS, 2)
+    return raw * CHANNEL_SCALES
+
+
+def pad_frames(frames) -> bytes:
+    """Joins frames into a contiguous buffer, zero-padding short reads to FRAME_SIZE.
+
+    Zero padding decodes to the same values as the per-frame decode_channel on a short read.
+    """
+    return b''.join(frame if len(frame) == FRAME_SIZE else bytes(frame[:FRAME_SIZE]).ljust(FRAME_SIZE, b'\x00')
+                    for frame in frames)
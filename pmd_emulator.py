@@ -0,0 +1,109 @@
+import math
+import time
+import functools
+import struct
+import random
+from pmd import FRAME_SIZE, NUM_CHANNELS, EPS1_CHANNEL, VOLTAGE_SCALE, CURRENT_SCALE, \
+    CMD_WELCOME, CMD_READ_CONFIG, CMD_READ_SENSORS
+
+WELCOME_MESSAGE = b'ElmorLabs PMD-USB'
+CONFIG_SIZE = 100
+FAULT_RATE = 0.0  # Share of sensor reads answered with a short or corrupt frame, to exercise the validated read path
+
+
+class PMDEmulator:
+    """Serial-port stand-in answering like an Elmor Labs PMD, for running the tools without hardware.
+
+    EPS1 reports a 12 V rail whose current alternates between idle and bursty phases, quantized
+    like the real sensor (0.01 V, 0.1 A). The other channels report a steady idle load. With a
+    ``fault_rate``, some reads return a truncated frame or random bytes, like a flaky USB link.
+    """
+
+    def __init__(self, seed: int = 0, voltage: float = 12.0, idle_current: float = 1.5, burst_current: float = 3.0,
+                 burst_period: float = 20.0, fault_rate: float = None, timeout: float = None, **_):
+        self.voltage = voltage
+        self.idle_current = idle_current
+        self.burst_current = burst_current
+        self.burst_period = burst_period
+        self.fault_rate = FAULT_RATE if fault_rate is None else fault_rate
+        self.timeout = timeout
+        self.is_open = True
+        self._random = random.Random(seed)
+        self._start = time.monotonic()
+        self._pending = b''
+
+    def frame(self, t: float = None) -> bytes:
+        """Returns the sensor data frame at ``t`` seconds since the emulator was opened."""
+        t = time.monotonic() - self._start if t is None else t
+        # Square-wave bursts with some jitter, like MATLAB's compute and idle phases
+        bursting = math.sin(2 * math.pi * t / self.burst_period) > 0
+        current = (self.burst_current if bursting else self.idle_current) + self._random.gauss(0, 0.1)
+        voltage = self.voltage + self._random.gauss(0, 0.005)
+
+        values = []
+        for channel in range(NUM_CHANNELS):
+            if channel == EPS1_CHANNEL:
+                values += [round(voltage / VOLTAGE_SCALE), round(max(current, 0.0) / CURRENT_SCALE)]
+            else:
+                values += [round(self.voltage / VOLTAGE_SCALE), round(0.2 / CURRENT_SCALE)]
+        return struct.pack(f'<{2 * NUM_CHANNELS}H', *values)
+
+    def faulty_frame(self) -> bytes:
+        """Returns a truncated frame or random bytes."""
+        if self._random.random() < 0.5:
+            return self.frame()[:self._random.randrange(FRAME_SIZE)]
+        return bytes(self._random.getrandbits(8) for _ in range(FRAME_SIZE))
+
+    def write(self, data: bytes) -> int:
+        """Queues the answer to a command."""
+        for command in bytes(data):
+            command = bytes([command])
+            if command == CMD_WELCOME:
+                self._pending += WELCOME_MESSAGE
+            elif command == CMD_READ_CONFIG:
+                self._pending += bytes(CONFIG_SIZE)
+            elif command == CMD_READ_SENSORS:
+                self._pending += self.faulty_frame() if self.fault_rate and self._random.random() < self.fault_rate else self.frame()
+        return len(data)
+
+    def read(self, size: int = 1) -> bytes:
+        """Returns up to ``size`` bytes of the queued answers, like a serial read hitting its timeout."""
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self._pending)
+
+    def flush(self) -> None:
+        pass
+
+    def reset_input_buffer(self) -> None:
+        self._pending = b''
+
+    def open(self) -> None:
+        """Reopens the port; the signal and noise carry on like a device that stayed powered."""
+        self.is_open = True
+        self._pending = b''
+
+    def close(self) -> None:
+        self.is_open = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@functools.lru_cache(maxsize=None)
+def shared_emulator(seed: int = 0) -> PMDEmulator:
+    """Returns the emulator of this process, kept across connections since main and main_v2 open one per sample."""
+    return PMDEmulator(seed=seed)
+
+
+def emulated_frames(count: int, rate: float = 100.0, seed: int = 0) -> bytes:
+    """Returns ``count`` contiguous emulated frames sampled at ``rate`` Hz."""
+    emulator = PMDEmulator(seed=seed)
+    return b''.join(emulator.frame(i / rate) for i in range(count))
+
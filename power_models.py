@@ -0,0 +1,135 @@
+import sys
+import logging
+import numpy as np
+import pandas as pd
+
+# Registry of the available power models, filled by the register_power_model decorator
+POWER_MODELS = {}
+DEFAULT_POWER_MODEL = 'linear_cpu'
+MODEL_ALIASES = {'cpu_memory': 'cpu_resident_memory'}  # Former names, still found in the metadata of older recordings
+
+# Static/dynamic split of the dvfs_leakage model, see dvfs_leakage_model
+LEAKAGE_FRACTION = 0.25  # Share of the package power lost to leakage at the reference frequency and temperature
+REFERENCE_FREQ_MHZ = 3000.0  # Typical base clock; set it to that of the measured machine
+REFERENCE_TEMPERATURE = 50.0  # Degrees Celsius
+LEAKAGE_DOUBLING = 25.0  # Degrees Celsius over which the leakage power doubles
+
+
+def register_power_model(name: str):
+    """Registers a vectorized power model under ``name``."""
+    def decorator(model):
+        POWER_MODELS[name] = model
+        return model
+    return decorator
+
+
+@register_power_model('linear_cpu')
+def linear_cpu_model(voltage, current, cpu_usage, **_) -> np.ndarray:
+    """Attributes the package power proportionally to the CPU share of the target processes."""
+    return np.maximum(voltage * current * cpu_usage / 100, 0.0)
+
+
+@register_power_model('cpu_resident_memory')
+def cpu_resident_memory_model(voltage, current, cpu_usage, memory_usage=0.0, **_) -> np.ndarray:
+    """Scales the CPU share by the resident memory of the targets (RSS in percent of RAM).
+
+    A heuristic favouring processes that hold more memory: RSS measures footprint, not memory
+    traffic, so it does not track the DRAM power of the targets.
+    """
+    return np.maximum(voltage * current * cpu_usage / 100 * (1 + memory_usage / 100), 0.0)
+
+
+@register_power_model('idle_baseline')
+def idle_baseline_model(voltage, current, cpu_usage, baseline_power=0.0, **_) -> np.ndarray:
+    """Subtracts the idle baseline from the package power before attributing the CPU share."""
+    return np.maximum(voltage * current - baseline_power, 0.0) * cpu_usage / 100
+
+
+@register_power_model('dvfs_leakage')
+def dvfs_leakage_model(voltage, current, cpu_usage, system_usage=np.nan, cpu_freq=np.nan, temperature=np.nan,
+                       **_) -> np.ndarray:
+    """Splits the package power into leakage and switching power and attributes each separately.
+
+    Switching power grows about with the cube of the core frequency (the voltage follows the clock)
+    and leakage with the voltage and exponentially with the temperature, so the leakage share rises
+    at low clocks and high temperatures. Leakage is burnt whether the cores work or not and is shared
+    by CPU time; switching power only by busy cores and is shared by the targets' part of the busy
+    time (cpu_usage / system_usage). Missing telemetry falls back to the reference conditions, and a
+    missing system load to the CPU share like linear_cpu.
+    """
+    cpu_freq = np.where(np.isfinite(cpu_freq) & (cpu_freq > 0), cpu_freq, REFERENCE_FREQ_MHZ)
+    temperature = np.where(np.isfinite(temperature), temperature, REFERENCE_TEMPERATURE)
+    ratio = (LEAKAGE_FRACTION / (1 - LEAKAGE_FRACTION) * 2 ** ((temperature - REFERENCE_TEMPERATURE) / LEAKAGE_DOUBLING)
+             * (REFERENCE_FREQ_MHZ / cpu_freq) ** 2)
+    leakage_fraction = ratio / (1 + ratio)
+
+    share = cpu_usage / 100
+    with np.errstate(invalid='ignore', divide='ignore'):
+        busy_share = np.where(system_usage > 0, np.minimum(cpu_usage / system_usage, 1.0), share)
+    busy_share = np.where(np.isfinite(busy_share), busy_share, share)
+
+    power = np.maximum(voltage * current, 0.0)
+    return power * (leakage_fraction * share + (1 - leakage_fraction) * busy_share)
+
+
+def evaluate_power_model(name: str, samples) -> np.ndarray:
+    """Evaluates the model ``name`` over whole sample arrays.
+
+    ``samples`` is a DataFrame or a mapping with 'Voltage', 'Current' and 'cpu_usage' columns, plus
+    the optional 'memory_usage' and 'baseline_power' columns and the CPU telemetry columns
+    ('system_usage', 'cpu_freq', 'temperature', see telemetry.py) read by dvfs_leakage.
+    """
+    name = MODEL_ALIASES.get(name, name)
+    if name not in POWER_MODELS:
+        raise KeyError(f"Unknown power model '{name}'. Available models: {', '.join(POWER_MODELS)}")
+
+    inputs = {
+        'voltage': np.asarray(samples['Voltage'], dtype=float),
+        'current': np.asarray(samples['Current'], dtype=float),
+        'cpu_usage': np.asarray(samples['cpu_usage'], dtype=float),
+    }
+    for column in ('memory_usage', 'baseline_power', 'system_usage', 'cpu_freq', 'temperature'):
+        if column in samples:
+            inputs[column] = np.asarray(samples[column], dtype=float)
+
+    return POWER_MODELS[name](**inputs)
+
+
+def integrate_energy(power, elapsed_time) -> float:
+    """Integrates power samples (W) over elapsed time (s) with the trapezoidal rule, in joules."""
+    power = np.asarray(power, dtype=float)
+    elapsed_time = np.asarray(elapsed_time, dtype=float)
+    if len(power) < 2:
+        return 0.0
+    return float(np.sum((power[1:] + power[:-1]) / 2 * np.diff(elapsed_time)))
+
+
+def compare_power_models(samples: pd.DataFrame, names=None, time_column: str = 'elapsed_time') -> pd.DataFrame:
+    """Re-runs every model over recorded raw streams and summarizes mean power and energy per model."""
+    names = list(POWER_MODELS) if names is None else names
+    rows = {}
+    for name in names:
+        power = evaluate_power_model(name, samples)
+        rows[name] = {
+            'Mean Power (W)': float(np.mean(power)) if len(power) else 0.0,
+            'Max Power (W)': float(np.max(power)) if len(power) else 0.0,
+            'Energy (J)': integrate_energy(power, samples[time_column]),
+        }
+    return pd.DataFrame.from_dict(rows, orient='index')
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    # Compare every registered model on a recording made by main_v2.py
+    if len(sys.argv) < 2:
+        print(f'Usage: python {sys.argv[0]} <measurements.csv> [model ...]')
+        sys.exit(1)
+
+    from tscodec import read_measurements  # Recordings may also be compressed archives
+    df = read_measurements(sys.argv[1])
+    missing = [c for c in ('elapsed_time', 'Voltage', 'Current', 'cpu_usage') if c not in df.columns]
+    if missing:
+        raise KeyError(f"Columns {missing} are missing from the dataset. Only recordings with raw CPU usage can be re-evaluated.")
+
+    print(compare_power_models(df, sys.argv[2:] or None).to_string())
@@ -0,0 +1,129 @@
+import os
+import time
+import logging
+import numpy as np
+from attribution import find_target_processes, RESCAN_INTERVAL
+
+PROC_ROOT = '/proc'
+PROC_STAT_AVAILABLE = os.path.exists(f'{PROC_ROOT}/stat')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+# Number of jiffy fields of the aggregate 'cpu' line (user .. steal); guest and guest_nice
+# are already accounted in user and nice
+PROC_STAT_CPU_FIELDS = 8
+
+# Zero-based positions of utime, stime and rss once the '(comm)' field has been stripped
+PID_STAT_UTIME = 11
+PID_STAT_STIME = 12
+PID_STAT_RSS = 21
+
+
+class ProcStatReader:
+    """Reads /proc/stat and /proc/[pid]/stat through persistent file descriptors with os.pread.
+
+    CPU times are returned in jiffies, so the ratio between a process delta and the system delta
+    directly gives the share of the machine used by the process.
+    """
+
+    def __init__(self, proc_root: str = PROC_ROOT):
+        self.proc_root = proc_root
+        self._stat_fd = os.open(f'{proc_root}/stat', os.O_RDONLY)
+        self._pid_fds = {}
+
+    def read_total(self) -> float:
+        """Returns the jiffies spent by all logical cores, idle included."""
+        data = os.pread(self._stat_fd, 4096, 0)
+        first_line = data[:data.index(b'\n')]
+        return float(sum(int(v) for v in first_line.split()[1:1 + PROC_STAT_CPU_FIELDS]))
+
+    def read_pid_stats(self, pids: np.ndarray) -> tuple:
+        """Returns the utime + stime jiffies and the RSS bytes of every PID, NaN for processes that are gone."""
+        ticks = np.full(len(pids), np.nan)
+        rss = np.full(len(pids), np.nan)
+        for i, pid in enumerate(np.asarray(pids).tolist()):
+            try:
+                fd = self._pid_fds.get(pid)
+                if fd is None:
+                    fd = self._pid_fds[pid] = os.open(f'{self.proc_root}/{pid}/stat', os.O_RDONLY)
+                data = os.pread(fd, 1024, 0)
+            except OSError as e:
+                # ESRCH once the process has exited, ENOENT if it was already gone when opening
+                self.forget([pid])
+                logging.debug(f'Error reading /proc stat of PID {pid}: {e}')
+                continue
+            # The command name may contain spaces and parentheses, so split after the last ')'
+            fields = data[data.rindex(b')') + 2:].split()
+            ticks[i] = int(fields[PID_STAT_UTIME]) + int(fields[PID_STAT_STIME])
+            rss[i] = int(fields[PID_STAT_RSS]) * PAGE_SIZE
+        return ticks, rss
+
+    def read_processes(self, pids: np.ndarray) -> np.ndarray:
+        """Returns the utime + stime jiffies of every PID (same interface as PsutilCpuTimes)."""
+        return self.read_pid_stats(pids)[0]
+
+    def forget(self, pids) -> None:
+        """Closes the descriptors of processes that are no longer tracked."""
+        for pid in pids:
+            fd = self._pid_fds.pop(pid, None)
+            if fd is not None:
+                os.close(fd)
+
+    def close(self) -> None:
+        """Closes every open descriptor."""
+        self.forget(list(self._pid_fds))
+        os.close(self._stat_fd)
+
+
+def read_mem_total(proc_root: str = PROC_ROOT) -> float:
+    """Returns the total physical memory in bytes from /proc/meminfo."""
+    with open(f'{proc_root}/meminfo', 'rb') as f:
+        for line in f:
+            if line.startswith(b'MemTotal:'):
+                return float(line.split()[1]) * 1024
+    raise ValueError('MemTotal not found in /proc/meminfo')
+
+
+class ProcStatCpuShare:
+    """Fast Linux backend for get_cpu_usage, based on jiffy ratios instead of psutil.cpu_percent.
+
+    Each call to ``sample`` returns the share of the whole machine (0-100%) used by the target
+    processes and their children since the previous call, so no core-count normalization is needed.
+    """
+
+    def __init__(self, process_names, reader: ProcStatReader = None, rescan_interval: float = RESCAN_INTERVAL):
+        self.process_names = list(process_names)
+        self.reader = reader if reader is not None else ProcStatReader()
+        self.rescan_interval = rescan_interval
+        self.mem_total = read_mem_total(self.reader.proc_root)
+
+        self._pids = np.empty(0, dtype=np.int64)
+        self._last_scan = None
+        self._last_ticks = {}
+        self._last_total = None
+
+    def _refresh_pids(self) -> np.ndarray:
+        now = time.monotonic()
+        if self._last_scan is None or now - self._last_scan >= self.rescan_interval:
+            pids = np.array(sorted(find_target_processes(self.process_names)), dtype=np.int64)
+            self.reader.forget(np.setdiff1d(self._pids, pids).tolist())
+            self._pids = pids
+            self._last_scan = now
+        return self._pids
+
+    def sample(self) -> dict:
+        """Returns the CPU and memory usage of the targets as percentages of the whole machine."""
+        pids = self._refresh_pids()
+        ticks, rss = self.reader.read_pid_stats(pids)
+        total = self.reader.read_total()
+
+        previous = np.array([self._last_ticks.get(pid, np.nan) for pid in pids.tolist()])
+        deltas = np.nan_to_num(ticks - previous, nan=0.0).clip(min=0.0)
+        total_delta = total - self._last_total if self._last_total is not None else 0.0
+
+        self._last_ticks = dict(zip(pids.tolist(), ticks.tolist()))
+        self._last_total = total
+
+        cpu_usage = 100.0 * deltas.sum() / total_delta if total_delta > 0 else 0.0
+        memory_usage = 100.0 * np.nansum(rss) / self.mem_total
+        logging.debug(f'CPU share of {self.process_names}: {cpu_usage}%')
+        return {'cpu_usage': float(min(cpu_usage, 100.0)), 'memory_usage': float(memory_usage)}
@@ -0,0 +1,321 @@
+import os
+import sys
+import glob
+import time
+import logging
+import argparse
+import tempfile
+import functools
+import numpy as np
+from pmd import NUM_CHANNELS, EPS1_CHANNEL, VOLTAGE_SCALE, CURRENT_SCALE, FRAME_STRUCT
+from pmd_emulator import PMDEmulator
+
+POWERCAP_ROOT = '/sys/class/powercap'
+RAPL_ZONE_PATTERN = 'intel-rapl:*'  # Package zones and their subzones (core, uncore, dram); AMD CPUs use the same driver
+RAPL_EPS_VOLTAGE = 12.0  # Nominal rail voltage reported by the RAPL source; the current carries the package power
+RAPL_MIN_INTERVAL = 0.01  # Seconds between two power readings of the RAPL source; counters update about every 1 ms
+DRIFT_BUCKET = 10  # Seconds averaged per point of the bucketed correlation, which tolerates small timing offsets
+FAKE_ZONES = {'intel-rapl:0': 'package-0', 'intel-rapl:0:0': 'core', 'intel-rapl:0:1': 'uncore', 'intel-rapl:0:2': 'dram'}
+FAKE_ENERGY_RANGE = 262143328850  # max_energy_range_uj of common Intel CPUs, about 262 kJ
+
+
+class RaplReader:
+    """Reads the RAPL energy counters of the powercap zones through persistent file descriptors.
+
+    The counters are in microjoules and wrap around at max_energy_range_uj, after a few minutes
+    at full load on some CPUs; ``read`` accounts for every wrap between two calls, so it must be
+    called at least once per wrap period. Zones whose counters cannot be read (recent kernels
+    restrict energy_uj to root) are left out.
+    """
+
+    def __init__(self, root: str = POWERCAP_ROOT):
+        self.root = root
+        self.zones = {}  # name -> (fd, wrap range in uJ)
+        self._last = {}
+        self._energy = {}
+        for path in sorted(glob.glob(os.path.join(root, RAPL_ZONE_PATTERN))):
+            try:
+                with open(os.path.join(path, 'name')) as f:
+                    name = f.read().strip()
+                with open(os.path.join(path, 'max_energy_range_uj')) as f:
+                    wrap = int(f.read()) + 1
+                fd = os.open(os.path.join(path, 'energy_uj'), os.O_RDONLY)
+                raw = int(os.pread(fd, 32, 0))
+            except (OSError, ValueError) as e:
+                logging.debug(f"RAPL zone {path} not readable: {e}")
+                continue
+            # Sockets each have a package-N zone, but their subzones share names like 'dram'
+            parent = os.path.basename(path).split(':')
+            if len(parent) > 2 and name in self.zones:
+                name = f'{name}-{parent[1]}'
+            self.zones[name] = (fd, wrap)
+            self._last[name] = raw
+            self._energy[name] = 0.0
+
+    @property
+    def available(self) -> bool:
+        return bool(self.zones)
+
+    def read(self) -> dict:
+        """Returns the energy in joules used by every zone since the reader was opened."""
+        for name, (fd, wrap) in self.zones.items():
+            raw = int(os.pread(fd, 32, 0))
+            delta = raw - self._last[name]
+            if delta < 0:
+                delta += wrap  # The counter wrapped around since the last read
+            self._last[name] = raw
+            self._energy[name] += delta * 1e-6
+        return dict(self._energy)
+
+    def close(self) -> None:
+        """Closes the counter files."""
+        for fd, _ in self.zones.values():
+            os.close(fd)
+        self.zones = {}
+
+
+def package_zones(zones) -> list:
+    """Returns the package zones, one per socket, whose sum is the CPU power fed by the EPS rails."""
+    return [zone for zone in zones if zone.startswith('package')]
+
+
+class RaplPowerMeter:
+    """Turns the package energy counters into a package power reading, the RAPL counterpart of EPS1 power."""
+
+    def __init__(self, root: str = POWERCAP_ROOT):
+        self.reader = RaplReader(root)
+        self.zones = package_zones(self.reader.zones)
+        self._last_energy = sum(self.reader.read()[zone] for zone in self.zones) if self.zones else 0.0
+        self._last_time = time.monotonic()
+        self._power = None
+
+    def power(self) -> float:
+        """Returns the package power in watts since the previous reading.
+
+        Readings closer than RAPL_MIN_INTERVAL repeat the previous one rather than divide a few
+        counter updates by a tiny interval; the first reading waits for that interval instead.
+        """
+        elapsed = time.monotonic() - self._last_time
+        if elapsed < RAPL_MIN_INTERVAL:
+            if self._power is not None:
+                return self._power
+            time.sleep(RAPL_MIN_INTERVAL - elapsed)
+        energy = sum(self.reader.read()[zone] for zone in self.zones)
+        now = time.monotonic()
+        self._power = (energy - self._last_energy) / (now - self._last_time)
+        self._last_energy, self._last_time = energy, now
+        return self._power
+
+
+@functools.lru_cache(maxsize=None)
+def shared_meter(root: str = POWERCAP_ROOT) -> RaplPowerMeter:
+    """Returns the power meter of ``root``, kept open across connections since main_v2 opens one per sample."""
+    return RaplPowerMeter(root)
+
+
+def rapl_available(root: str = POWERCAP_ROOT) -> bool:
+    """Returns whether a RAPL package counter of ``root`` can be read."""
+    reader = RaplReader(root)
+    available = bool(package_zones(reader.zones))
+    reader.close()
+    return available
+
+
+class RaplSource(PMDEmulator):
+    """Serial-port stand-in answering like a PMD with the RAPL package power, when no PMD is attached.
+
+    EPS1 reports RAPL_EPS_VOLTAGE and the package power divided by it, quantized like the real
+    sensor; the other channels read 0. It needs no USB round trip, but RAPL only estimates the
+    CPU package power and misses the VRM losses the PMD sees on the rail.
+    """
+
+    def __init__(self, root: str = POWERCAP_ROOT, **settings):
+        super().__init__(**settings)
+        self.meter = shared_meter(root)
+        if not self.meter.zones:
+            raise OSError(f"No readable RAPL package counter under {root}")
+
+    def frame(self, t: float = None) -> bytes:
+        """Returns a sensor data frame carrying the current package power."""
+        values = [0] * (2 * NUM_CHANNELS)
+        values[2 * EPS1_CHANNEL] = round(RAPL_EPS_VOLTAGE / VOLTAGE_SCALE)
+        values[2 * EPS1_CHANNEL + 1] = round(max(self.meter.power(), 0.0) / RAPL_EPS_VOLTAGE / CURRENT_SCALE)
+        return FRAME_STRUCT.pack(*values)
+
+
+class FakePowercap:
+    """Writes a powercap tree whose counters advance on demand, to exercise RaplReader without RAPL hardware."""
+
+    def __init__(self, root: str, zones: dict = None, energy_range: int = FAKE_ENERGY_RANGE):
+        self.root = root
+        self.zones = dict(FAKE_ZONES if zones is None else zones)  # directory -> zone name
+        self.energy_range = energy_range
+        self.energy = {directory: 0 for directory in self.zones}  # Raw counters in uJ
+        for directory, name in self.zones.items():
+            path = os.path.join(root, directory)
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, 'name'), 'w') as f:
+                f.write(name + '\n')
+            with open(os.path.join(path, 'max_energy_range_uj'), 'w') as f:
+                f.write(f'{energy_range}\n')
+            self._write(directory)
+
+    def _write(self, directory: str) -> None:
+        # Overwritten in place with a fixed width: the reader keeps the file open and may read it concurrently
+        width = len(str(self.energy_range))
+        fd = os.open(os.path.join(self.root, directory, 'energy_uj'), os.O_WRONLY | os.O_CREAT)
+        os.pwrite(fd, f'{self.energy[directory]:0{width}d}\n'.encode(), 0)
+        os.close(fd)
+
+    def advance(self, directory: str, joules: float) -> None:
+        """Adds ``joules`` to the counter of a zone, wrapping around like the hardware."""
+        self.energy[directory] = (self.energy[directory] + round(joules * 1e6)) % (self.energy_range + 1)
+        self._write(directory)
+
+
+def compare_rapl(df, bucket: float = DRIFT_BUCKET, source: str = None) -> dict:
+    """Compares the EPS1 power measured by the PMD with the RAPL package power recorded next to it.
+
+    ``df`` is a recording of main_v2 with telemetry (rapl_package-*_power columns) and ``source``
+    where its power came from (see catalog.run_source); a RAPL fallback run is refused. The drift is
+    the trend of the PMD - RAPL difference over the run: a steady offset is expected (VRM losses,
+    other loads on the rail), a changing one points to a sensor or a model going off.
+    """
+    from power_models import integrate_energy
+    if source == 'rapl':
+        raise ValueError("This recording was made with the RAPL fallback, its power is RAPL itself and cannot be compared with RAPL.")
+    power_columns = [c for c in df.columns if c.startswith('rapl_package') and c.endswith('_power')]
+    if not power_columns:
+        raise KeyError("No RAPL package power columns in this recording. Record it with TELEMETRY = True on a machine with RAPL.")
+    elapsed = df['elapsed_time'].to_numpy(dtype=float)
+    pmd = (df['Voltage'] * df['Current']).to_numpy(dtype=float)
+    rapl = df[power_columns].to_numpy(dtype=float).sum(axis=1)
+    valid = np.isfinite(pmd) & np.isfinite(rapl) & np.isfinite(elapsed)
+    elapsed, pmd, rapl = elapsed[valid], pmd[valid], rapl[valid]
+    if len(elapsed) < 3:
+        raise ValueError(f"Only {len(elapsed)} samples with both PMD and RAPL readings, too few to compare.")
+
+    difference = pmd - rapl
+    drift, offset = np.polyfit(elapsed, difference, 1)
+    gain, intercept = np.polyfit(rapl, pmd, 1)
+    buckets = np.floor((elapsed - elapsed[0]) / bucket)
+    _, index = np.unique(buckets, return_inverse=True)
+    counts = np.bincount(index)
+    pmd_means, rapl_means = np.bincount(index, pmd) / counts, np.bincount(index, rapl) / counts
+    pmd_energy, rapl_energy = integrate_energy(pmd, elapsed), integrate_energy(rapl, elapsed)
+    result = {
+        'samples': int(len(elapsed)),
+        'duration_s': float(elapsed[-1] - elapsed[0]),
+        'zones': [c[len('rapl_'):-len('_power')] for c in power_columns],
+        'pmd_mean_power_w': float(pmd.mean()),
+        'rapl_mean_power_w': float(rapl.mean()),
+        'mean_difference_w': float(difference.mean()),
+        'difference_std_w': float(difference.std()),
+        'drift_w_per_hour': float(drift * 3600),
+        'gain': float(gain),
+        'intercept_w': float(intercept),
+        'correlation': float(np.corrcoef(pmd, rapl)[0, 1]),
+        'bucket_correlation': float(np.corrcoef(pmd_means, rapl_means)[0, 1]) if len(counts) > 2 else float('nan'),
+        'pmd_energy_j': pmd_energy,
+        'rapl_energy_j': rapl_energy,
+        'energy_ratio': pmd_energy / rapl_energy if rapl_energy > 0 else float('nan'),
+    }
+    dram_columns = [c for c in df.columns if c.startswith('rapl_dram') and c.endswith('_power')]
+    if dram_columns:
+        # DRAM is fed by the 24-pin connector, not EPS1, so it is reported but kept out of the comparison
+        result['dram_mean_power_w'] = float(np.nanmean(df[dram_columns].to_numpy(dtype=float).sum(axis=1)))
+    return result
+
+
+def plot_comparison(df, path: str) -> None:
+    """Draws both power readings and their difference with its drift line."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    power_columns = [c for c in df.columns if c.startswith('rapl_package') and c.endswith('_power')]
+    elapsed = df['elapsed_time'].to_numpy(dtype=float)
+    pmd = (df['Voltage'] * df['Current']).to_numpy(dtype=float)
+    rapl = df[power_columns].to_numpy(dtype=float).sum(axis=1)
+    valid = np.isfinite(pmd) & np.isfinite(rapl)
+    difference = pmd - rapl
+
+    fig, (power_ax, difference_ax) = plt.subplots(2, 1, figsize=(10, 7), sharex=True)
+    power_ax.plot(elapsed, pmd, color='red', linewidth=1, label='PMD EPS1')
+    power_ax.plot(elapsed, rapl, color='blue', linewidth=1, label='RAPL package')
+    power_ax.set_ylabel('Power [W]')
+    power_ax.legend()
+    difference_ax.plot(elapsed, difference, color='gray', linewidth=1)
+    drift, offset = np.polyfit(elapsed[valid], difference[valid], 1)
+    difference_ax.plot(elapsed[valid], drift * elapsed[valid] + offset, color='black', linestyle='--',
+                       label=f'Drift {drift * 3600:+.2f} W/h')
+    difference_ax.set_ylabel('PMD - RAPL [W]')
+    difference_ax.set_xlabel('Elapsed time [s]')
+    difference_ax.legend()
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def check_reader(seconds: int = 600, power: float = 150.0) -> None:
+    """Feeds a fake powercap tree with wrapping counters through RaplReader and checks the energy it reads."""
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as root:
+        # A small range so that the counters wrap many times during the check
+        fake = FakePowercap(root, energy_range=int(power * 7 * 1e6))
+        reader = RaplReader(root)
+        expected = {name: 0.0 for name in fake.zones.values()}
+        for _ in range(seconds):
+            for directory, name in fake.zones.items():
+                joules = power * rng.uniform(0.5, 1.5) / (4 if name == 'dram' else 1)
+                fake.advance(directory, joules)
+                expected[name] += round(joules * 1e6) * 1e-6
+            energy = reader.read()
+        reader.close()
+    for name, joules in expected.items():
+        print(f'{name:10s} expected {joules:12.3f} J, read {energy[name]:12.3f} J')
+        assert abs(energy[name] - joules) < 1e-6 * max(joules, 1.0), f'{name} energy is off'
+    print(f'RAPL reader check passed: {seconds} reads, counters wrapped every ~7 s')
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Read the RAPL energy counters and compare them with the PMD.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    read_parser = subparsers.add_parser('read', help='Print the power of every RAPL zone')
+    read_parser.add_argument('--root', default=POWERCAP_ROOT, help='powercap directory, e.g. a fake tree')
+    read_parser.add_argument('--interval', type=float, default=1.0, help='Seconds between readings')
+    read_parser.add_argument('--count', type=int, default=5, help='Readings to print')
+
+    compare_parser = subparsers.add_parser('compare', help='Compare the PMD with RAPL over a recording')
+    compare_parser.add_argument('recording', help='Measurements CSV or archive recorded with telemetry')
+    compare_parser.add_argument('--bucket', type=float, default=DRIFT_BUCKET, help='Seconds per point of the bucketed correlation')
+    compare_parser.add_argument('--plot', help='PNG file to draw both readings and their difference to')
+
+    subparsers.add_parser('check', help='Check the reader against a fake powercap tree with wrapping counters')
+    args = parser.parse_args()
+
+    if args.command == 'read':
+        reader = RaplReader(args.root)
+        if not reader.available:
+            print(f'No readable RAPL counter under {args.root} (recent kernels need root to read energy_uj)')
+            sys.exit(1)
+        last, last_time = reader.read(), time.monotonic()
+        for _ in range(args.count):
+            time.sleep(args.interval)
+            energy, now = reader.read(), time.monotonic()
+            print(', '.join(f'{zone} {(energy[zone] - last[zone]) / (now - last_time):.2f} W' for zone in energy))
+            last, last_time = energy, now
+        reader.close()
+    elif args.command == 'compare':
+        from tscodec import read_measurements  # Recordings may also be compressed archives
+        from catalog import run_source
+        df = read_measurements(args.recording)
+        for key, value in compare_rapl(df, args.bucket, run_source(args.recording)).items():
+            print(f'{key:20s} {value:.6g}' if isinstance(value, float) else f'{key:20s} {value}')
+        if args.plot:
+            plot_comparison(df, args.plot)
+            logging.info(f"Comparison plot written to {args.plot}")
+    else:
+        check_reader()
@@ -0,0 +1,145 @@
+import os
+import json
+import mmap
+import struct
+import logging
+import numpy as np
+
+# Binary raw log layout:
+#   MAGIC, uint32 header length, JSON header, then records of
+#   RECORD_HEADER (kind, timestamp, payload length) followed by the payload
+MAGIC = b'PMDREC1\n'
+HEADER_LENGTH = struct.Struct('<I')
+RECORD_HEADER = struct.Struct('<BdI')
+
+KIND_FRAME = 1  # Raw 16-byte PMD frame
+KIND_SNAPSHOT = 2  # Raw CPU readings of the monitored processes
+KIND_GROUPS = 3  # JSON list of attribution group names, rewritten whenever a group is added
+KIND_GAP = 4  # JSON object describing a sample that could not be read (reason, failed attempts)
+
+# Snapshot payload: SNAPSHOT_HEADER (total CPU time, cpu_usage, memory_usage, PID count) then
+# int64 PIDs, float64 cumulative CPU times, uint16 group codes, SNAPSHOT_BASELINE (mean core
+# frequency, system load), the inputs of the idle baseline, and SNAPSHOT_TEMPERATURE (CPU package
+# temperature); older recordings end after the codes or after the baseline inputs
+SNAPSHOT_HEADER = struct.Struct('<dddI')
+SNAPSHOT_BASELINE = struct.Struct('<dd')
+SNAPSHOT_TEMPERATURE = struct.Struct('<d')
+
+
+class Recorder:
+    """Writes raw PMD frames and attribution snapshots with timestamps into a compact binary log."""
+
+    def __init__(self, path: str, meta: dict = None):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._file = open(path, 'wb')
+        header = json.dumps(meta or {}).encode()
+        self._file.write(MAGIC + HEADER_LENGTH.pack(len(header)) + header)
+        self._groups = {}
+
+    def _write(self, kind: int, timestamp: float, payload: bytes) -> None:
+        self._file.write(RECORD_HEADER.pack(kind, timestamp, len(payload)))
+        self._file.write(payload)
+
+    def write_frame(self, frame: bytes, timestamp: float) -> None:
+        """Records one raw serial frame as it was read from the PMD."""
+        self._write(KIND_FRAME, timestamp, bytes(frame))
+
+    def write_snapshot(self, timestamp: float, cpu_usage: float, memory_usage: float,
+                       pids=(), groups=(), proc_times=(), total_time: float = float('nan'),
+                       cpu_freq: float = float('nan'), load: float = float('nan'),
+                       temperature: float = float('nan')) -> None:
+        """Records the raw CPU readings of one tick: the measured shares, the per-PID CPU times, the baseline inputs and the temperature."""
+        new_groups = [g for g in dict.fromkeys(groups) if g not in self._groups]
+        if new_groups:
+            for group in new_groups:
+                self._groups[group] = len(self._groups)
+            self._write(KIND_GROUPS, timestamp, json.dumps(list(self._groups)).encode())
+
+        pids = np.asarray(pids, dtype='<i8')
+        payload = b''.join([
+            SNAPSHOT_HEADER.pack(total_time, cpu_usage, memory_usage, len(pids)),
+            pids.tobytes(),
+            np.asarray(proc_times, dtype='<f8').tobytes(),
+            np.array([self._groups[g] for g in groups], dtype='<u2').tobytes(),
+            SNAPSHOT_BASELINE.pack(cpu_freq, load),
+            SNAPSHOT_TEMPERATURE.pack(temperature),
+        ])
+        self._write(KIND_SNAPSHOT, timestamp, payload)
+
+    def write_gap(self, timestamp: float, reason: str, **details) -> None:
+        """Marks a sample lost to failed reads, so that the gap is not mistaken for a quiet period."""
+        self._write(KIND_GAP, timestamp, json.dumps(dict(details, reason=reason)).encode())
+
+    def flush(self) -> None:
+        """Flushes buffered records to the operating system."""
+        self._file.flush()
+
+    def close(self) -> None:
+        """Flushes and closes the log."""
+        if not self._file.closed:
+            self._file.close()
+            logging.info(f"Raw recording saved to {self.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_header(path: str) -> dict:
+    """Returns the JSON header of a raw log."""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a raw PMD recording')
+        (length,) = HEADER_LENGTH.unpack(f.read(HEADER_LENGTH.size))
+        return json.loads(f.read(length))
+
+
+def iter_records(path: str):
+    """Yields (kind, timestamp, payload) for every complete record of a raw log.
+
+    A truncated trailing record (e.g. after a crash) is ignored.
+    """
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not a raw PMD recording')
+        (length,) = HEADER_LENGTH.unpack_from(data, len(MAGIC))
+        offset = len(MAGIC) + HEADER_LENGTH.size + length
+        end = len(data)
+        while offset + RECORD_HEADER.size <= end:
+            kind, timestamp, size = RECORD_HEADER.unpack_from(data, offset)
+            offset += RECORD_HEADER.size
+            if offset + size > end:
+                logging.warning(f'Truncated record at the end of {path}')
+                break
+            yield kind, timestamp, data[offset:offset + size]
+            offset += size
+
+
+def decode_snapshot(payload: bytes, group_names: list) -> dict:
+    """Decodes a snapshot payload into its scalar readings and per-PID arrays."""
+    total_time, cpu_usage, memory_usage, n = SNAPSHOT_HEADER.unpack_from(payload)
+    offset = SNAPSHOT_HEADER.size
+    pids = np.frombuffer(payload, dtype='<i8', count=n, offset=offset)
+    proc_times = np.frombuffer(payload, dtype='<f8', count=n, offset=offset + 8 * n)
+    codes = np.frombuffer(payload, dtype='<u2', count=n, offset=offset + 16 * n)
+    cpu_freq = load = temperature = float('nan')
+    offset += 18 * n
+    if len(payload) >= offset + SNAPSHOT_BASELINE.size:
+        cpu_freq, load = SNAPSHOT_BASELINE.unpack_from(payload, offset)
+        offset += SNAPSHOT_BASELINE.size
+    if len(payload) >= offset + SNAPSHOT_TEMPERATURE.size:
+        temperature, = SNAPSHOT_TEMPERATURE.unpack_from(payload, offset)
+    return {
+        'total_time': total_time,
+        'cpu_usage': cpu_usage,
+        'memory_usage': memory_usage,
+        'pids': pids,
+        'proc_times': proc_times,
+        'groups': [group_names[c] for c in codes.tolist()],
+        'cpu_freq': cpu_freq,
+        'load': load,
+        'temperature': temperature,
+    }
@@ -0,0 +1,126 @@
+import json
+import time
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from pmd import decode_frames, pad_frames, validate_frame, EPS1_CHANNEL
+from attribution import ProcessAttribution, attribution_columns
+from power_models import evaluate_power_model, DEFAULT_POWER_MODEL, POWER_MODELS, MODEL_ALIASES
+from calibration import load_baseline, baseline_power
+from rollups import write_rollups
+from recorder import read_header, iter_records, decode_snapshot, KIND_FRAME, KIND_SNAPSHOT, KIND_GROUPS, KIND_GAP
+
+
+def load_recording(path: str) -> tuple:
+    """Splits a raw log into frame timestamps, raw frames and decoded snapshots.
+
+    Invalid frames, which recordings made before reads were validated may contain, are skipped.
+    """
+    frame_times, frames, snapshot_times, snapshots = [], [], [], []
+    group_names = []
+    invalid, gaps = 0, 0
+    for kind, timestamp, payload in iter_records(path):
+        if kind == KIND_FRAME:
+            if validate_frame(payload) is not None:
+                invalid += 1
+                continue
+            frame_times.append(timestamp)
+            frames.append(payload)
+        elif kind == KIND_GROUPS:
+            group_names = json.loads(payload)
+        elif kind == KIND_SNAPSHOT:
+            snapshot_times.append(timestamp)
+            snapshots.append(decode_snapshot(payload, group_names))
+        elif kind == KIND_GAP:
+            gaps += 1
+    if invalid or gaps:
+        logging.info(f"{path}: skipped {invalid} invalid frames, {gaps} samples were lost to failed reads")
+    return np.array(frame_times), frames, np.array(snapshot_times), snapshots
+
+
+def replay(path: str, power_model: str = None, baseline_profile: dict = None,
+           attribute: bool = True) -> pd.DataFrame:
+    """Feeds a raw log back through the decoder, the attribution engine and a power model.
+
+    Runs as fast as the data can be processed, independently of the original sampling rate, and
+    returns one row per recorded tick with the same columns as the live monitor. The model defaults
+    to the one the recording was made with.
+    """
+    header = read_header(path)
+    power_model = power_model or header.get('power_model', DEFAULT_POWER_MODEL)
+    frame_times, frames, snapshot_times, snapshots = load_recording(path)
+    if not len(frame_times) or not len(snapshot_times):
+        return pd.DataFrame()
+
+    # Each snapshot is attributed with the last frame read before it
+    frame_index = np.searchsorted(frame_times, snapshot_times, side='right') - 1
+    valid = frame_index >= 0
+    frame_index = frame_index[valid]
+    snapshot_times = snapshot_times[valid]
+    snapshots = [s for s, v in zip(snapshots, valid.tolist()) if v]
+
+    decoded = decode_frames(pad_frames(frames))[frame_index, EPS1_CHANNEL]
+    samples = pd.DataFrame({
+        'elapsed_time': snapshot_times - header.get('start_time', snapshot_times[0]),
+        'Voltage': decoded[:, 0],
+        'Current': decoded[:, 1],
+        'cpu_usage': [s['cpu_usage'] for s in snapshots],
+        'memory_usage': [s['memory_usage'] for s in snapshots],
+        # Telemetry read by dvfs_leakage; NaN in older recordings, where the model falls back like live
+        'system_usage': [s['load'] for s in snapshots],
+        'cpu_freq': [s['cpu_freq'] for s in snapshots],
+        'temperature': [s['temperature'] for s in snapshots],
+    })
+
+    if baseline_profile is None and power_model == 'idle_baseline':
+        baseline_profile = load_baseline(header.get('host'), header.get('device'))
+    if baseline_profile is not None:
+        # The inputs recorded with each tick; recordings without them get the mean idle power
+        samples['baseline_power'] = baseline_power(baseline_profile, np.array([s['cpu_freq'] for s in snapshots]),
+                                                   np.array([s['load'] for s in snapshots]))
+
+    samples['Power'] = evaluate_power_model(power_model, samples)
+
+    # Re-run the per-process attribution on the recorded CPU times
+    if attribute:
+        attribution = ProcessAttribution()
+        package_power = (samples['Voltage'] * samples['Current']).tolist()
+        rows = []
+        for snapshot, timestamp, power, modelled in zip(snapshots, snapshot_times.tolist(), package_power,
+                                                        np.asarray(samples['Power'], dtype=float).tolist()):
+            if not len(snapshot['pids']):
+                rows.append({})
+                continue
+            # Split the replayed Power rather than the package power, as the live monitor does
+            result = attribution.update(snapshot['pids'], snapshot['groups'], snapshot['proc_times'],
+                                        snapshot['total_time'], power, timestamp,
+                                        attributed_power=lambda share, modelled=modelled: modelled)
+            rows.append(attribution_columns(result))
+        samples = pd.concat([samples, pd.DataFrame(rows, index=samples.index)], axis=1)
+
+    return samples
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Replay a raw PMD recording through the processing pipeline.')
+    parser.add_argument('path', help='Raw recording (.pmdrec)')
+    parser.add_argument('--model', choices=[*POWER_MODELS, *MODEL_ALIASES],
+                        help='Power model (default: the one the recording was made with)')
+    parser.add_argument('--output', help='CSV file to write the replayed samples to')
+    parser.add_argument('--no-attribution', action='store_true', help='Skip the per-process attribution')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    df = replay(args.path, args.model, attribute=not args.no_attribution)
+    duration = time.perf_counter() - start
+    logging.info(f"Replayed {len(df)} ticks in {duration:.3f} s ({len(df) / max(duration, 1e-9):.0f} ticks/s)")
+
+    if args.output:
+        df.to_csv(args.output, index=False)
+        logging.info(f"Replayed data saved to {args.output}")
+        write_rollups(df, args.output.removesuffix('.csv'))
+    else:
+        print(df.describe().to_string())
@@ -0,0 +1,342 @@
+import os
+import json
+import math
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from rollups import RollupWriter, read_rollup, select_tier
+from catalog import update_run, run_source, start_time_from_name
+from power_models import integrate_energy
+from tscodec import iter_measurements
+
+REPORT_FIELDS = ('Power', 'Voltage', 'Current')
+REPORT_COLUMNS = ['elapsed_time', *REPORT_FIELDS]
+UNITS = {'Power': 'W', 'Voltage': 'V', 'Current': 'A'}
+CHUNK_ROWS = 100_000  # Rows of the run held in memory at once
+QUANTILE_RESOLUTION = 1e-3  # Values are counted at this resolution for the quantiles, well below the PMD steps (0.01 V, 0.1 A)
+HISTOGRAM_BINS = 30
+MAX_PLOT_POINTS = 2000  # Time series are drawn from the finest rollup tier with at most this many buckets
+FIGURE_FORMATS = ('png', 'svg')
+REPORT_WORKERS = 4  # Processes rendering the figures, capped by the CPU count; 0 renders them in this process
+
+
+class FieldStats:
+    """Streaming summary of one field: count, mean, deviation, extrema and the counts behind its quantiles.
+
+    Chunks are merged with the parallel variance formula, and values are counted at
+    QUANTILE_RESOLUTION, so quantiles, box plots and histograms come out of the same single pass.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # Sum of squared deviations from the mean
+        self.min = math.inf
+        self.max = -math.inf
+        self.keys = np.empty(0, dtype=np.int64)  # Values in units of QUANTILE_RESOLUTION, sorted
+        self.key_counts = np.empty(0, dtype=np.int64)
+
+    def update(self, values: np.ndarray) -> None:
+        """Adds the values of one chunk."""
+        values = values[np.isfinite(values)]
+        n = len(values)
+        if not n:
+            return
+        mean = float(values.mean())
+        delta = mean - self.mean
+        total = self.count + n
+        self.m2 += float(((values - mean) ** 2).sum()) + delta * delta * self.count * n / total
+        self.mean += delta * n / total
+        self.count = total
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+        keys, counts = np.unique(np.round(values / QUANTILE_RESOLUTION).astype(np.int64), return_counts=True)
+        keys, inverse = np.unique(np.concatenate([self.keys, keys]), return_inverse=True)
+        self.key_counts = np.bincount(inverse, weights=np.concatenate([self.key_counts, counts]),
+                                      minlength=len(keys)).astype(np.int64)
+        self.keys = keys
+
+    def value_at(self, rank: int) -> float:
+        """Returns the value of the given rank (0-based) in sorted order."""
+        index = np.searchsorted(np.cumsum(self.key_counts), rank, side='right')
+        return float(self.keys[index] * QUANTILE_RESOLUTION)
+
+    def quantile(self, q: float) -> float:
+        """Returns the ``q`` quantile with linear interpolation, like pandas."""
+        position = q * (self.count - 1)
+        low, high = self.value_at(math.floor(position)), self.value_at(math.ceil(position))
+        return low + (high - low) * (position - math.floor(position))
+
+    def describe(self) -> dict:
+        """Returns the statistics of DataFrame.describe()."""
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'std': math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else float('nan'),
+            'min': self.min,
+            '25%': self.quantile(0.25),
+            '50%': self.quantile(0.5),
+            '75%': self.quantile(0.75),
+            'max': self.max,
+        }
+
+    def box_stats(self, label: str) -> dict:
+        """Returns the box plot statistics expected by Axes.bxp, whiskers at 1.5 IQR."""
+        q1, median, q3 = self.quantile(0.25), self.quantile(0.5), self.quantile(0.75)
+        values = self.keys * QUANTILE_RESOLUTION
+        inside = values[(values >= q1 - 1.5 * (q3 - q1)) & (values <= q3 + 1.5 * (q3 - q1))]
+        return {'label': label, 'med': median, 'q1': q1, 'q3': q3, 'mean': self.mean,
+                'whislo': float(inside.min()), 'whishi': float(inside.max()), 'fliers': []}
+
+    def histogram(self, bins: int = HISTOGRAM_BINS) -> tuple:
+        """Returns the (counts, bin edges) of the values."""
+        counts, edges = np.histogram(self.keys * QUANTILE_RESOLUTION, bins=bins, weights=self.key_counts)
+        return counts.tolist(), edges.tolist()
+
+
+class RunAggregates:
+    """Every aggregate of a report, updated chunk by chunk in a single pass over a run."""
+
+    def __init__(self, rollup_base: str):
+        self.fields = {field: FieldStats() for field in REPORT_FIELDS}
+        self.rows = 0
+        self.first_time = None
+        self.last_time = None
+        self.energy_j = 0.0
+        self._last_power = None
+        self.rollups = RollupWriter(rollup_base)
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        """Adds one chunk of consecutive samples."""
+        chunk = chunk.dropna(subset=['elapsed_time', 'Power'])
+        if chunk.empty:
+            return
+        self.rows += len(chunk)
+        for field, stats in self.fields.items():
+            stats.update(chunk[field].to_numpy(dtype=float))
+
+        # Integrate across the chunk boundary from the last sample of the previous chunk
+        elapsed = chunk['elapsed_time'].to_numpy(dtype=float)
+        power = chunk['Power'].to_numpy(dtype=float)
+        if self.last_time is not None:
+            elapsed = np.concatenate([[self.last_time], elapsed])
+            power = np.concatenate([[self._last_power], power])
+        self.energy_j += integrate_energy(power, elapsed)
+        if self.first_time is None:
+            self.first_time = float(elapsed[0])
+        self.last_time, self._last_power = float(elapsed[-1]), float(power[-1])
+
+        self.rollups.add_many(*(chunk[c].to_numpy(dtype=float) for c in REPORT_COLUMNS))
+
+    def close(self) -> None:
+        """Flushes the rollup tiers."""
+        self.rollups.close()
+
+    @property
+    def duration(self) -> float:
+        return self.last_time - self.first_time if self.rows else 0.0
+
+    def stats_table(self) -> pd.DataFrame:
+        """Returns the statistics of every field, with the total energy and duration, as in the LaTeX report."""
+        table = pd.DataFrame({field: stats.describe() for field, stats in self.fields.items()})
+        extra = pd.DataFrame({'Power': [self.energy_j / 3.6e6, np.nan], 'Voltage': [np.nan, np.nan],
+                              'Current': [np.nan, self.duration / 60]},
+                             index=['Total Energy (kWh)', 'Total Elapsed Time (min)'])
+        return pd.concat([table, extra])
+
+    def summary(self) -> dict:
+        """Returns the JSON summary of the run."""
+        return {
+            'samples': self.rows,
+            'duration_s': self.duration,
+            'energy_j': self.energy_j,
+            'energy_wh': self.energy_j / 3600,
+            'mean_power_w': self.energy_j / self.duration if self.duration > 0 else None,  # Time-weighted
+            'fields': {field: stats.describe() for field, stats in self.fields.items()},
+        }
+
+
+def figure_specs(aggregates: RunAggregates, rollup_base: str) -> dict:
+    """Returns the data of every figure, small enough to be sent to the rendering processes."""
+    tier = select_tier(aggregates.duration, MAX_PLOT_POINTS)
+    series = read_rollup(rollup_base, tier)
+    minutes = read_rollup(rollup_base, 60)
+    power, current = aggregates.fields['Power'], aggregates.fields['Current']
+    return {
+        'timeseries': {'tier': tier, 'time': series['bucket_start'].tolist(),
+                       **{f'{field}_{stat}': series[f'{field}_{stat}'].tolist()
+                          for field in REPORT_FIELDS for stat in ('min', 'max', 'mean')}},
+        'power_per_minute': {'minutes': (minutes['bucket_start'] / 60).tolist(), 'power': minutes['Power_mean'].tolist()},
+        'boxplot_power': {'stats': power.box_stats('Power'), 'ylabel': 'Power (W)'},
+        'boxplot_current': {'stats': current.box_stats('Current'), 'ylabel': 'Current (A)'},
+        'histogram_power': dict(zip(('counts', 'edges'), power.histogram()), xlabel='Power (W)'),
+    }
+
+
+def draw_timeseries(fig, spec: dict) -> None:
+    """Current, voltage and power over the run, as bucket means within their min-max envelope."""
+    colors = {'Current': 'green', 'Voltage': 'blue', 'Power': 'red'}
+    for i, field in enumerate(('Current', 'Voltage', 'Power')):
+        ax = fig.add_subplot(3, 1, i + 1)
+        ax.fill_between(spec['time'], spec[f'{field}_min'], spec[f'{field}_max'], color=colors[field], alpha=0.2, linewidth=0)
+        ax.plot(spec['time'], spec[f'{field}_mean'], color=colors[field])
+        ax.set_title(f'{field} Over Experiment Duration ({spec["tier"]} s buckets)')
+        ax.set_xlabel('Duration (seconds)')
+        ax.set_ylabel(f'{field} ({UNITS[field]})')
+        ax.grid(True)
+
+
+def draw_power_per_minute(fig, spec: dict) -> None:
+    ax = fig.add_subplot()
+    ax.plot(spec['minutes'], spec['power'], color='red', label='Average Power (W)')
+    ax.set_title('Average Power per Minute')
+    ax.set_xlabel('Elapsed Time (minutes)')
+    ax.set_ylabel('Average Power (W)')
+    ax.grid(True)
+
+
+def draw_boxplot(fig, spec: dict) -> None:
+    ax = fig.add_subplot()
+    ax.bxp([spec['stats']], showfliers=False, patch_artist=True, boxprops={'facecolor': 'lightsteelblue'})
+    ax.set_title(f"Boxplot of {spec['stats']['label']}", fontsize=14)
+    ax.set_ylabel(spec['ylabel'], fontsize=12)
+
+
+def draw_histogram(fig, spec: dict) -> None:
+    ax = fig.add_subplot()
+    ax.stairs(spec['counts'], spec['edges'], fill=True, color='red')
+    ax.set_title('Histogram of Power')
+    ax.set_xlabel(spec['xlabel'])
+    ax.set_ylabel('Frequency')
+
+
+FIGURES = {
+    'timeseries': (draw_timeseries, (12, 8)),
+    'power_per_minute': (draw_power_per_minute, (10, 6)),
+    'boxplot_power': (draw_boxplot, (10, 6)),
+    'boxplot_current': (draw_boxplot, (10, 6)),
+    'histogram_power': (draw_histogram, (10, 6)),
+}
+
+
+def render_figure(name: str, spec: dict, base_path: str, formats=FIGURE_FORMATS) -> list:
+    """Draws one figure on an Agg canvas and saves it in every format; returns the file paths."""
+    # A bare Figure on an Agg canvas needs no GUI and shares no pyplot state with other figures
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    draw, figsize = FIGURES[name]
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    draw(fig, spec)
+    fig.tight_layout()
+    paths = []
+    for extension in formats:
+        paths.append(f'{base_path}_{name}.{extension}')
+        fig.savefig(paths[-1])
+    return paths
+
+
+def render_figures(specs: dict, base_path: str, formats=FIGURE_FORMATS, workers: int = REPORT_WORKERS) -> list:
+    """Renders the figures in up to ``workers`` processes, or in this process with 0 workers or a single CPU."""
+    workers = min(workers, len(specs), os.cpu_count() or 1)
+    if workers <= 1:
+        return [path for name, spec in specs.items() for path in render_figure(name, spec, base_path, formats)]
+    # Spawned rather than forked, so that the workers do not inherit a GUI backend or its threads
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(render_figure, name, spec, base_path, formats) for name, spec in specs.items()]
+        return [path for future in futures for path in future.result()]
+
+
+def markdown_table(table: pd.DataFrame) -> str:
+    """Formats a DataFrame as a Markdown table."""
+    def cell(value):
+        return '' if pd.isna(value) else f'{value:.6g}'
+    lines = ['| | ' + ' | '.join(table.columns) + ' |', '|---' * (len(table.columns) + 1) + '|']
+    lines += [f'| {index} | ' + ' | '.join(cell(v) for v in row) + ' |' for index, row in zip(table.index, table.to_numpy())]
+    return '\n'.join(lines)
+
+
+def write_markdown(path: str, name: str, summary: dict, table: pd.DataFrame, figures: list) -> None:
+    """Writes the Markdown report, embedding the PNG figures."""
+    lines = [f'# Power report: {name}', '',
+             f"- Samples: {summary['samples']}",
+             f"- Duration: {summary['duration_s'] / 60:.1f} min",
+             f"- Energy: {summary['energy_j']:.1f} J ({summary['energy_wh']:.3f} Wh)"]
+    if summary['mean_power_w'] is not None:
+        lines.append(f"- Mean power: {summary['mean_power_w']:.2f} W")
+    if summary.get('source') == 'rapl':
+        lines.append("- Source: RAPL package estimate, not the EPS rail")
+    elif summary.get('source') is not None:
+        lines.append(f"- Source: {summary['source']}")
+    lines += ['', markdown_table(table), '']
+    lines += [f'![{os.path.basename(p)}]({os.path.basename(p)})' for p in figures if p.endswith('.png')]
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def build_report(path: str, output_dir: str = None, workers: int = REPORT_WORKERS, formats=FIGURE_FORMATS,
+                 register: bool = True) -> dict:
+    """Builds the LaTeX, Markdown, JSON, rollup and figure reports of a run from a single read of it.
+
+    ``path`` is a measurements CSV or archive; outputs go to ``<run>_report/`` unless ``output_dir``
+    is given. Returns the JSON summary, which lists the files written.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    output_dir = output_dir or f'{os.path.splitext(path)[0]}_report'
+    os.makedirs(output_dir, exist_ok=True)
+    base_path = os.path.join(output_dir, name)
+
+    aggregates = RunAggregates(base_path)
+    for chunk in iter_measurements(path, REPORT_COLUMNS, CHUNK_ROWS):
+        aggregates.update(chunk)
+    aggregates.close()
+    if not aggregates.rows:
+        raise ValueError(f'{path} has no power samples')
+
+    figures = render_figures(figure_specs(aggregates, base_path), base_path, formats, workers)
+
+    table = aggregates.stats_table()
+    summary = dict(aggregates.summary(), run=path, source=run_source(path), figures=figures,
+                   rollups=sorted(tier.path for tier in aggregates.rollups.tiers),
+                   latex=f'{base_path}.tex', markdown=f'{base_path}.md', json=f'{base_path}_summary.json')
+    table.to_latex(summary['latex'])
+    write_markdown(summary['markdown'], name, summary, table, figures)
+    with open(summary['json'], 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    # Register the report in the run catalog with the aggregates already computed, without reading the run again
+    if register and path.endswith('.csv'):
+        start_time = start_time_from_name(path)
+        record = {'csv_path': path, 'tex_path': summary['latex'], 'duration_s': summary['duration_s'],
+                  'sample_count': summary['samples'], 'total_energy_j': summary['energy_j'],
+                  'mean_power_w': aggregates.fields['Power'].mean}
+        if start_time is not None:
+            record['start_time'] = (start_time + pd.Timedelta(seconds=aggregates.first_time)).isoformat()
+            record['end_time'] = (start_time + pd.Timedelta(seconds=aggregates.last_time)).isoformat()
+        update_run(record)
+    logging.info(f"Report of {path} written to {output_dir}")
+    return summary
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Build the LaTeX, Markdown, JSON, rollup and figure reports of a run.')
+    parser.add_argument('path', help='Measurements CSV or .pmdts archive')
+    parser.add_argument('--output', help='Output directory (default: <run>_report next to the run)')
+    parser.add_argument('--workers', type=int, default=REPORT_WORKERS, help='Figure rendering processes, 0 to render inline')
+    parser.add_argument('--formats', nargs='+', default=list(FIGURE_FORMATS), help='Figure formats')
+    parser.add_argument('--no-catalog', action='store_true', help='Do not register the report in the run catalog')
+    args = parser.parse_args()
+
+    summary = build_report(args.path, args.output, args.workers, args.formats, register=not args.no_catalog)
+    print(f"{summary['samples']} samples over {summary['duration_s'] / 60:.1f} min, {summary['energy_wh']:.3f} Wh")
+    for output in ('latex', 'markdown', 'json'):
+        print(f'  {summary[output]}')
+    print(f"  {len(summary['figures'])} figures, {len(summary['rollups'])} rollup tiers")
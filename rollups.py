@@ -0,0 +1,220 @@
+import os
+import math
+import logging
+import numpy as np
+import pandas as pd
+
+ROLLUP_TIERS = (1, 10, 60, 3600)  # Bucket widths in seconds, smallest first
+ROLLUP_FIELDS = ('Power', 'Voltage', 'Current')
+REBUILD_CHUNK_ROWS = 100_000  # Logged rows aggregated at once when rebuilding the tiers of a resumed run
+ROLLUP_COLUMNS = ['bucket_start', 'samples'] + [f'{field}_{stat}' for field in ROLLUP_FIELDS
+                                               for stat in ('min', 'max', 'mean')] + ['Energy']
+
+
+def rollup_path(base_path: str, seconds: int) -> str:
+    """Returns the file holding the ``seconds`` tier of a recording (``base_path`` without extension)."""
+    return f'{base_path}_rollup_{seconds}s.csv'
+
+
+def new_bucket(start: float) -> dict:
+    """Returns an empty bucket starting at ``start`` seconds."""
+    bucket = {'bucket_start': start, 'samples': 0, 'Energy': 0.0, 'duration': 0.0}
+    for field in ROLLUP_FIELDS:
+        bucket[f'{field}_min'] = math.inf
+        bucket[f'{field}_max'] = -math.inf
+        bucket[f'{field}_sum'] = 0.0
+        bucket[f'{field}_weighted'] = 0.0
+    return bucket
+
+
+def merge_bucket(target: dict, source: dict) -> None:
+    """Merges a closed bucket of a finer tier into a bucket of a coarser tier."""
+    target['samples'] += source['samples']
+    target['Energy'] += source['Energy']
+    target['duration'] += source['duration']
+    for field in ROLLUP_FIELDS:
+        target[f'{field}_min'] = min(target[f'{field}_min'], source[f'{field}_min'])
+        target[f'{field}_max'] = max(target[f'{field}_max'], source[f'{field}_max'])
+        target[f'{field}_sum'] += source[f'{field}_sum']
+        target[f'{field}_weighted'] += source[f'{field}_weighted']
+
+
+def bucket_row(bucket: dict) -> list:
+    """Converts a bucket into a row following ROLLUP_COLUMNS.
+
+    Means integrate every field with the trapezoidal rule like the energy, so that samples taken
+    closer together (adaptive sampling) do not weigh more and Power_mean times the bucket duration
+    equals its Energy; a bucket without elapsed time falls back to the plain mean.
+    """
+    row = [bucket['bucket_start'], bucket['samples']]
+    for field in ROLLUP_FIELDS:
+        if bucket['duration'] > 0:
+            mean = bucket[f'{field}_weighted'] / bucket['duration']
+        else:
+            mean = bucket[f'{field}_sum'] / bucket['samples']
+        row += [bucket[f'{field}_min'], bucket[f'{field}_max'], mean]
+    return row + [bucket['Energy']]
+
+
+class RollupTier:
+    """Aggregates buckets of ``seconds`` width and appends each closed bucket to its own CSV file.
+
+    The file is always rewritten from scratch: its open bucket and buffered rows are lost in a
+    crash, so a resumed run rebuilds its tiers from the logged rows (see resume_rollups).
+    """
+
+    def __init__(self, seconds: int, path: str = None):
+        self.seconds = seconds
+        self.path = path
+        self.bucket = None
+        self._file = None
+        if path is not None:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self._file = open(path, 'w')
+            self._file.write(','.join(ROLLUP_COLUMNS) + '\n')
+
+    def add(self, start: float, source: dict):
+        """Adds a sample or a finer bucket at ``start``; returns the bucket it closed, if any."""
+        bucket_start = math.floor(start / self.seconds) * self.seconds
+        closed = None
+        if self.bucket is not None and bucket_start != self.bucket['bucket_start']:
+            closed = self.close_bucket()
+        if self.bucket is None:
+            self.bucket = new_bucket(bucket_start)
+        merge_bucket(self.bucket, source)
+        return closed
+
+    def close_bucket(self):
+        """Writes and returns the current bucket."""
+        closed, self.bucket = self.bucket, None
+        if closed is not None and closed['samples'] and self._file is not None:
+            self._file.write(','.join(str(v) for v in bucket_row(closed)) + '\n')
+        return closed
+
+    def close(self) -> None:
+        """Closes the tier file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class RollupWriter:
+    """Maintains the rollup tiers of a recording as samples arrive.
+
+    Only the finest tier sees individual samples; each coarser tier is fed with the buckets closed
+    by the tier below it, so the cost per sample does not depend on the number of tiers.
+    """
+
+    def __init__(self, base_path: str = None, tiers=ROLLUP_TIERS):
+        self.tiers = [RollupTier(seconds, rollup_path(base_path, seconds) if base_path else None)
+                      for seconds in sorted(tiers)]
+        self._last_time = None
+        self._last_values = None  # Power, voltage and current of the previous sample
+
+    def add(self, elapsed_time: float, power: float, voltage: float, current: float) -> None:
+        """Adds one sample; energy is integrated with the trapezoidal rule since the previous sample.
+
+        Energy and means follow the actual spacing of the samples, which varies with adaptive sampling.
+        """
+        values = (power, voltage, current)
+        previous = values
+        dt = 0.0
+        if self._last_time is not None and elapsed_time > self._last_time:
+            dt = elapsed_time - self._last_time
+            previous = self._last_values
+        self._last_time, self._last_values = elapsed_time, values
+
+        sample = {'samples': 1, 'duration': dt}
+        for field, value, previous_value in zip(ROLLUP_FIELDS, values, previous):
+            sample[f'{field}_min'] = sample[f'{field}_max'] = sample[f'{field}_sum'] = value
+            sample[f'{field}_weighted'] = (value + previous_value) / 2 * dt
+        sample['Energy'] = sample['Power_weighted']
+
+        self._cascade(1, self.tiers[0].add(elapsed_time, sample))
+
+    def add_many(self, elapsed_time, power, voltage, current) -> None:
+        """Adds consecutive samples at once, with the same result as calling add() for each of them.
+
+        Each run of samples falling in the same finest bucket is reduced with NumPy and merged as
+        one, so the Python work is per bucket rather than per sample.
+        """
+        elapsed_time = np.asarray(elapsed_time, dtype=float)
+        if not len(elapsed_time):
+            return
+        values = np.asarray([power, voltage, current], dtype=float)
+        last_time = np.nan if self._last_time is None else self._last_time
+        last_values = np.full(3, np.nan) if self._last_values is None else np.asarray(self._last_values, dtype=float)
+        previous_time = np.concatenate([[last_time], elapsed_time[:-1]])
+        previous_values = np.concatenate([last_values[:, None], values[:, :-1]], axis=1)
+        with np.errstate(invalid='ignore'):
+            dt = np.where(elapsed_time > previous_time, elapsed_time - previous_time, 0.0)
+        weighted = np.where(dt > 0, (values + previous_values) / 2 * dt, 0.0)
+        self._last_time, self._last_values = float(elapsed_time[-1]), tuple(values[:, -1].tolist())
+
+        seconds = self.tiers[0].seconds
+        starts = np.flatnonzero(np.diff(np.floor(elapsed_time / seconds))) + 1
+        starts = np.concatenate([[0], starts])
+        counts = np.diff(np.concatenate([starts, [len(elapsed_time)]]))
+        reduced = {'samples': counts.tolist(), 'duration': np.add.reduceat(dt, starts).tolist()}
+        for field, field_values, field_weighted in zip(ROLLUP_FIELDS, values, weighted):
+            reduced[f'{field}_min'] = np.fmin.reduceat(field_values, starts).tolist()
+            reduced[f'{field}_max'] = np.fmax.reduceat(field_values, starts).tolist()
+            reduced[f'{field}_sum'] = np.add.reduceat(field_values, starts).tolist()
+            reduced[f'{field}_weighted'] = np.add.reduceat(field_weighted, starts).tolist()
+        reduced['Energy'] = reduced['Power_weighted']
+        for i, start in enumerate(elapsed_time[starts].tolist()):
+            self._cascade(1, self.tiers[0].add(start, {key: column[i] for key, column in reduced.items()}))
+
+    def _cascade(self, index: int, closed) -> None:
+        # Feed a closed bucket into the tiers from ``index`` up, as long as buckets keep closing
+        for tier in self.tiers[index:]:
+            if closed is None:
+                break
+            closed = tier.add(closed['bucket_start'], closed)
+
+    def flush(self) -> None:
+        """Closes the open buckets of every tier at the end of a recording, cascading them into the coarser tiers."""
+        for i, tier in enumerate(self.tiers):
+            self._cascade(i + 1, tier.close_bucket())
+
+    def close(self) -> None:
+        """Flushes the open buckets and closes the tier files."""
+        self.flush()
+        for tier in self.tiers:
+            tier.close()
+        logging.debug('Rollup tiers closed')
+
+
+def select_tier(duration: float, max_points: int, tiers=ROLLUP_TIERS):
+    """Returns the finest tier giving at most ``max_points`` buckets over ``duration`` seconds."""
+    for seconds in sorted(tiers):
+        if duration / seconds <= max_points:
+            return seconds
+    return max(tiers)
+
+
+def read_rollup(base_path: str, seconds: int) -> pd.DataFrame:
+    """Reads the ``seconds`` tier of a recording."""
+    return pd.read_csv(rollup_path(base_path, seconds))
+
+
+def resume_rollups(rows, base_path: str, tiers=ROLLUP_TIERS) -> RollupWriter:
+    """Rebuilds the tiers of a resumed run from its logged rows and returns the writer to continue them."""
+    writer = RollupWriter(base_path, tiers)
+    chunk = []
+    for row in rows:
+        if row.get('Power') is not None and row.get('elapsed_time') is not None:
+            chunk.append([row['elapsed_time'], row['Power'], row.get('Voltage'), row.get('Current')])
+        if len(chunk) >= REBUILD_CHUNK_ROWS:
+            writer.add_many(*np.array(chunk, dtype=float).T)
+            chunk = []
+    if chunk:
+        writer.add_many(*np.array(chunk, dtype=float).T)
+    return writer
+
+
+def write_rollups(df: pd.DataFrame, base_path: str, tiers=ROLLUP_TIERS) -> None:
+    """Builds the rollup tiers of an already recorded run (elapsed_time, Power, Voltage, Current)."""
+    writer = RollupWriter(base_path, tiers)
+    writer.add_many(*(df[c].to_numpy(dtype=float) for c in ('elapsed_time', 'Power', 'Voltage', 'Current')))
+    writer.close()
@@ -0,0 +1,279 @@
+import os
+import json
+import time
+import zlib
+import struct
+import logging
+import argparse
+
+SEGMENT_SIZE = 64 * 1024 * 1024  # Bytes written to a segment before starting the next one
+FSYNC_INTERVAL = 1.0  # Seconds between two fsyncs; a crash loses at most this much data
+MAX_RECORD_SIZE = 16 * 1024 * 1024  # Larger lengths can only come from a torn or corrupted header
+EXPORT_CHUNK_SIZE = 100_000  # Rows converted at once when exporting a log to CSV
+
+# Segment layout: records of RECORD_HEADER (payload length, CRC32 of the payload) then the payload.
+# The log directory holds numbered segment files and a meta.json describing the run.
+RECORD_HEADER = struct.Struct('<II')
+SEGMENT_PATTERN = 'segment_{:06d}.log'
+META_FILE = 'meta.json'
+CLOSED_FILE = 'closed'  # Marker written when a log was closed cleanly
+LOG_FORMAT = 1  # Version of the meta and rows written by the scripts, stored in meta.json with the writing script
+
+
+def log_directory(base_path: str) -> str:
+    """Returns the segment log directory of a recording (``base_path`` without extension)."""
+    return f'{base_path}_wal'
+
+
+def log_meta(writer: str, **meta) -> dict:
+    """Returns the meta of a new log, tagged with the script writing it and the log format."""
+    return dict(meta, writer=writer, format=LOG_FORMAT)
+
+
+def read_meta(directory: str) -> dict:
+    """Returns the meta of a log, or an empty dict if it cannot be read."""
+    try:
+        with open(os.path.join(directory, META_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def list_segments(directory: str) -> list:
+    """Returns the segment files of a log in write order."""
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.startswith('segment_') and name.endswith('.log'))
+
+
+def fsync_directory(directory: str) -> None:
+    """Persists the creation of files in ``directory`` (no-op where directories cannot be opened)."""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def scan_segment(path: str):
+    """Yields (end offset, payload) of every record of a segment up to its last valid record."""
+    offset = 0
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            length, crc = RECORD_HEADER.unpack(header)
+            if length > MAX_RECORD_SIZE:
+                break
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            offset += RECORD_HEADER.size + length
+            yield offset, payload
+
+
+def iter_log(directory: str):
+    """Yields the payloads of every valid record of a log, stopping at the first invalid one."""
+    for path in list_segments(directory):
+        valid_length = 0
+        for valid_length, payload in scan_segment(path):
+            yield payload
+        if valid_length < os.path.getsize(path):
+            return
+
+
+def iter_rows(directory: str):
+    """Yields the rows (dicts) stored in a log."""
+    for payload in iter_log(directory):
+        yield json.loads(payload)
+
+
+def recover(directory: str) -> dict:
+    """Truncates a log to its last valid record so it can be appended to; returns its meta.
+
+    Segments following a corrupted record are removed, as records after it can no longer be ordered.
+    """
+    truncated = False
+    for path in list_segments(directory):
+        if truncated:
+            os.remove(path)
+            logging.warning(f"Removed segment {path} following a corrupted record")
+            continue
+        valid_length = records = 0
+        for valid_length, _ in scan_segment(path):
+            records += 1
+        size = os.path.getsize(path)
+        if valid_length < size:
+            with open(path, 'r+b') as f:
+                f.truncate(valid_length)
+                os.fsync(f.fileno())
+            logging.warning(f"Truncated {path} from {size} to {valid_length} bytes after {records} valid records")
+            truncated = True
+    with open(os.path.join(directory, META_FILE)) as f:
+        return json.load(f)
+
+
+def is_closed(directory: str) -> bool:
+    """Tells whether a log was closed cleanly."""
+    return os.path.exists(os.path.join(directory, CLOSED_FILE))
+
+
+def last_write_time(directory: str) -> float:
+    """Returns the modification time of the most recently written file of a log."""
+    return max(os.path.getmtime(path) for path in list_segments(directory) + [os.path.join(directory, META_FILE)])
+
+
+def find_unfinished_log(data_dir: str = './data', max_age: float = None, writer: str = None):
+    """Returns the most recent log under ``data_dir`` that was not closed cleanly, if any.
+
+    With ``max_age``, logs not written to for more than ``max_age`` seconds are ignored. With
+    ``writer``, only logs tagged by that script in the current LOG_FORMAT are considered, since
+    other scripts write different meta and rows into the same directory.
+    """
+    if not os.path.isdir(data_dir):
+        return None
+    candidates = [os.path.join(data_dir, name) for name in os.listdir(data_dir) if name.endswith('_wal')]
+    candidates = [path for path in candidates
+                  if os.path.exists(os.path.join(path, META_FILE)) and not is_closed(path)
+                  and (max_age is None or time.time() - last_write_time(path) <= max_age)]
+    if writer is not None:
+        candidates = [path for path in candidates
+                      if (read_meta(path).get('writer'), read_meta(path).get('format')) == (writer, LOG_FORMAT)]
+    return max(candidates, key=last_write_time) if candidates else None
+
+
+class SegmentLog:
+    """Append-only log of checksummed records split into fixed-size segment files.
+
+    Records are only ever appended, so a crash can at worst leave a torn record at the end of the
+    last segment, which recover() cuts off. Data is fsynced every ``fsync_interval`` seconds and on
+    every segment switch, bounding both the I/O per sample and the data lost by a crash. Opening an
+    existing directory resumes the log after recovering it.
+    """
+
+    def __init__(self, directory: str, meta: dict = None, segment_size: int = SEGMENT_SIZE,
+                 fsync_interval: float = FSYNC_INTERVAL):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync_interval = fsync_interval
+        os.makedirs(directory, exist_ok=True)
+
+        meta_path = os.path.join(directory, META_FILE)
+        if os.path.exists(meta_path):
+            self.meta = recover(directory)
+            closed_path = os.path.join(directory, CLOSED_FILE)
+            if os.path.exists(closed_path):
+                os.remove(closed_path)
+        else:
+            self.meta = meta or {}
+            with open(f'{meta_path}.tmp', 'w') as f:
+                json.dump(self.meta, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(f'{meta_path}.tmp', meta_path)
+
+        segments = list_segments(directory)
+        self._index = len(segments) - 1 if segments else 0
+        self._file = None
+        self._open_segment()
+        self._last_sync = time.monotonic()
+
+    def _open_segment(self) -> None:
+        path = os.path.join(self.directory, SEGMENT_PATTERN.format(self._index))
+        self._file = open(path, 'ab')
+        fsync_directory(self.directory)
+
+    def append(self, payload: bytes) -> None:
+        """Appends one record, switching segments and fsyncing as needed."""
+        if self._file.tell() + RECORD_HEADER.size + len(payload) > self.segment_size and self._file.tell():
+            self.sync()
+            self._file.close()
+            self._index += 1
+            self._open_segment()
+        self._file.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        if time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def position(self) -> tuple:
+        """Returns the (segment index, offset) of the end of the log, to return to with rewind()."""
+        self._file.flush()
+        return self._index, self._file.tell()
+
+    def rewind(self, position) -> None:
+        """Drops every record written after ``position``, e.g. those of a batch that was never acknowledged."""
+        index, offset = position
+        self._file.close()
+        for path in list_segments(self.directory):
+            if int(os.path.basename(path)[len('segment_'):-len('.log')]) > index:
+                os.remove(path)
+        self._index = index
+        self._open_segment()
+        self._file.truncate(offset)
+        self.sync()
+
+    def append_row(self, row: dict) -> None:
+        """Appends one measurement row."""
+        self.append(json.dumps(row, default=str).encode())
+
+    def sync(self) -> None:
+        """Flushes and fsyncs the current segment."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_sync = time.monotonic()
+
+    def close(self) -> None:
+        """Syncs and closes the log, marking it as cleanly closed."""
+        if self._file is None:
+            return
+        self.sync()
+        self._file.close()
+        self._file = None
+        open(os.path.join(self.directory, CLOSED_FILE), 'w').close()
+        fsync_directory(self.directory)
+        logging.info(f"Segment log closed in {self.directory}")
+
+
+def export_csv(directory: str, csv_path: str, chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    """Writes the rows of a log to a CSV in two chunked passes; returns the number of rows.
+
+    The first pass collects the columns of every row (attribution columns appear over time), so
+    the CSV gets a single header. The file is replaced atomically.
+    """
+    import pandas as pd  # Only needed for the export, keeps the log itself light to import
+    columns = {}
+    for row in iter_rows(directory):
+        columns.update(dict.fromkeys(row))
+    columns = list(columns)
+
+    tmp_path = f'{csv_path}.tmp'
+    count = 0
+    chunk = []
+    with open(tmp_path, 'w', newline='') as f:
+        f.write(','.join(columns) + '\n')
+        for row in iter_rows(directory):
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                pd.DataFrame(chunk, columns=columns).to_csv(f, header=False, index=False)
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            pd.DataFrame(chunk, columns=columns).to_csv(f, header=False, index=False)
+            count += len(chunk)
+    os.replace(tmp_path, csv_path)
+    logging.info(f"Exported {count} rows from {directory} to {csv_path}")
+    return count
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Recover a segment log and export it to CSV.')
+    parser.add_argument('directory', help='Segment log directory (ending in _wal)')
+    parser.add_argument('--output', help='CSV to write (default: next to the log)')
+    args = parser.parse_args()
+
+    recover(args.directory)
+    directory = args.directory.rstrip('/\\')
+    export_csv(directory, args.output or f'{directory[:-len("_wal")]}.csv')
@@ -0,0 +1,292 @@
+import sys
+import time
+import logging
+import argparse
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from pmd import FRAME_SIZE, PMD_SETTINGS, EMULATOR_PORT, FrameReader, open_pmd
+
+ACQUISITION_RATE = 100.0  # Frames per second read by the acquisition process
+RING_SLOTS = 65536  # Frames kept in the ring; about 11 minutes at 100 Hz before the oldest are overwritten
+REOPEN_DELAY = 1.0  # Seconds before reopening the PMD after a read error
+STOP_TIMEOUT = 5.0  # Seconds to wait for the acquisition process to exit before terminating it
+
+# Shared memory layout: a header of int64 counters, then RING_SLOTS float64 timestamps, then
+# RING_SLOTS raw frames. Frames and timestamps live in separate arrays so that any run of
+# consecutive slots is a contiguous buffer that decode_frames() reads without copying.
+HEADER_FIELDS = 8
+WRITTEN = 0  # Frames written since the start; slot of frame i is i % slots
+STOP = 1  # Set by the consumer to ask the acquisition process to exit
+READ_ERRORS = 2  # Failed PMD reads
+RUNNING = 3  # Set by the acquisition process once the PMD is open
+SHORT_FRAMES = 4  # Frames dropped because the read timed out before FRAME_SIZE bytes arrived
+CORRUPT_FRAMES = 5  # Frames dropped because their readings are out of range or implausible
+RETRIED_FRAMES = 6  # Frames read successfully after a retry
+FAILED_READS = 7  # Samples given up after all retries; the consumer records them as gaps
+
+
+class FrameRing:
+    """Single-producer, single-consumer ring of timestamped PMD frames in shared memory.
+
+    The producer writes a slot, then publishes it by incrementing the WRITTEN counter, so the
+    consumer never sees a slot before it is complete. The consumer keeps its own read position
+    and is never waited for: when it falls more than a full ring behind, the oldest frames are lost.
+
+    Python has no memory fences, so this relies on the CPU keeping the order of the producer's
+    stores and of the consumer's loads, which x86 (TSO) guarantees. Weakly ordered CPUs such as ARM
+    do not formally; there, the many instructions the interpreter runs between the stores make a
+    torn slot very unlikely, but not impossible.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, slots: int, owner: bool):
+        self.shm = shm
+        self.slots = slots
+        self.owner = owner
+        self.header = np.ndarray(HEADER_FIELDS, dtype=np.int64, buffer=shm.buf)
+        self.timestamps = np.ndarray(slots, dtype=np.float64, buffer=shm.buf, offset=self.header.nbytes)
+        self.frames = np.ndarray((slots, FRAME_SIZE), dtype=np.uint8, buffer=shm.buf,
+                                 offset=self.header.nbytes + self.timestamps.nbytes)
+
+    @classmethod
+    def create(cls, slots: int = RING_SLOTS) -> 'FrameRing':
+        """Allocates a new ring; its name is passed to the process attaching to it."""
+        size = 8 * HEADER_FIELDS + slots * (8 + FRAME_SIZE)
+        ring = cls(shared_memory.SharedMemory(create=True, size=size), slots, owner=True)
+        ring.header[:] = 0
+        return ring
+
+    @classmethod
+    def attach(cls, name: str, slots: int = RING_SLOTS) -> 'FrameRing':
+        """Opens a ring created by another process."""
+        return cls(shared_memory.SharedMemory(name=name), slots, owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def written(self) -> int:
+        """Returns the number of frames published so far."""
+        return int(self.header[WRITTEN])
+
+    def push(self, frame: bytes, timestamp: float) -> None:
+        """Writes one frame, then publishes it."""
+        index = int(self.header[WRITTEN])
+        slot = index % self.slots
+        self.frames[slot] = np.frombuffer(frame.ljust(FRAME_SIZE, b'\x00')[:FRAME_SIZE], dtype=np.uint8)
+        self.timestamps[slot] = timestamp
+        self.header[WRITTEN] = index + 1  # Always the last store: the slot is complete once it is visible
+
+    def close(self) -> None:
+        """Releases this process's mapping; the creator also frees the shared memory."""
+        # The views must go before the mapping can be closed
+        self.header = self.timestamps = self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class RingReader:
+    """Consumer side of a FrameRing, returning the new frames as views into the shared memory."""
+
+    def __init__(self, ring: FrameRing):
+        self.ring = ring
+        self.position = ring.written()
+        self.lost = 0
+
+    def read_new(self) -> list:
+        """Returns the frames published since the last call as [(timestamps, frames), ...] views.
+
+        At most two chunks are returned, the second one when the new frames wrap around the end of
+        the ring. The views are not copies: they stay valid until the producer wraps around the
+        ring again, i.e. for RING_SLOTS / ACQUISITION_RATE seconds.
+        """
+        ring = self.ring
+        written = ring.written()  # Read before the slots, the mirror of push()
+        if written - self.position > ring.slots:
+            lost = written - self.position - ring.slots
+            self.lost += lost
+            logging.warning(f"Acquisition ring overrun: {lost} frames lost")
+            self.position = written - ring.slots
+        chunks = []
+        while self.position < written:
+            start = self.position % ring.slots
+            stop = min(start + written - self.position, ring.slots)
+            chunks.append((ring.timestamps[start:stop], ring.frames[start:stop]))
+            self.position += stop - start
+        return chunks
+
+
+def acquire(ring: FrameRing, settings: dict, rate: float) -> None:
+    """Reads validated frames from the PMD into ``ring`` at ``rate`` Hz until the consumer sets STOP."""
+    period = 1.0 / rate
+    reader = FrameReader()
+    counters = reader.counters
+    ser = None
+    next_tick = time.monotonic()
+    while not ring.header[STOP]:
+        try:
+            if ser is None:
+                ser = open_pmd(settings)
+                ring.header[RUNNING] = 1
+            frame = reader.read(ser)
+            if frame is not None:
+                ring.push(frame, time.time())
+            else:
+                ring.header[FAILED_READS] = counters['failed']
+            ring.header[SHORT_FRAMES] = counters['short']
+            ring.header[CORRUPT_FRAMES] = counters['range'] + counters['implausible']
+            ring.header[RETRIED_FRAMES] = counters['retried']
+        except Exception as e:  # Serial errors vary by platform; the acquisition must keep going
+            ring.header[READ_ERRORS] += 1
+            logging.error(f"PMD read failed, reopening in {REOPEN_DELAY} s: {e}")
+            if ser is not None:
+                ser.close()
+                ser = None
+            time.sleep(REOPEN_DELAY)
+            next_tick = time.monotonic()
+            continue
+        # Sleep to an absolute schedule so that the read time does not accumulate as drift
+        next_tick += period
+        delay = next_tick - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_tick = time.monotonic()  # Running late: restart the schedule instead of bursting
+    if ser is not None:
+        ser.close()
+
+
+def acquisition_process_main(ring_name: str, slots: int, settings: dict, rate: float) -> None:
+    """Entry point of the acquisition process: attaches to the ring and acquires until stopped."""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    ring = FrameRing.attach(ring_name, slots)
+    try:
+        acquire(ring, settings, rate)
+    finally:
+        ring.close()
+
+
+class AcquisitionPipeline:
+    """Reads the PMD in a separate process and hands the frames over through a shared-memory ring.
+
+    The acquisition process runs nothing but the read loop and has a GIL of its own, so pandas,
+    matplotlib and psutil in the main process no longer delay the reads. It is started with
+    'spawn' so that it does not inherit the monitor's threads and locks, and from this module
+    rather than the monitor's script, whose module-level setup 'spawn' would otherwise run again.
+    """
+
+    def __init__(self, settings: dict = None, rate: float = ACQUISITION_RATE, slots: int = RING_SLOTS):
+        self.settings = dict(settings or PMD_SETTINGS)
+        self.rate = rate
+        self.ring = FrameRing.create(slots)
+        self.reader = RingReader(self.ring)
+        context = multiprocessing.get_context('spawn')
+        self.process = context.Process(target=acquisition_process_main, name='pmd-acquisition', daemon=True,
+                                       args=(self.ring.name, slots, self.settings, rate))
+
+    def start(self) -> 'AcquisitionPipeline':
+        """Starts the acquisition process."""
+        # 'spawn' re-imports the parent's __main__ in the child; make it this module for the launch
+        main = sys.modules['__main__']
+        sys.modules['__main__'] = sys.modules[__name__]
+        try:
+            self.process.start()
+        finally:
+            sys.modules['__main__'] = main
+        logging.info(f"Acquisition process {self.process.pid} reading {self.settings['port']} at {self.rate:g} Hz")
+        return self
+
+    def read_new(self) -> list:
+        """Returns the frames acquired since the last call (see RingReader.read_new)."""
+        return self.reader.read_new()
+
+    def failed_reads(self) -> int:
+        """Returns the number of samples the acquisition process gave up after all retries."""
+        return int(self.ring.header[FAILED_READS])
+
+    def stats(self) -> dict:
+        """Returns the acquisition counters."""
+        return {'frames': self.ring.written(), 'lost': self.reader.lost,
+                'read_errors': int(self.ring.header[READ_ERRORS]), 'short': int(self.ring.header[SHORT_FRAMES]),
+                'corrupt': int(self.ring.header[CORRUPT_FRAMES]), 'retried': int(self.ring.header[RETRIED_FRAMES]),
+                'failed': int(self.ring.header[FAILED_READS]), 'alive': self.process.is_alive()}
+
+    def close(self) -> None:
+        """Stops the acquisition process and frees the ring."""
+        if self.ring.header is None:
+            return
+        self.ring.header[STOP] = 1
+        if self.process.pid is not None:
+            self.process.join(STOP_TIMEOUT)
+            if self.process.is_alive():
+                logging.warning("Acquisition process did not stop, terminating it")
+                self.process.terminate()
+                self.process.join()
+        logging.info(f"Acquisition stopped: {self.stats()}")
+        self.reader = None
+        self.ring.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def interval_jitter(timestamps: np.ndarray, rate: float) -> dict:
+    """Returns the deviation of the sample intervals from the nominal period, in milliseconds."""
+    deviation = np.abs(np.diff(timestamps) - 1.0 / rate) * 1e3
+    return {'samples': len(timestamps), 'mean_ms': float(deviation.mean()),
+            'p99_ms': float(np.percentile(deviation, 99)), 'max_ms': float(deviation.max())}
+
+
+def busy_work(stop: threading.Event) -> None:
+    """Keeps the GIL busy with pandas work, like the monitor's analysis and plotting."""
+    import pandas as pd
+    df = pd.DataFrame(np.random.default_rng(0).normal(size=(200_000, 4)))
+    while not stop.is_set():
+        df.rolling(50).mean().describe()
+
+
+def compare_jitter(settings: dict, rate: float, duration: float) -> dict:
+    """Measures the sampling jitter of a thread and of a process acquiring under GIL-heavy load."""
+    results = {}
+    stop = threading.Event()
+    load = threading.Thread(target=busy_work, args=(stop,), daemon=True)
+    load.start()
+    try:
+        # Acquisition in a thread of this process, contending with the load for the GIL
+        ring = FrameRing.create(int(2 * rate * duration) + 1)
+        thread = threading.Thread(target=acquire, args=(ring, settings, rate), daemon=True)
+        thread.start()
+        time.sleep(duration)
+        ring.header[STOP] = 1
+        thread.join()
+        results['thread'] = interval_jitter(ring.timestamps[:ring.written()].copy(), rate)
+        ring.close()
+
+        # Acquisition in its own process, handing frames over through the ring
+        with AcquisitionPipeline(settings, rate, int(2 * rate * duration) + 1) as pipeline:
+            time.sleep(duration)
+            timestamps = np.concatenate([t for t, _ in pipeline.read_new()] or [np.empty(0)])
+            results['process'] = interval_jitter(timestamps, rate)
+    finally:
+        stop.set()
+        load.join()
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Compare the sampling jitter of thread and process acquisition under load.')
+    parser.add_argument('--port', default=EMULATOR_PORT, help="PMD serial port, 'emulator' or 'rapl'")
+    parser.add_argument('--rate', type=float, default=ACQUISITION_RATE, help='Frames per second')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds acquired by each mode')
+    args = parser.parse_args()
+
+    for mode, jitter in compare_jitter(dict(PMD_SETTINGS, port=args.port), args.rate, args.duration).items():
+        print(f"{mode:8s} {jitter['samples']:6d} samples  interval jitter: mean {jitter['mean_ms']:.3f} ms, "
+              f"p99 {jitter['p99_ms']:.3f} ms, max {jitter['max_ms']:.3f} ms")
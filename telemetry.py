@@ -0,0 +1,198 @@
+import os
+import glob
+import time
+import logging
+import argparse
+import numpy as np
+import psutil
+from procstat import PROC_ROOT
+from rapl import RaplReader, POWERCAP_ROOT
+
+SYS_CPU_ROOT = '/sys/devices/system/cpu'
+HWMON_ROOT = '/sys/class/hwmon'
+# CPU temperature drivers by preference, with the label of their package sensor
+CPU_SENSORS = {'coretemp': 'Package id 0', 'k10temp': 'Tctl', 'zenpower': 'Tdie', 'cpu_thermal': None}
+TEMPERATURE_INTERVAL = 1.0  # Seconds between two psutil temperature scans where no hwmon file can be kept open
+STAT_READ_BYTES = 1 << 16  # Enough for the cpuN lines at the start of /proc/stat on large machines
+TELEMETRY_COLUMNS = ['system_usage', 'busiest_core_usage', 'cpu_freq', 'max_core_freq', 'temperature']
+
+
+def find_cpu_temperature_file(hwmon_root: str = HWMON_ROOT) -> str:
+    """Returns the temp*_input file of the CPU package sensor, or None."""
+    sensors = {}
+    for directory in glob.glob(os.path.join(hwmon_root, 'hwmon*')):
+        try:
+            with open(os.path.join(directory, 'name')) as f:
+                sensors.setdefault(f.read().strip(), directory)
+        except OSError:
+            continue
+    for driver, label in CPU_SENSORS.items():
+        directory = sensors.get(driver)
+        if directory is None:
+            continue
+        for label_path in sorted(glob.glob(os.path.join(directory, 'temp*_label'))):
+            with open(label_path) as f:
+                if f.read().strip() == label:
+                    return label_path.replace('_label', '_input')
+        if os.path.exists(os.path.join(directory, 'temp1_input')):
+            return os.path.join(directory, 'temp1_input')
+    return None
+
+
+class TelemetrySampler:
+    """Samples per-core utilization and frequency, the CPU temperature and the RAPL energy counters.
+
+    On Linux every source is read with os.pread on descriptors opened once, so a sample costs a
+    few system calls and no directory walks, and it can be taken right after every PMD frame.
+    Sources that are missing (no cpufreq in VMs, no RAPL on ARM, restricted counters) are NaN or
+    left out; elsewhere utilization, frequency and temperature come from psutil.
+    """
+
+    def __init__(self, proc_root: str = PROC_ROOT, sys_cpu_root: str = SYS_CPU_ROOT, hwmon_root: str = HWMON_ROOT,
+                 powercap_root: str = POWERCAP_ROOT):
+        self._stat_fd = None
+        self._freq_fds = []
+        self._temperature_fd = None
+        self._last_ticks = None
+        self._last_temperature_scan = -float('inf')
+        self._temperature = float('nan')
+        self._last_energy = None
+        self._last_time = None
+
+        if os.path.exists(os.path.join(proc_root, 'stat')):
+            self._stat_fd = os.open(os.path.join(proc_root, 'stat'), os.O_RDONLY)
+            self.cores = len(self._read_core_ticks())
+        else:
+            self.cores = psutil.cpu_count()
+            psutil.cpu_percent(interval=None, percpu=True)  # Prime the per-core counters
+
+        for core in range(self.cores):
+            path = os.path.join(sys_cpu_root, f'cpu{core}', 'cpufreq', 'scaling_cur_freq')
+            try:
+                self._freq_fds.append(os.open(path, os.O_RDONLY))
+            except OSError:
+                self._freq_fds.append(None)
+
+        path = find_cpu_temperature_file(hwmon_root)
+        if path is not None:
+            self._temperature_fd = os.open(path, os.O_RDONLY)
+
+        self.rapl = RaplReader(powercap_root)
+        logging.info(f"Telemetry: {self.cores} cores, frequency of {sum(fd is not None for fd in self._freq_fds)}, "
+                     f"temperature from {path or 'psutil'}, RAPL zones: {', '.join(self.rapl.zones) or 'none'}")
+
+    def _read_core_ticks(self) -> np.ndarray:
+        """Returns the (busy, total) jiffies of every core from /proc/stat."""
+        data = os.pread(self._stat_fd, STAT_READ_BYTES, 0)
+        ticks = []
+        for line in data.split(b'\n')[1:]:
+            if not line.startswith(b'cpu'):
+                break
+            fields = [int(v) for v in line.split()[1:9]]  # user .. steal
+            total = sum(fields)
+            ticks.append((total - fields[3] - fields[4], total))  # Idle and iowait are not busy
+        return np.array(ticks, dtype=float)
+
+    def core_usage(self) -> np.ndarray:
+        """Returns the utilization of every core since the previous call, in percent."""
+        if self._stat_fd is None:
+            return np.array(psutil.cpu_percent(interval=None, percpu=True), dtype=float)
+        ticks = self._read_core_ticks()
+        previous, self._last_ticks = self._last_ticks, ticks
+        if previous is None or len(previous) != len(ticks):
+            return np.full(len(ticks), np.nan)
+        busy, total = (ticks - previous).T
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.clip(100 * busy / total, 0.0, 100.0)
+
+    def core_frequency(self) -> np.ndarray:
+        """Returns the current frequency of every core in MHz."""
+        if not any(fd is not None for fd in self._freq_fds):
+            try:
+                frequencies = psutil.cpu_freq(percpu=True)
+            except (NotImplementedError, FileNotFoundError):
+                frequencies = []
+            return np.array([f.current for f in frequencies] or [np.nan] * self.cores, dtype=float)
+        return np.array([int(os.pread(fd, 32, 0)) / 1000 if fd is not None else np.nan for fd in self._freq_fds])
+
+    def temperature(self) -> float:
+        """Returns the CPU package temperature in degrees Celsius, or NaN."""
+        if self._temperature_fd is not None:
+            return int(os.pread(self._temperature_fd, 32, 0)) / 1000
+        # psutil scans every sensor, so its reading is reused for TEMPERATURE_INTERVAL
+        now = time.monotonic()
+        if now - self._last_temperature_scan >= TEMPERATURE_INTERVAL:
+            self._last_temperature_scan = now
+            sensors = getattr(psutil, 'sensors_temperatures', lambda: {})()
+            for driver, label in CPU_SENSORS.items():
+                readings = sensors.get(driver)
+                if readings:
+                    reading = next((r for r in readings if r.label == label), readings[0])
+                    self._temperature = float(reading.current)
+                    break
+        return self._temperature
+
+    def sample(self, timestamp: float = None) -> dict:
+        """Takes one sample of every source; ``timestamp`` is that of the PMD frame it goes with."""
+        timestamp = time.time() if timestamp is None else timestamp
+        usage = self.core_usage()
+        frequency = self.core_frequency()
+        sample = {
+            'timestamp': timestamp,
+            'core_usage': usage,
+            'core_freq': frequency,
+            'system_usage': float(np.nanmean(usage)) if np.isfinite(usage).any() else float('nan'),
+            'busiest_core_usage': float(np.nanmax(usage)) if np.isfinite(usage).any() else float('nan'),
+            'cpu_freq': float(np.nanmean(frequency)) if np.isfinite(frequency).any() else float('nan'),
+            'max_core_freq': float(np.nanmax(frequency)) if np.isfinite(frequency).any() else float('nan'),
+            'temperature': self.temperature(),
+            'rapl_energy': {},
+            'rapl_power': {},
+        }
+        if self.rapl.available:
+            energy = self.rapl.read()
+            sample['rapl_energy'] = energy
+            if self._last_energy is not None and timestamp > self._last_time:
+                dt = timestamp - self._last_time
+                sample['rapl_power'] = {zone: (energy[zone] - self._last_energy[zone]) / dt for zone in energy}
+            self._last_energy, self._last_time = energy, timestamp
+        return sample
+
+    def close(self) -> None:
+        """Closes every open descriptor."""
+        for fd in [self._stat_fd, self._temperature_fd, *self._freq_fds]:
+            if fd is not None:
+                os.close(fd)
+        self._stat_fd = self._temperature_fd = None
+        self._freq_fds = []
+        self.rapl.close()
+
+
+def telemetry_columns(sample: dict) -> dict:
+    """Flattens a telemetry sample into the columns saved next to the PMD readings."""
+    columns = {column: sample[column] for column in TELEMETRY_COLUMNS}
+    for zone, power in sample['rapl_power'].items():
+        columns[f'rapl_{zone}_power'] = power
+    for zone, energy in sample['rapl_energy'].items():
+        columns[f'rapl_{zone}_energy'] = energy  # Joules since the sampler was opened, immune to missed samples
+    return columns
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Print the CPU telemetry of this machine.')
+    parser.add_argument('--interval', type=float, default=1.0, help='Seconds between samples')
+    parser.add_argument('--count', type=int, default=5, help='Samples to print')
+    args = parser.parse_args()
+
+    sampler = TelemetrySampler()
+    sampler.sample()
+    for _ in range(args.count):
+        time.sleep(args.interval)
+        start = time.perf_counter()
+        sample = sampler.sample()
+        cost = (time.perf_counter() - start) * 1e6
+        print(', '.join(f'{k} {v:.1f}' for k, v in telemetry_columns(sample).items()) + f' ({cost:.0f} us)')
+        print('  cores: ' + ' '.join(f'{u:3.0f}%@{f:.0f}' for u, f in zip(sample['core_usage'], sample['core_freq'])))
+    sampler.close()
@@ -0,0 +1,139 @@
+import io
+import os
+import mmap
+import zlib
+import struct
+import logging
+import numpy as np
+import pandas as pd
+
+INDEX_EVERY = 1000  # Index the byte offset of every Nth sample
+SCAN_CHUNK_SIZE = 64 * 1024 * 1024  # Bytes scanned at once when looking for line starts
+
+# Index file layout: INDEX_HEADER (magic, indexed CSV size, CRC32 of the CSV header line, time of
+# the first sample) followed by (elapsed seconds float64, byte offset int64) entries
+INDEX_MAGIC = b'PMDTIDX1'
+INDEX_HEADER = struct.Struct('<8sQQd')
+INDEX_ENTRY = np.dtype([('time', '<f8'), ('offset', '<i8')])
+TIME_COLUMNS = ('elapsed_time', 'bucket_start', 'timestamp')
+
+
+def index_path(csv_path: str) -> str:
+    """Returns the sidecar time index file of a recording."""
+    return f'{csv_path}.tidx'
+
+
+def find_time_column(header: bytes) -> tuple:
+    """Returns the position and name of the time column of a CSV header line."""
+    columns = header.decode().strip().split(',')
+    for name in TIME_COLUMNS:
+        if name in columns:
+            return columns.index(name), name
+    raise KeyError(f"None of the time columns {TIME_COLUMNS} found in the recording")
+
+
+def parse_time(value: bytes, column: str) -> float:
+    """Parses a time field into seconds (elapsed seconds, or POSIX seconds for timestamps)."""
+    if column != 'timestamp':
+        return float(value)
+    return pd.Timestamp(value.decode()).timestamp()
+
+
+def line_starts(data, start: int, end: int) -> np.ndarray:
+    """Returns the offsets of every line starting in data[start:end], scanning in chunks."""
+    starts = []
+    for chunk_start in range(start, end, SCAN_CHUNK_SIZE):
+        chunk_end = min(chunk_start + SCAN_CHUNK_SIZE, end)
+        chunk = np.frombuffer(data, dtype=np.uint8, count=chunk_end - chunk_start, offset=chunk_start)
+        starts.append(np.flatnonzero(chunk == ord('\n')) + chunk_start + 1)
+    starts = np.concatenate(starts) if starts else np.empty(0, dtype=np.int64)
+    return starts[starts < end]
+
+
+def build_time_index(csv_path: str, every: int = INDEX_EVERY) -> np.ndarray:
+    """Builds or extends the sparse time index of a recording and returns its entries.
+
+    An existing index is extended from its last entry when the recording only grew; it is rebuilt
+    when the header changed (e.g. new attribution columns) or the file shrank.
+    """
+    size = os.path.getsize(csv_path)
+    with open(csv_path, 'rb') as f:
+        header = f.readline()
+    header_crc = zlib.crc32(header)
+    position, column = find_time_column(header)
+
+    entries = np.empty(0, dtype=INDEX_ENTRY)
+    first_time = None
+    indexed_size = 0
+    path = index_path(csv_path)
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            magic, indexed_size, crc, first_time = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+            if magic == INDEX_MAGIC and crc == header_crc and indexed_size <= size:
+                entries = np.frombuffer(f.read(), dtype=INDEX_ENTRY).copy()
+            else:
+                indexed_size, first_time = 0, None
+    if indexed_size == size and len(entries):
+        return entries
+
+    with open(csv_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        # Resume from the last indexed sample, or from the first sample on a fresh index
+        scan_from = int(entries['offset'][-1]) if len(entries) else len(header)
+        starts = np.concatenate([[scan_from], line_starts(data, scan_from, size)])
+        starts = starts[starts < size]
+        first = every if len(entries) else 0
+        new_entries = []
+        for offset in starts[first::every].tolist():
+            end = data.find(b'\n', offset)
+            if end < 0:
+                break  # A line still being written is picked up next time
+            field = data[offset:end].split(b',')[position]
+            timestamp = parse_time(field, column)
+            if first_time is None:
+                first_time = timestamp
+            new_entries.append((timestamp - first_time, offset))
+
+    entries = np.concatenate([entries, np.array(new_entries, dtype=INDEX_ENTRY)])
+    with open(path, 'wb') as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, size, header_crc, first_time or 0.0))
+        f.write(entries.tobytes())
+    logging.debug(f"Time index of {csv_path}: {len(entries)} entries")
+    return entries
+
+
+def index_start_time(csv_path: str) -> float:
+    """Returns the time of the first sample of an indexed recording, in the units of its time column."""
+    build_time_index(csv_path)
+    with open(index_path(csv_path), 'rb') as f:
+        return INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))[3]
+
+
+def load_range(csv_path: str, t0: float, t1: float, absolute: bool = False) -> pd.DataFrame:
+    """Loads the samples of a recording between ``t0`` and ``t1`` seconds after its first sample.
+
+    With ``absolute``, ``t0`` and ``t1`` are values of the time column itself (e.g. elapsed_time).
+    Uses the sparse time index to parse only the rows around the window instead of the whole file.
+    """
+    entries = build_time_index(csv_path)
+    first_time = index_start_time(csv_path)
+    if absolute:
+        t0, t1 = t0 - first_time, t1 - first_time
+
+    with open(csv_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        header_end = data.find(b'\n') + 1
+        _, column = find_time_column(data[:header_end])
+        if not len(entries):
+            return pd.read_csv(io.BytesIO(data[:header_end]))
+
+        # Start at the last indexed sample before t0 and stop at the first indexed sample after t1
+        first = max(np.searchsorted(entries['time'], t0, side='right') - 1, 0)
+        last = np.searchsorted(entries['time'], t1, side='right')
+        start = int(entries['offset'][first])
+        end = int(entries['offset'][last]) if last < len(entries) else len(data)
+        window = pd.read_csv(io.BytesIO(data[:header_end] + data[start:end]))
+
+    if column != 'timestamp':
+        elapsed = window[column] - first_time
+    else:
+        elapsed = pd.to_datetime(window[column]).map(pd.Timestamp.timestamp) - first_time
+    return window[(elapsed >= t0) & (elapsed <= t1)].reset_index(drop=True)
@@ -0,0 +1,347 @@
+import os
+import json
+import zlib
+import struct
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+
+BLOCK_SIZE = 8192  # Rows per block; every block is framed, checksummed and decodable on its own
+TIME_DIGITS = 6  # Float time columns are stored as integer microseconds, far below the PMD timing jitter
+TIME_COLUMNS = ('elapsed_time', 'timestamp')  # Columns encoded as timestamps when present
+SCALE_DIGITS = (0, 1, 2, 3, 4)  # Candidate decimal resolutions of quantized readings (0.1 A, 0.01 V)
+MAX_EXCEPTIONS = 0.05  # Share of values not matching the scale that are still stored as integer counts
+COMPRESSION_LEVEL = 6
+ARCHIVE_EXTENSION = '.pmdts'
+
+# Archive layout: MAGIC, uint32 header length, JSON header (columns, dtypes, rows), then blocks of
+# BLOCK_HEADER (rows, payload length, CRC32 of the payload). A block payload holds one chunk per
+# column: CHUNK_HEADER (codec, delta order, integer width, scale, length) then the compressed chunk.
+# Integer chunks decompress to a uint32 exception count, int32 row indices and float64 values of
+# the exceptions (values that are not exact multiples of the scale), the int64 first count, then
+# the coded differences to it.
+MAGIC = b'PMDTS1\n\x00'
+HEADER_LENGTH = struct.Struct('<I')
+BLOCK_HEADER = struct.Struct('<III')
+CHUNK_HEADER = struct.Struct('<BBBdI')
+
+CODEC_INT = 1  # Integer counts (value = count * scale), delta or delta-of-delta coded in the narrowest width
+CODEC_DECIMAL = 4  # Like CODEC_INT with value = count / scale, matching decimals parsed from text exactly
+CODEC_XOR = 2  # float64 bits XORed with the previous value, bytes transposed so equal bytes line up
+CODEC_TEXT = 3  # JSON list of strings
+INT_WIDTHS = (np.int8, np.int16, np.int32, np.int64)
+
+
+def integer_counts(values: np.ndarray, digits=SCALE_DIGITS, max_exceptions: float = MAX_EXCEPTIONS):
+    """Finds the coarsest decimal resolution reproducing ``values`` from integer counts.
+
+    Readings decoded live are count * 0.01 while the same readings parsed back from a CSV are the
+    nearest float to the decimal text, i.e. count / 100; both reconstructions are tried. Returns
+    (codec, counts, scale, exception indices) or None when too many values do not fit.
+    """
+    finite = np.isfinite(values)
+    limit = int(len(values) * max_exceptions)
+    if len(values) - finite.sum() > limit:
+        return None
+    for digit in digits:
+        divisor = float(10 ** digit)
+        counts = np.round(np.where(finite, values, 0.0) * divisor)
+        if np.abs(counts).max(initial=0) >= 2 ** 53:
+            return None
+        for codec, scale, rebuilt in ((CODEC_DECIMAL, divisor, counts / divisor),
+                                      (CODEC_INT, 10.0 ** -digit, counts * 10.0 ** -digit)):
+            exceptions = np.flatnonzero(~((rebuilt == values) & finite))
+            if len(exceptions) <= limit:
+                return codec, counts.astype(np.int64), scale, exceptions
+    return None
+
+
+def delta_encode(counts: np.ndarray, order: int) -> np.ndarray:
+    """Applies ``order`` successive differences, keeping the first value of each."""
+    for _ in range(order):
+        counts = np.diff(counts, prepend=np.int64(0))
+    return counts
+
+
+def delta_decode(deltas: np.ndarray, order: int) -> np.ndarray:
+    """Reverses delta_encode with ``order`` cumulative sums."""
+    counts = deltas.astype(np.int64)
+    for _ in range(order):
+        counts = np.cumsum(counts)
+    return counts
+
+
+def narrowest_width(values: np.ndarray):
+    """Returns the smallest signed integer type holding every value."""
+    low, high = (int(values.min()), int(values.max())) if len(values) else (0, 0)
+    for width in INT_WIDTHS:
+        info = np.iinfo(width)
+        if info.min <= low and high <= info.max:
+            return width
+    return np.int64
+
+
+def encode_int(counts: np.ndarray, scale: float, codec: int = CODEC_INT, exceptions=(), values=None,
+               orders=(0, 1, 2)) -> bytes:
+    """Encodes integer counts with the delta order giving the narrowest values.
+
+    ``exceptions`` are the indices of ``values`` stored as they are because their count does not
+    reproduce them.
+    """
+    base = int(counts[0]) if len(counts) else 0
+    best = None
+    for order in orders:
+        # Relative to the first count, so that epoch timestamps do not force 64-bit values
+        deltas = delta_encode(counts - base, order)
+        width = narrowest_width(deltas)
+        key = (np.dtype(width).itemsize, np.abs(deltas).sum(dtype=np.float64))
+        if best is None or key < best[0]:
+            best = (key, order, width, deltas)
+    _, order, width, deltas = best
+    exceptions = np.asarray(exceptions, dtype='<i4')
+    payload = zlib.compress(b''.join([
+        struct.pack('<I', len(exceptions)),
+        exceptions.tobytes(),
+        np.asarray(values[exceptions] if len(exceptions) else (), dtype='<f8').tobytes(),
+        struct.pack('<q', base),
+        deltas.astype(np.dtype(width).newbyteorder('<')).tobytes(),
+    ]), COMPRESSION_LEVEL)
+    return CHUNK_HEADER.pack(codec, order, np.dtype(width).itemsize, scale, len(payload)) + payload
+
+
+def encode_xor(values: np.ndarray) -> bytes:
+    """Encodes float64 values as XORs with their predecessor, Gorilla-style, byte-transposed for zlib."""
+    bits = np.ascontiguousarray(values, dtype='<f8').view('<u8')
+    xored = bits ^ np.concatenate(([np.uint64(0)], bits[:-1]))
+    shuffled = xored.view(np.uint8).reshape(-1, 8).T.tobytes()
+    payload = zlib.compress(shuffled, COMPRESSION_LEVEL)
+    return CHUNK_HEADER.pack(CODEC_XOR, 0, 8, 1.0, len(payload)) + payload
+
+
+def encode_text(values) -> bytes:
+    """Encodes strings as a compressed JSON list."""
+    payload = zlib.compress(json.dumps([None if pd.isna(v) else str(v) for v in values]).encode(), COMPRESSION_LEVEL)
+    return CHUNK_HEADER.pack(CODEC_TEXT, 0, 0, 1.0, len(payload)) + payload
+
+
+def column_kind(name: str, series: pd.Series) -> str:
+    """Returns how a column is stored: 'datetime', 'time', 'int', 'float' or 'text'."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return 'datetime'
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series):
+        return 'int'
+    if pd.api.types.is_float_dtype(series):
+        return 'time' if name in TIME_COLUMNS else 'float'
+    return 'text'
+
+
+def encode_chunk(kind: str, series: pd.Series, digits=SCALE_DIGITS) -> bytes:
+    """Encodes the rows of one column in a block."""
+    if kind == 'datetime':
+        # Microseconds since the epoch; delta-of-delta makes regular sampling cost about one byte per row
+        return encode_int(series.to_numpy().astype('datetime64[us]').astype(np.int64), 1.0)
+    if kind == 'int':
+        return encode_int(series.to_numpy().astype(np.int64), 1.0)
+    if kind == 'text':
+        return encode_text(series.tolist())
+    values = series.to_numpy(dtype=np.float64)
+    if kind == 'time' and np.isfinite(values).all():
+        divisor = float(10 ** TIME_DIGITS)
+        return encode_int(np.round(values * divisor).astype(np.int64), divisor, CODEC_DECIMAL)
+    found = integer_counts(values, digits)
+    if found is not None:
+        codec, counts, scale, exceptions = found
+        return encode_int(counts, scale, codec, exceptions, values)
+    return encode_xor(values)
+
+
+def decode_chunk(payload: bytes, offset: int, rows: int):
+    """Decodes one column chunk at ``offset``; returns (values, offset of the next chunk)."""
+    codec, order, width, scale, length = CHUNK_HEADER.unpack_from(payload, offset)
+    start = offset + CHUNK_HEADER.size
+    data = zlib.decompress(payload[start:start + length])
+    if codec in (CODEC_INT, CODEC_DECIMAL):
+        count, = struct.unpack_from('<I', data)
+        exceptions = np.frombuffer(data, dtype='<i4', count=count, offset=4)
+        exception_values = np.frombuffer(data, dtype='<f8', count=count, offset=4 + 4 * count)
+        dtype = np.dtype(INT_WIDTHS[[np.dtype(w).itemsize for w in INT_WIDTHS].index(width)]).newbyteorder('<')
+        base, = struct.unpack_from('<q', data, 4 + 12 * count)
+        counts = delta_decode(np.frombuffer(data, dtype=dtype, count=rows, offset=12 + 12 * count), order) + base
+        if scale == 1.0:
+            values = counts
+        else:
+            values = counts / scale if codec == CODEC_DECIMAL else counts * scale
+        if count:
+            values = values.astype(np.float64)
+            values[exceptions] = exception_values
+    elif codec == CODEC_XOR:
+        xored = np.frombuffer(data, dtype=np.uint8).reshape(8, rows).T.copy().view('<u8').ravel()
+        values = np.bitwise_xor.accumulate(xored).view('<f8')
+    elif codec == CODEC_TEXT:
+        values = json.loads(data)
+    else:
+        raise ValueError(f'Unknown codec {codec}')
+    return values, start + length
+
+
+def encode_block(df: pd.DataFrame, kinds: list, digits=SCALE_DIGITS) -> bytes:
+    """Frames the rows of ``df`` as one checksummed block."""
+    payload = b''.join(encode_chunk(kind, df.iloc[:, i], digits) for i, kind in enumerate(kinds))
+    return BLOCK_HEADER.pack(len(df), len(payload), zlib.crc32(payload)) + payload
+
+
+def write_archive(df: pd.DataFrame, path: str, block_size: int = BLOCK_SIZE, float_digits: int = None) -> int:
+    """Writes a measurements table as a compressed archive; returns its size in bytes.
+
+    The archive is lossless except for float time columns, kept to the microsecond. Derived float
+    columns (power, CPU shares) carry full float noise and dominate the size; ``float_digits``
+    rounds them to that many decimals so that they are stored as integer counts too.
+    """
+    kinds = [column_kind(name, df[name]) for name in df.columns]
+    digits = SCALE_DIGITS
+    if float_digits is not None:
+        df = df.copy()
+        for name, kind in zip(df.columns, kinds):
+            if kind == 'float':
+                df[name] = df[name].round(float_digits)
+        digits = tuple(sorted(set(SCALE_DIGITS) | {float_digits}))
+    header = json.dumps({'columns': list(df.columns), 'kinds': kinds, 'dtypes': [str(dtype) for dtype in df.dtypes],
+                         'rows': len(df), 'float_digits': float_digits}).encode()
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC + HEADER_LENGTH.pack(len(header)) + header)
+        for start in range(0, len(df), block_size):
+            f.write(encode_block(df.iloc[start:start + block_size], kinds, digits))
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def read_archive_header(f) -> dict:
+    """Reads the JSON header of an archive opened in binary mode, leaving ``f`` at the first block."""
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f'{f.name} is not a time series archive')
+    length, = HEADER_LENGTH.unpack(f.read(HEADER_LENGTH.size))
+    return json.loads(f.read(length))
+
+
+def iter_blocks(path: str, columns=None):
+    """Yields every block of an archive as a DataFrame, optionally with only some ``columns``."""
+    with open(path, 'rb') as f:
+        header = read_archive_header(f)
+        wanted = set(header['columns'] if columns is None else columns)
+        while True:
+            block_header = f.read(BLOCK_HEADER.size)
+            if len(block_header) < BLOCK_HEADER.size:
+                return
+            rows, length, crc = BLOCK_HEADER.unpack(block_header)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                raise ValueError(f'Corrupted block in {path}')
+            data = {}
+            offset = 0
+            for name, kind, dtype in zip(header['columns'], header['kinds'], header['dtypes']):
+                if name not in wanted:
+                    offset += CHUNK_HEADER.size + CHUNK_HEADER.unpack_from(payload, offset)[-1]
+                    continue
+                values, offset = decode_chunk(payload, offset, rows)
+                if kind == 'datetime':
+                    values = pd.to_datetime(np.asarray(values).astype('datetime64[us]')).astype(dtype)
+                elif kind == 'int':
+                    values = np.asarray(values).astype(dtype)
+                elif kind in ('time', 'float'):
+                    values = np.asarray(values, dtype=np.float64)
+                data[name] = values
+            yield pd.DataFrame(data, columns=[c for c in header['columns'] if c in wanted])
+
+
+def read_archive(path: str, columns=None) -> pd.DataFrame:
+    """Reads a whole archive into a DataFrame."""
+    blocks = list(iter_blocks(path, columns))
+    if not blocks:
+        with open(path, 'rb') as f:
+            return pd.DataFrame(columns=read_archive_header(f)['columns'] if columns is None else columns)
+    return pd.concat(blocks, ignore_index=True)
+
+
+def read_measurements(path: str, columns=None) -> pd.DataFrame:
+    """Reads a measurements CSV or archive."""
+    if path.endswith(ARCHIVE_EXTENSION):
+        return read_archive(path, columns)
+    return pd.read_csv(path, usecols=columns)
+
+
+def iter_measurements(path: str, columns=None, chunk_rows: int = BLOCK_SIZE * 16):
+    """Yields a measurements CSV or archive as consecutive DataFrames, without loading it whole."""
+    if path.endswith(ARCHIVE_EXTENSION):
+        yield from iter_blocks(path, columns)
+        return
+    with pd.read_csv(path, usecols=columns, chunksize=chunk_rows) as reader:
+        yield from reader
+
+
+def read_csv_for_archive(csv_path: str) -> pd.DataFrame:
+    """Reads a measurements CSV, parsing its timestamp column so it is stored as integers."""
+    df = pd.read_csv(csv_path)
+    if 'timestamp' in df.columns and not pd.api.types.is_numeric_dtype(df['timestamp']):
+        try:
+            df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601')
+        except (ValueError, TypeError):
+            pass  # Not a date: kept as text
+    return df
+
+
+def archive_csv(csv_path: str, archive_path: str = None, float_digits: int = None) -> str:
+    """Compresses a measurements CSV next to it; returns the archive path."""
+    archive_path = archive_path or f'{os.path.splitext(csv_path)[0]}{ARCHIVE_EXTENSION}'
+    size = write_archive(read_csv_for_archive(csv_path), archive_path, float_digits=float_digits)
+    logging.info(f"Archived {csv_path} to {archive_path}: {os.path.getsize(csv_path) / max(size, 1):.1f}x smaller")
+    return archive_path
+
+
+def describe_archive(path: str) -> pd.DataFrame:
+    """Returns the codec and compressed size of every column of an archive."""
+    with open(path, 'rb') as f:
+        header = read_archive_header(f)
+        stats = {name: {'codec': set(), 'bytes': 0} for name in header['columns']}
+        while block_header := f.read(BLOCK_HEADER.size):
+            rows, length, _ = BLOCK_HEADER.unpack(block_header)
+            payload = f.read(length)
+            offset = 0
+            for name in header['columns']:
+                codec, order, width, scale, size = CHUNK_HEADER.unpack_from(payload, offset)
+                label = {CODEC_INT: f'int{8 * width} d{order} *{scale:g}', CODEC_DECIMAL: f'int{8 * width} d{order} /{scale:g}',
+                         CODEC_XOR: 'xor', CODEC_TEXT: 'text'}[codec]
+                stats[name]['codec'].add(label)
+                stats[name]['bytes'] += CHUNK_HEADER.size + size
+                offset += CHUNK_HEADER.size + size
+    rows = header['rows']
+    return pd.DataFrame({name: {'Codec': ', '.join(sorted(s['codec'])), 'Bytes': s['bytes'],
+                                'Bytes/row': s['bytes'] / rows if rows else 0.0}
+                         for name, s in stats.items()}).T
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Compress measurement CSVs into time series archives and back.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compress_parser = subparsers.add_parser('compress', help='Archive measurement CSVs')
+    compress_parser.add_argument('csv', nargs='+', help='Measurement CSVs')
+    compress_parser.add_argument('--digits', type=int, help='Round derived float columns to this many decimals (lossy)')
+    decompress_parser = subparsers.add_parser('decompress', help='Write an archive back to CSV')
+    decompress_parser.add_argument('archive', help='Archive to read')
+    decompress_parser.add_argument('--output', help='CSV to write (default: next to the archive)')
+    info_parser = subparsers.add_parser('info', help='Show the codec and size of every column')
+    info_parser.add_argument('archive', help='Archive to describe')
+    args = parser.parse_args()
+
+    if args.command == 'compress':
+        for csv_path in args.csv:
+            archive_csv(csv_path, float_digits=args.digits)
+    elif args.command == 'decompress':
+        output = args.output or f'{os.path.splitext(args.archive)[0]}.csv'
+        read_archive(args.archive).to_csv(output, index=False)
+        logging.info(f"Decompressed {args.archive} to {output}")
+    else:
+        print(describe_archive(args.archive).to_string())